@@ -0,0 +1,258 @@
+import argparse
+import contextlib
+import csv
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# In-process benchmarks of the signing core: no server, no HTTP. Imports final.py from the
+# repository root (certificate, font and settings as the server would load them) and times
+# its signing functions directly on synthetic PDFs from pdf_factory.py.
+#
+#   python Testing/Benchmark/benchmark.py                    # run all suites, compare with the baseline (required)
+#   python Testing/Benchmark/benchmark.py --suite single --pages 1,10,100
+#   python Testing/Benchmark/benchmark.py --update-baseline  # record this machine's numbers as the baseline
+#
+# Results use the columns of multi_sign_results.csv (filename, pages, time_taken_sec, success)
+# plus the benchmark name and the number of signatures; time_taken_sec is the median of --repeat runs.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(os.path.dirname(HERE))
+RESULT_CSV = os.path.join(HERE, "benchmark_results.csv")
+BASELINE_CSV = os.path.join(HERE, "baseline.csv")
+FIELDNAMES = ["filename", "pages", "time_taken_sec", "success", "benchmark", "signatures"]
+
+SUITES = ["single", "multi_location", "workflow", "anchor"]
+DEFAULT_PAGES = [1, 10, 100, 1000]
+# per_location rewrites the file once per location, so it is only run up to this size by default
+PER_LOCATION_MAX_PAGES = 100
+# (scenario, signers, signatures per signer) as in Testing/Workflow_Scaling/workflow_scaling_test.py
+WORKFLOW_SCENARIOS = [("A", 2, 1), ("B", 5, 2), ("C", 10, 3)]
+WORKFLOW_PAGES = 10
+ANCHORS = 3
+
+sys.path.insert(0, HERE)
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT)
+
+from pdf_factory import make_pdf  # noqa: E402
+
+import final  # noqa: E402
+import text_locator  # noqa: E402
+from anchor_index import anchor_keyword  # noqa: E402
+
+
+def timed(fn, repeat):
+    """Runs fn() once to warm up, then `repeat` times; returns (median seconds, all succeeded)."""
+    times, ok = [], True
+    for run in range(repeat + 1):
+        started = time.perf_counter()
+        try:
+            ok = bool(fn()) and ok
+        except Exception as e:
+            print(f"  failed: {e}")
+            ok = False
+        if run:
+            times.append(time.perf_counter() - started)
+    return statistics.median(times), ok
+
+
+def result(benchmark, filename, pages, signatures, seconds, ok):
+    print(f"{benchmark:<32} {filename:<24} {pages:>5} pages {signatures:>5} sigs  {seconds:8.3f}s  {'ok' if ok else 'FAILED'}")
+    return {
+        "filename": filename,
+        "pages": pages,
+        "time_taken_sec": round(seconds, 3),
+        "success": ok,
+        "benchmark": benchmark,
+        "signatures": signatures,
+    }
+
+
+def bench_single(corpus, pages_list, repeat):
+    # process_signing: the /sign/file and /sign/batch core, one signature
+    rows = []
+    for pages in pages_list:
+        filename = f"synthetic_{pages}p.pdf"
+        with open(corpus[pages], "rb") as f:
+            pdf_bytes = f.read()
+
+        def run():
+            out = final.process_signing(pdf_bytes, filename, "bench", "bench", "bench", False)
+            os.remove(out["signed_file_path"])
+            return True
+
+        rows.append(result("single_sign", filename, pages, 1, *timed(run, repeat)))
+    return rows
+
+
+def sign_locations(input_path, output_path, signer_index, placements, mode):
+    # sign_signer_locations prints a line per signature; keep the report readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        final.sign_signer_locations(
+            input_path, output_path, f"signer{signer_index}@example.com", f"Signer {signer_index}",
+            signer_index, placements, mode
+        )
+    return os.path.exists(output_path)
+
+
+def bench_multi_location(corpus, workdir, pages_list, repeat, per_location_max):
+    # One signer, one location per page (like Testing/Load_testing/load_testing.py), both signing modes
+    rows = []
+    for mode in ("single_revision", "per_location"):
+        for pages in pages_list:
+            if mode == "per_location" and pages > per_location_max:
+                continue
+            placements = [(page, 100, 200) for page in range(pages)]
+            output_path = os.path.join(workdir, f"multi_{mode}_{pages}.pdf")
+            seconds, ok = timed(lambda: sign_locations(corpus[pages], output_path, 0, placements, mode), repeat)
+            rows.append(result(f"multi_location_{mode}", f"synthetic_{pages}p.pdf", pages, pages, seconds, ok))
+    return rows
+
+
+def bench_workflow(corpus, workdir, repeat):
+    # Every signer signs in turn on the previous signer's output, as /multi-sign/sign does
+    rows = []
+    for mode in ("per_location", "single_revision"):
+        for label, signers, sigs_per_signer in WORKFLOW_SCENARIOS:
+            def run():
+                current = corpus[WORKFLOW_PAGES]
+                for i in range(signers):
+                    placements = [(j % 5, 100 + j * 10, 200 + j * 10) for j in range(sigs_per_signer)]
+                    output_path = os.path.join(workdir, f"workflow_{label}_{i}.pdf")
+                    if not sign_locations(current, output_path, i, placements, mode):
+                        return False
+                    current = output_path
+                return True
+
+            seconds, ok = timed(run, repeat)
+            rows.append(result(f"workflow_{mode}", f"scenario_{label}_{signers}x{sigs_per_signer}",
+                               WORKFLOW_PAGES, signers * sigs_per_signer, seconds, ok))
+    return rows
+
+
+def bench_anchor(anchor_corpus, pages_list, repeat):
+    # Text scan for all signers' anchors, without the per-document result cache
+    rows = []
+    keywords = [anchor_keyword(i) for i in range(ANCHORS)]
+    for pages in pages_list:
+        path = anchor_corpus[pages]
+
+        def run():
+            text_locator._cache.clear()
+            found = text_locator.find_anchor_positions(path, keywords)
+            return all(found[k] is not None for k in keywords)
+
+        filename = f"synthetic_{pages}p_anchors.pdf"
+        rows.append(result("anchor_search", filename, pages, ANCHORS, *timed(run, repeat)))
+    return rows
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def compare(rows, baseline_path, threshold, min_delta, allow_new=False):
+    """
+    Prints rows slower than the baseline by more than threshold (and min_delta seconds); returns them.
+    A case the baseline doesn't have is a regression too, unless allow_new.
+    """
+    with open(baseline_path, newline="") as f:
+        baseline = {(r["benchmark"], r["filename"]): float(r["time_taken_sec"]) for r in csv.DictReader(f)}
+
+    regressions = []
+    print(f"\nCompared with {baseline_path} (threshold +{threshold:.0%}):")
+    for row in rows:
+        after = row["time_taken_sec"]
+        before = baseline.get((row["benchmark"], row["filename"]))
+        if before is None:
+            # a new or renamed case must not slip past the gate unnoticed
+            flag = "new, allowed" if allow_new else "NOT IN BASELINE"
+            print(f"  {row['benchmark']:<32} {row['filename']:<24} {'-':>9} -> {after:8.3f}s  {'':7}  {flag}")
+            if not allow_new or not row["success"]:
+                regressions.append(row)
+            continue
+        change = (after - before) / before if before else 0.0
+        regressed = not row["success"] or (change > threshold and after - before > min_delta)
+        flag = "REGRESSION" if regressed else ("faster" if change < -threshold else "")
+        print(f"  {row['benchmark']:<32} {row['filename']:<24} {before:8.3f}s -> {after:8.3f}s  {change:+7.1%}  {flag}")
+        if regressed:
+            regressions.append(row)
+
+    # informational only: --suite/--pages may run a subset of the baseline on purpose
+    ran = {(row["benchmark"], row["filename"]) for row in rows}
+    for benchmark, filename in sorted(set(baseline) - ran):
+        print(f"  {benchmark:<32} {filename:<24} in baseline, not run")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process benchmarks of the signing core")
+    parser.add_argument("--suite", default="all", help=f"comma-separated: {', '.join(SUITES)} (default: all)")
+    parser.add_argument("--pages", default=",".join(map(str, DEFAULT_PAGES)), help="page counts of the synthetic PDFs")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case (median reported)")
+    parser.add_argument("--per-location-max", type=int, default=PER_LOCATION_MAX_PAGES,
+                        help="largest document signed in per_location mode")
+    parser.add_argument("--out", default=RESULT_CSV)
+    parser.add_argument("--baseline", default=BASELINE_CSV)
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative slowdown flagged as a regression")
+    parser.add_argument("--min-delta", type=float, default=0.05, help="ignore slowdowns smaller than this (seconds)")
+    parser.add_argument("--update-baseline", action="store_true", help="write the results to --baseline as well")
+    parser.add_argument("--allow-new", action="store_true", help="don't fail on cases the baseline doesn't have")
+    args = parser.parse_args()
+
+    suites = SUITES if args.suite == "all" else [s.strip() for s in args.suite.split(",")]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suite(s): {', '.join(sorted(unknown))}")
+    pages_list = [int(p) for p in args.pages.split(",")]
+    # timings are machine-specific, so no baseline is committed; without one the gate can't pass
+    if not args.update_baseline and not os.path.exists(args.baseline):
+        parser.error(f"no baseline at {args.baseline}; record one on this machine with --update-baseline")
+
+    workdir = tempfile.mkdtemp(prefix="signing_bench_")
+    try:
+        print(f"Generating synthetic PDFs in {workdir} ...")
+        needed = set(pages_list) | ({WORKFLOW_PAGES} if "workflow" in suites else set())
+        corpus = {p: make_pdf(os.path.join(workdir, f"synthetic_{p}p.pdf"), p) for p in sorted(needed)}
+        anchor_corpus = {}
+        if "anchor" in suites:
+            anchor_corpus = {
+                p: make_pdf(os.path.join(workdir, f"synthetic_{p}p_anchors.pdf"), p, anchors=ANCHORS) for p in pages_list
+            }
+
+        rows = []
+        if "single" in suites:
+            rows += bench_single(corpus, pages_list, args.repeat)
+        if "multi_location" in suites:
+            rows += bench_multi_location(corpus, workdir, pages_list, args.repeat, args.per_location_max)
+        if "workflow" in suites:
+            rows += bench_workflow(corpus, workdir, args.repeat)
+        if "anchor" in suites:
+            rows += bench_anchor(anchor_corpus, pages_list, args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    write_csv(args.out, rows)
+    print(f"\nResults saved to {args.out}")
+
+    if args.update_baseline:
+        write_csv(args.baseline, rows)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    regressions = compare(rows, args.baseline, args.threshold, args.min_delta, args.allow_new)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+import random
+
+import fitz
+
+# Deterministic synthetic PDFs for the benchmark suite: same arguments, same bytes.
+# Each page carries a few paragraphs of seeded filler text; with anchors=N the
+# "Authorised Signature 1..N" keywords are spread over the document, one per page,
+# ending on the last page.
+
+WORDS = (
+    "agreement party shall clause payment invoice term notice schedule obligation "
+    "department approval document signature period effective date service amount "
+    "liability confidential record annex delivery review policy compliance"
+).split()
+
+PAGE_SIZE = (612, 792)  # US Letter, points
+
+
+def anchor_pages(pages, anchors):
+    """0-based page of each anchor: evenly spread, the last one on the last page."""
+    return [max(((i + 1) * pages) // anchors - 1, 0) for i in range(anchors)]
+
+
+def make_pdf(path, pages, anchors=0, seed=0, paragraphs=4):
+    rng = random.Random(f"{seed}:{pages}:{anchors}")
+    anchor_at = {}
+    for i, page in enumerate(anchor_pages(pages, anchors) if anchors else []):
+        anchor_at.setdefault(page, []).append(i + 1)
+
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page(width=PAGE_SIZE[0], height=PAGE_SIZE[1])
+        page.insert_text((72, 60), f"Synthetic document - page {page_num + 1} of {pages}", fontsize=12)
+
+        y = 90
+        for _ in range(paragraphs):
+            text = " ".join(rng.choice(WORDS) for _ in range(90)).capitalize() + "."
+            rect = fitz.Rect(72, y, PAGE_SIZE[0] - 72, y + 130)
+            page.insert_textbox(rect, text, fontsize=10)
+            y += 140
+
+        for n, number in enumerate(anchor_at.get(page_num, [])):
+            page.insert_text((72 + 180 * (n % 3), 680 + 20 * (n // 3)), f"Authorised Signature {number}", fontsize=10)
+
+    doc.set_metadata({"title": f"synthetic {pages}p", "producer": "pdf_factory", "creator": "pdf_factory"})
+    # no_new_id and fixed metadata keep the output byte-identical between runs
+    doc.save(path, garbage=3, deflate=True, no_new_id=True)
+    doc.close()
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic PDF")
+    parser.add_argument("path")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--anchors", type=int, default=0, help='number of "Authorised Signature N" anchors')
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    make_pdf(args.path, args.pages, args.anchors, args.seed)
+    print(f"Wrote {args.path}: {args.pages} pages, {args.anchors} anchors")
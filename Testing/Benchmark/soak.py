@@ -0,0 +1,313 @@
+import argparse
+import csv
+import gc
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import fitz
+
+# Soak test of the signing core: thousands of mixed single and multi-sign operations in one
+# process (no server), including ones that fail half-way, while sampling memory, open file
+# descriptors, leftover temp files and the upload store. Fails (exit 1) when any of them
+# trends upward after the warm-up, or when files are left behind at the end.
+#
+#   python Testing/Benchmark/soak.py                                  # 2000 operations on the 1p-100p test PDFs
+#   python Testing/Benchmark/soak.py --pages 1,10,100,500,1000 --iterations 5000
+#   python Testing/Benchmark/soak.py --no-tracemalloc                 # RSS only, at full speed
+#
+# Input PDFs are Testing/Load_testing/test_<N>p.pdf; missing sizes are generated with pdf_factory.py.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(os.path.dirname(HERE))
+PDF_DIR = os.path.join(REPO_ROOT, "Testing", "Load_testing")
+RESULT_CSV = os.path.join(HERE, "soak_results.csv")
+FIELDNAMES = [
+    "iteration", "elapsed_sec", "rss_mb", "peak_rss_mb", "traced_mb", "traced_peak_mb",
+    "open_fds", "temp_files", "upload_files", "upload_mb",
+]
+
+# (operation, weight); the *_invalid ones are expected to raise and must clean up after themselves
+OPERATIONS = [
+    ("single", 4),
+    ("multi_per_location", 2),
+    ("multi_single_revision", 2),
+    ("single_invalid", 1),
+    ("multi_invalid", 1),
+]
+MAX_LOCATIONS = 5
+
+# growth allowed over the measured part of the run (least-squares fit of the samples)
+DEFAULT_LIMITS = {
+    "rss_mb": 32.0,
+    "traced_mb": 8.0,
+    "open_fds": 2.0,
+    "temp_files": 0.5,
+    "upload_files": 0.5,
+    "upload_mb": 1.0,
+}
+
+sys.path.insert(0, HERE)
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT)
+
+from pdf_factory import make_pdf  # noqa: E402
+
+from benchmark import sign_locations  # noqa: E402
+import final  # noqa: E402
+
+
+def rss_mb():
+    """(current, peak) resident set size in MB, or (None, None) where it can't be read."""
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024
+    except (OSError, KeyError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None, None
+    info = psutil.Process().memory_info()
+    return info.rss / 2**20, getattr(info, "peak_wset", info.rss) / 2**20
+
+
+def open_fds():
+    for fd_dir in ("/proc/self/fd", "/dev/fd"):
+        if os.path.isdir(fd_dir):
+            return len(os.listdir(fd_dir))
+    try:
+        import psutil
+    except ImportError:
+        return None
+    process = psutil.Process()
+    return process.num_handles() if hasattr(process, "num_handles") else process.num_fds()
+
+
+def dir_usage(path, exclude=()):
+    """(files, MB) under path, not counting the paths in exclude."""
+    files, size = 0, 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            full = os.path.join(root, name)
+            if full in exclude:
+                continue
+            try:
+                size += os.path.getsize(full)
+            except OSError:
+                continue
+            files += 1
+    return files, size / 2**20
+
+
+def growth(samples, key):
+    """Increase of samples[key] over the run, from a least-squares line through (iteration, value)."""
+    points = [(s["iteration"], s[key]) for s in samples if s[key] is not None]
+    if len(points) < 2:
+        return 0.0
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if not var_x:
+        return 0.0
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+    return slope * (points[-1][0] - points[0][0])
+
+
+class Soak:
+    def __init__(self, workdir, pages, seed):
+        self.workdir = workdir
+        self.input_dir = os.path.join(workdir, "inputs")
+        self.tmp_dir = os.path.join(workdir, "tmp")
+        os.makedirs(self.input_dir)
+        os.makedirs(self.tmp_dir)
+        self.rng = random.Random(seed)
+        self.pages = pages
+        self.inputs = {}
+        for p in pages:
+            path = os.path.join(self.input_dir, f"test_{p}p.pdf")
+            source = os.path.join(PDF_DIR, f"test_{p}p.pdf")
+            if os.path.exists(source):
+                shutil.copyfile(source, path)
+            else:
+                make_pdf(path, p)
+            self.inputs[p] = path
+        self.pdf_bytes = {}
+        for p, path in self.inputs.items():
+            with open(path, "rb") as f:
+                self.pdf_bytes[p] = f.read()
+        self.page_counts = {}
+        for p, path in self.inputs.items():
+            with fitz.open(path) as doc:
+                self.page_counts[p] = doc.page_count
+        self.upload_baseline = dir_usage(final.UPLOAD_DIR)
+        self.counter = 0
+
+    def temp_files(self):
+        # library temp files (TMPDIR points at tmp_dir) and anything next to the inputs besides the inputs
+        return dir_usage(self.workdir, exclude=set(self.inputs.values()))[0]
+
+    def placements(self, pages, invalid=False):
+        count = self.rng.randint(1, MAX_LOCATIONS)
+        placements = [(self.rng.randrange(self.page_counts[pages]), 100, 200 + 60 * i) for i in range(count)]
+        if invalid:
+            # a page past the end: fails after the earlier locations were signed (per_location)
+            placements.append((self.page_counts[pages] + 5, 100, 200))
+        return placements
+
+    def run(self, operation):
+        """Runs one operation; returns True when it behaved as expected."""
+        pages = self.rng.choice(self.pages)
+        self.counter += 1
+
+        if operation in ("single", "single_invalid"):
+            data = self.pdf_bytes[pages]
+            if operation == "single_invalid":
+                data = data[: len(data) // 2]  # keeps the %PDF header, loses the xref
+            try:
+                out = final.process_signing(data, f"soak_{pages}p.pdf", "soak", "soak", "soak", False)
+            except Exception:
+                return operation == "single_invalid"
+            os.remove(out["signed_file_path"])
+            return operation == "single"
+
+        mode = "single_revision" if operation == "multi_single_revision" else "per_location"
+        if operation == "multi_invalid":
+            mode = self.rng.choice(["per_location", "single_revision"])
+        input_path = self.inputs[pages]
+        output_path = f"{os.path.splitext(input_path)[0]}_signed_{self.counter}.pdf"
+        try:
+            sign_locations(input_path, output_path, self.counter % 10, self.placements(pages, operation == "multi_invalid"), mode)
+        except Exception:
+            return operation == "multi_invalid"
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return operation != "multi_invalid"
+
+    def sample(self, iteration, started):
+        gc.collect()
+        rss, peak_rss = rss_mb()
+        traced, traced_peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+        upload_files, upload_mb = dir_usage(final.UPLOAD_DIR)
+        return {
+            "iteration": iteration,
+            "elapsed_sec": round(time.perf_counter() - started, 1),
+            "rss_mb": None if rss is None else round(rss, 1),
+            "peak_rss_mb": None if peak_rss is None else round(peak_rss, 1),
+            "traced_mb": None if traced is None else round(traced / 2**20, 2),
+            "traced_peak_mb": None if traced_peak is None else round(traced_peak / 2**20, 2),
+            "open_fds": open_fds(),
+            "temp_files": self.temp_files(),
+            "upload_files": upload_files - self.upload_baseline[0],
+            "upload_mb": round(upload_mb - self.upload_baseline[1], 2),
+        }
+
+
+def print_sample(s):
+    def fmt(value, unit=""):
+        return "-" if value is None else f"{value}{unit}"
+    print(
+        f"{s['iteration']:>7} {s['elapsed_sec']:>8}s  rss {fmt(s['rss_mb'], 'MB'):>9} (peak {fmt(s['peak_rss_mb'], 'MB')})"
+        f"  traced {fmt(s['traced_mb'], 'MB'):>8}  fds {fmt(s['open_fds']):>4}  temp {s['temp_files']:>3}"
+        f"  uploads {s['upload_files']:+d} files {s['upload_mb']:+.2f}MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory and resource soak test of the signing core")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=100, help="operations before the first measured sample (caches fill up)")
+    parser.add_argument("--sample-every", type=int, default=50)
+    parser.add_argument("--pages", default="1,10,100", help="test PDF sizes (Testing/Load_testing/test_<N>p.pdf)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-tracemalloc", action="store_true", help="don't trace Python allocations (faster)")
+    parser.add_argument("--out", default=RESULT_CSV)
+    for key, limit in DEFAULT_LIMITS.items():
+        parser.add_argument(f"--max-{key.replace('_', '-')}-growth", type=float, default=limit, dest=f"max_{key}")
+    args = parser.parse_args()
+
+    pages = [int(p) for p in args.pages.split(",")]
+    names = [name for name, _ in OPERATIONS]
+    weights = [weight for _, weight in OPERATIONS]
+
+    workdir = tempfile.mkdtemp(prefix="signing_soak_")
+    soak = Soak(workdir, pages, args.seed)
+    # temp files made by pyHanko and friends land where they can be counted
+    os.environ["TMPDIR"] = tempfile.tempdir = soak.tmp_dir
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+
+    counts = {name: [0, 0] for name in names}  # operation -> [runs, unexpected outcomes]
+    samples = []
+    first_snapshot = None
+    started = time.perf_counter()
+    print(f"Soak: {args.iterations} operations on {', '.join(f'{p}p' for p in pages)} PDFs, working in {workdir}")
+    try:
+        for i in range(1, args.iterations + 1):
+            operation = soak.rng.choices(names, weights)[0]
+            counts[operation][0] += 1
+            if not soak.run(operation):
+                counts[operation][1] += 1
+                print(f"  unexpected outcome of {operation} at iteration {i}")
+
+            if i == args.warmup or (i > args.warmup and (i - args.warmup) % args.sample_every == 0) or i == args.iterations:
+                samples.append(soak.sample(i, started))
+                print_sample(samples[-1])
+                if i == args.warmup and tracemalloc.is_tracing():
+                    first_snapshot = tracemalloc.take_snapshot()
+
+        last_snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        leftover_temp = soak.temp_files()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.out, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(samples)
+    print(f"\nSamples saved to {args.out}")
+
+    failures = []
+    print("\nOperations:")
+    for name, (runs, unexpected) in counts.items():
+        print(f"  {name:<24} {runs:>6} runs  {unexpected} unexpected")
+        if unexpected:
+            failures.append(f"{name}: {unexpected} unexpected outcome(s)")
+
+    measured = [s for s in samples if s["iteration"] >= args.warmup]
+    print(f"\nGrowth after warm-up ({measured[0]['iteration'] if measured else '-'} -> {samples[-1]['iteration']}):")
+    for key in DEFAULT_LIMITS:
+        limit = getattr(args, f"max_{key}")
+        value = growth(measured, key)
+        regressed = value > limit
+        print(f"  {key:<14} {value:+9.2f}  (limit {limit:+.2f})  {'UPWARD TREND' if regressed else ''}")
+        if regressed:
+            failures.append(f"{key} grew by {value:.2f}")
+
+    if leftover_temp:
+        failures.append(f"{leftover_temp} temp file(s) left behind")
+    if samples[-1]["upload_files"] > 0:
+        failures.append(f"{samples[-1]['upload_files']} file(s) left in {final.UPLOAD_DIR}/")
+
+    if first_snapshot is not None and last_snapshot is not None:
+        print("\nLargest Python allocation growth since the warm-up:")
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        top = last_snapshot.filter_traces(filters).compare_to(first_snapshot.filter_traces(filters), "lineno")[:10]
+        for stat in top:
+            print(f"  {stat}")
+
+    if failures:
+        print(f"\nFAILED: {'; '.join(failures)}")
+        return 1
+    print("\nNo resource growth detected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
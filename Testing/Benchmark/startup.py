@@ -0,0 +1,154 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+import requests
+
+# Startup cost of the signing server: how long `import final` takes, how long until the port
+# answers and /ready turns 200, and how slow the first /sign/file and multi-sign requests are
+# compared with the ones after. Runs the server (uvicorn, from the repository root) once with
+# the startup warm-up and once without it (WARMUP_ON_STARTUP=0).
+#
+#   python Testing/Benchmark/startup.py [--pdf Testing/Load_testing/test_10p.pdf] [--requests 5]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(os.path.dirname(HERE))
+RESULT_CSV = os.path.join(HERE, "startup_results.csv")
+APIKEY = "FAKECLIENTKEY1234567890ABCDEF12345678"
+FIELDNAMES = [
+    "mode", "import_sec", "listening_sec", "ready_sec",
+    "first_sign_file_sec", "steady_sign_file_sec", "first_multi_sign_sec", "steady_multi_sign_sec",
+]
+
+
+def import_seconds(repeat):
+    code = "import time; t = time.perf_counter(); import final; print(time.perf_counter() - t)"
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(times)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, started, timeout=120, status=200):
+    """Seconds from `started` until url answers with `status`."""
+    while time.perf_counter() - started < timeout:
+        try:
+            if requests.get(url, timeout=2).status_code == status:
+                return time.perf_counter() - started
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.02)
+    raise TimeoutError(f"{url} did not answer {status} within {timeout}s")
+
+
+def sign_file(base, pdf_bytes, name):
+    started = time.perf_counter()
+    r = requests.post(
+        f"{base}/sign/file",
+        files={"myfile": (name, pdf_bytes, "application/pdf")},
+        data={"department": "startup", "document_type": "startup", "request_id": uuid.uuid4().hex},
+    )
+    r.raise_for_status()
+    return time.perf_counter() - started
+
+
+def multi_sign(base, pdf_bytes, name):
+    # upload a one-signer session and sign it
+    uuid_str = uuid.uuid4().hex
+    signer_list = [{"signer_workid": "EMP001", "signer_name": "Startup", "signer_email": "startup@example.com",
+                    "locations": [{"page": 1, "x": 100, "y": 200}]}]
+    started = time.perf_counter()
+    r = requests.post(
+        f"{base}/multi-sign/upload",
+        files={"myfile": (name, pdf_bytes, "application/pdf")},
+        data={
+            "uuid": uuid_str,
+            "cs": hashlib.sha256((APIKEY + uuid_str).encode("utf-8")).hexdigest(),
+            "initiator_workid": "HR001", "initiator_work_dept": "IT", "workflow_id": "startup",
+            "signerlist": json.dumps(signer_list),
+        },
+    )
+    r.raise_for_status()
+    requests.get(f"{base}/multi-sign/sign/{uuid_str}/startup@example.com").raise_for_status()
+    return time.perf_counter() - started
+
+
+def measure(mode, warmup, pdf_path, repeat, import_sec):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, WARMUP_ON_STARTUP="1" if warmup else "0")
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+    name = os.path.basename(pdf_path)
+
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "final:app", "--port", str(port)],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        listening = wait_for(f"{base}/", started)
+        ready = wait_for(f"{base}/ready", started)
+        sign_file_times = [sign_file(base, pdf_bytes, name) for _ in range(repeat + 1)]
+        multi_sign_times = [multi_sign(base, pdf_bytes, name) for _ in range(repeat + 1)]
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    row = {
+        "mode": mode,
+        "import_sec": round(import_sec, 3),
+        "listening_sec": round(listening, 3),
+        "ready_sec": round(ready, 3),
+        "first_sign_file_sec": round(sign_file_times[0], 3),
+        "steady_sign_file_sec": round(statistics.median(sign_file_times[1:]), 3),
+        "first_multi_sign_sec": round(multi_sign_times[0], 3),
+        "steady_multi_sign_sec": round(statistics.median(multi_sign_times[1:]), 3),
+    }
+    print(
+        f"{mode:<10} listening {row['listening_sec']:6.2f}s  ready {row['ready_sec']:6.2f}s  "
+        f"/sign/file first {row['first_sign_file_sec']:6.3f}s steady {row['steady_sign_file_sec']:6.3f}s  "
+        f"multi-sign first {row['first_multi_sign_sec']:6.3f}s steady {row['steady_multi_sign_sec']:6.3f}s"
+    )
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and first-request latency of the signing server")
+    parser.add_argument("--pdf", default=os.path.join(REPO_ROOT, "Testing", "Load_testing", "test_10p.pdf"))
+    parser.add_argument("--requests", type=int, default=5, help="requests after the first (median reported)")
+    parser.add_argument("--import-repeat", type=int, default=5)
+    parser.add_argument("--out", default=RESULT_CSV)
+    args = parser.parse_args()
+
+    import_sec = import_seconds(args.import_repeat)
+    print(f"import final: {import_sec:.3f}s (median of {args.import_repeat})")
+    rows = [
+        measure("warm", True, args.pdf, args.requests, import_sec),
+        measure("cold", False, args.pdf, args.requests, import_sec),
+    ]
+
+    with open(args.out, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Results saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,310 @@
-from locust import HttpUser, task, between
+import csv
+import hashlib
+import json
+import os
 import random
+import time
+import uuid
+from collections import deque
 
-UUID = "9f2a3c4d5e6f7b8c9d0e1f2a3b4c5d6e"
-SIGNER_EMAIL = "bob@example.com"  # Replace @ with %40 if needed
+from locust import HttpUser, between, constant, events, task
+from locust.stats import StatsEntry
 
-class SigningUser(HttpUser):
-    wait_time = between(1, 2)  # simulate real user pacing
+# Mixed-workload load test. Every user makes its own data, so nothing is measured against
+# an already completed session:
+#   workflow   - creates a session through /multi-sign/upload, signs it signer by signer, downloads the result
+#   sign_file  - POST /sign/file, then downloads the signed file now and then
+#   download   - downloads files signed earlier by the other users
+#   large_job  - a long multi-sign job (/jobs/multi-sign/sign on a big PDF), polled until done
+#   loop_probe - GET / every --probe-interval seconds: event-loop responsiveness, split by
+#                whether a large job is running
+#
+#   locust -f Testing/locustfile.py --host http://localhost:8000 --headless -u 20 -r 2 -t 10m \
+#       --pdf-sizes 1,10,100 --workflow-weight 3 --sign-file-weight 2 --download-weight 2 --large-jobs 1
+#
+# Request names start with the scenario ("workflow: /multi-sign/sign [10p]"); the whole of a
+# workflow or large job is reported as a FLOW request. When the test stops, percentiles per
+# scenario and per request are written to --scenario-csv.
+
+APIKEY = "FAKECLIENTKEY1234567890ABCDEF12345678"
+SCENARIOS = ["workflow", "sign_file", "download", "large_job", "loop_probe"]
+PERCENTILES = [0.5, 0.9, 0.95, 0.99]
+
+# signed files the download users fetch (filled by the other scenarios)
+download_urls = deque(maxlen=500)
+large_jobs_running = 0
+_pdf_cache = {}
+
+
+@events.init_command_line_parser.add_listener
+def add_arguments(parser):
+    group = parser.add_argument_group("Mixed workload")
+    group.add_argument("--pdf-dir", default="Testing/Load_testing", help="folder with test_<N>p.pdf files")
+    group.add_argument("--pdf-sizes", default="1,10,100", help="page counts of the PDFs used (picked at random)")
+    group.add_argument("--signers", type=int, default=2, help="signers per workflow session")
+    group.add_argument("--signing-mode", default="per_location", choices=["per_location", "single_revision"])
+    group.add_argument("--workflow-weight", type=int, default=3)
+    group.add_argument("--sign-file-weight", type=int, default=2)
+    group.add_argument("--download-weight", type=int, default=2)
+    group.add_argument("--large-jobs", type=int, default=1, help="users running large jobs back to back (0 = none)")
+    group.add_argument("--large-job-pages", type=int, default=500)
+    group.add_argument("--large-job-locations", type=int, default=50, help="signatures per large job (one per page)")
+    group.add_argument("--probe-interval", type=float, default=0.5, help="seconds between GET / probes (0 = no probe)")
+    group.add_argument("--scenario-csv", default="locust_scenarios.csv", help="percentiles per scenario, written at the end")
+
+
+@events.init.add_listener
+def configure_users(environment, **kwargs):
+    options = environment.parsed_options
+    if options is None:
+        return
+    WorkflowUser.weight = options.workflow_weight
+    SignFileUser.weight = options.sign_file_weight
+    DownloadUser.weight = options.download_weight
+    LargeJobUser.fixed_count = options.large_jobs
+    LoopProbeUser.wait_time = constant(options.probe_interval)
+
+    disabled = {
+        WorkflowUser: not options.workflow_weight,
+        SignFileUser: not options.sign_file_weight,
+        DownloadUser: not options.download_weight,
+        LargeJobUser: not options.large_jobs,
+        LoopProbeUser: not options.probe_interval,
+    }
+    environment.user_classes[:] = [cls for cls in environment.user_classes if not disabled.get(cls)]
+
+
+def generate_cs(uuid_str):
+    return hashlib.sha256((APIKEY + uuid_str).encode("utf-8")).hexdigest()
+
+
+def load_pdf(options, pages):
+    if pages not in _pdf_cache:
+        with open(os.path.join(options.pdf_dir, f"test_{pages}p.pdf"), "rb") as f:
+            _pdf_cache[pages] = f.read()
+    return _pdf_cache[pages]
+
+
+class ScenarioUser(HttpUser):
+    abstract = True
+    wait_time = between(1, 2)
+    scenario = None
+
+    @property
+    def options(self):
+        return self.environment.parsed_options
+
+    def random_size(self):
+        return random.choice([int(p) for p in self.options.pdf_sizes.split(",")])
+
+    def name(self, path, pages=None):
+        return f"{self.scenario}: {path}" + (f" [{pages}p]" if pages else "")
+
+    def report_flow(self, name, started, exception=None):
+        # the whole flow as one entry in locust's statistics
+        self.environment.events.request.fire(
+            request_type="FLOW",
+            name=f"{self.scenario}: {name}",
+            response_time=(time.perf_counter() - started) * 1000,
+            response_length=0,
+            exception=exception,
+            context={},
+        )
+
+    def upload_session(self, pages, signer_list, signing_mode):
+        """Creates a multi-sign session; returns its uuid, or None after recording the failure."""
+        uuid_str = uuid.uuid4().hex
+        data = {
+            "uuid": uuid_str,
+            "cs": generate_cs(uuid_str),
+            "initiator_workid": "LOAD001",
+            "initiator_work_dept": "LoadTest",
+            "workflow_id": "locust",
+            "signerlist": json.dumps(signer_list),
+            "signing_mode": signing_mode,
+        }
+        files = {"myfile": (f"test_{pages}p.pdf", load_pdf(self.options, pages), "application/pdf")}
+        with self.client.post("/multi-sign/upload", data=data, files=files,
+                              name=self.name("/multi-sign/upload", pages), catch_response=True) as r:
+            if r.status_code != 200:
+                r.failure(f"{r.status_code}: {r.text[:200]}")
+                return None
+        return uuid_str
+
+
+class WorkflowUser(ScenarioUser):
+    scenario = "workflow"
+
+    @task
+    def signing_workflow(self):
+        pages = self.random_size()
+        signers = self.options.signers
+        signer_list = [
+            {
+                "signer_workid": f"EMP{i:03d}",
+                "signer_name": f"Signer {i}",
+                "signer_email": f"signer{i}@example.com",
+                "locations": [{"page": i % pages + 1, "x": 100, "y": 200 + 60 * (i // pages % 8)}],
+            }
+            for i in range(signers)
+        ]
+        flow = f"complete session [{pages}p x{signers}]"
+        started = time.perf_counter()
+
+        uuid_str = self.upload_session(pages, signer_list, self.options.signing_mode)
+        if uuid_str is None:
+            self.report_flow(flow, started, RuntimeError("upload failed"))
+            return
+
+        # signers strictly in order, as the session requires
+        for signer in signer_list:
+            with self.client.get(f"/multi-sign/sign/{uuid_str}/{signer['signer_email']}",
+                                 name=self.name("/multi-sign/sign", pages), catch_response=True) as r:
+                if r.status_code != 200:
+                    r.failure(f"{r.status_code}: {r.text[:200]}")
+                    self.report_flow(flow, started, RuntimeError(f"signing failed ({r.status_code})"))
+                    return
+
+        with self.client.get(f"/multi-sign/download/{uuid_str}", name=self.name("/multi-sign/download", pages),
+                             catch_response=True) as r:
+            if r.status_code != 200:
+                r.failure(f"{r.status_code}: {r.text[:200]}")
+                self.report_flow(flow, started, RuntimeError("download failed"))
+                return
+        download_urls.append(f"/multi-sign/download/{uuid_str}")
+        self.report_flow(flow, started)
+
+
+class SignFileUser(ScenarioUser):
+    scenario = "sign_file"
+
+    @task
+    def sign_file(self):
+        pages = self.random_size()
+        files = {"myfile": (f"test_{pages}p.pdf", load_pdf(self.options, pages), "application/pdf")}
+        data = {"department": "LoadTest", "document_type": "locust", "request_id": uuid.uuid4().hex}
+        with self.client.post("/sign/file", data=data, files=files, name=self.name("/sign/file", pages),
+                              catch_response=True) as r:
+            if r.status_code != 200:
+                r.failure(f"{r.status_code}: {r.text[:200]}")
+                return
+            download_url = r.json()["download_url"]
+        download_urls.append(download_url)
+
+        # like a client fetching its result right away, some of the time
+        if random.random() < 0.5:
+            self.client.get(download_url, name=self.name("/download/{file}", pages))
+
+
+class DownloadUser(ScenarioUser):
+    scenario = "download"
+
+    @task
+    def download(self):
+        if not download_urls:
+            return  # nothing signed yet
+        url = random.choice(download_urls)
+        path = "/multi-sign/download/{uuid}" if url.startswith("/multi-sign/") else "/download/{file}"
+        self.client.get(url, name=self.name(path))
+
+
+class LargeJobUser(ScenarioUser):
+    scenario = "large_job"
+    wait_time = constant(1)
 
     @task
-    def sign_document(self):
-        self.client.get(f"/multi-sign/sign/{UUID}/{SIGNER_EMAIL}")
+    def large_job(self):
+        global large_jobs_running
+        pages = self.options.large_job_pages
+        locations = min(self.options.large_job_locations, pages)
+        signer_list = [{
+            "signer_workid": "EMP900",
+            "signer_name": "Bulk Signer",
+            "signer_email": "bulk@example.com",
+            "locations": [{"pages": f"1-{locations}", "x": 100, "y": 200}],
+        }]
+        flow = f"complete job [{pages}p x{locations} {self.options.signing_mode}]"
+        started = time.perf_counter()
+
+        uuid_str = self.upload_session(pages, signer_list, self.options.signing_mode)
+        if uuid_str is None:
+            self.report_flow(flow, started, RuntimeError("upload failed"))
+            return
+
+        large_jobs_running += 1
+        try:
+            with self.client.post(f"/jobs/multi-sign/sign/{uuid_str}/bulk@example.com",
+                                  name=self.name("/jobs/multi-sign/sign", pages), catch_response=True) as r:
+                if r.status_code != 202:
+                    r.failure(f"{r.status_code}: {r.text[:200]}")
+                    self.report_flow(flow, started, RuntimeError(f"job not accepted ({r.status_code})"))
+                    return
+                status_url = r.json()["status_url"]
+
+            status = "queued"
+            while status in ("queued", "running"):
+                time.sleep(1)
+                r = self.client.get(status_url, name=self.name("/jobs/{job_id}"))
+                status = r.json()["status"] if r.ok else "failed"
+        finally:
+            large_jobs_running -= 1
+
+        self.report_flow(flow, started, None if status == "done" else RuntimeError(f"job {status}"))
+        if status == "done":
+            download_urls.append(f"/multi-sign/download/{uuid_str}")
+
+
+class LoopProbeUser(ScenarioUser):
+    # a single user: how long a trivial request waits for the event loop
+    scenario = "loop_probe"
+    fixed_count = 1
+    wait_time = constant(0.5)
+
+    @task
+    def probe(self):
+        state = "during large job" if large_jobs_running else "no large job"
+        self.client.get("/", name=self.name(f"GET / [{state}]"))
+
+
+@events.test_stop.add_listener
+def write_scenario_percentiles(environment, **kwargs):
+    # locust's own stats are already aggregated over workers; group them by scenario prefix
+    options = environment.parsed_options
+    if options is None or not options.scenario_csv or environment.runner is None:
+        return
+    stats = environment.runner.stats
+    by_scenario = {}
+    for entry in stats.entries.values():
+        scenario = entry.name.split(":", 1)[0] if ":" in entry.name else "other"
+        by_scenario.setdefault(scenario, []).append(entry)
+
+    rows = []
+    for scenario in sorted(by_scenario, key=lambda s: SCENARIOS.index(s) if s in SCENARIOS else len(SCENARIOS)):
+        entries = sorted(by_scenario[scenario], key=lambda e: (e.name, e.method))
+        # the scenario total leaves out FLOW entries, which span the requests already counted
+        total = StatsEntry(stats, f"{scenario} (all requests)", "")
+        for entry in entries:
+            if entry.method != "FLOW":
+                total.extend(entry)
+        for entry in [total] + entries:
+            if not entry.num_requests:
+                continue
+            rows.append({
+                "scenario": scenario,
+                "type": entry.method or "ALL",
+                "name": entry.name,
+                "requests": entry.num_requests,
+                "failures": entry.num_failures,
+                "rps": round(entry.total_rps, 3),
+                "avg_ms": round(entry.avg_response_time, 1),
+                **{f"p{int(p * 100)}_ms": entry.get_response_time_percentile(p) for p in PERCENTILES},
+                "max_ms": round(entry.max_response_time or 0, 1),
+            })
+
+    if not rows:
+        return
+    with open(options.scenario_csv, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Scenario percentiles saved to {options.scenario_csv}")
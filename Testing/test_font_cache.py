@@ -0,0 +1,91 @@
+import os
+import sys
+from io import BytesIO
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import font_cache  # noqa: E402
+
+# font_cache replaces pyHanko's font subsetting with a cached copy of its result, through pyHanko
+# internals. These tests embed the same text both ways and compare what ends up in the PDF.
+
+EMPTY_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "emptydoc.pdf")
+# every PAD_CHARS glyph is in the text, so the cached subset holds exactly the glyphs pyHanko's does
+TEXT = "Signed by Test Signer (CN=Test)\nsigner@example.com\n" + font_cache.PAD_CHARS
+
+
+def _font_path():
+    paths = font_cache.find_fonts([os.environ.get("FONT_FILE", ""), "DejaVu Sans", "Liberation Sans", "Calibri", "Arial"])
+    if not paths:
+        pytest.skip("no TrueType font installed")
+    return paths[0]
+
+
+def _writer():
+    from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+
+    with open(EMPTY_PDF, "rb") as f:
+        return IncrementalPdfFileWriter(BytesIO(f.read()), strict=False)
+
+
+def _embed(factory):
+    engine = factory.create_font_engine(_writer())
+    engine.shape(TEXT)
+    engine.prepare_write()
+    type0 = engine.as_resource().get_object()
+    cidfont = type0["/DescendantFonts"][0]
+    return {
+        "engine": engine,
+        "font_program": cidfont["/FontDescriptor"]["/FontFile2"].get_object().data,
+        "widths": [int(w) if not isinstance(w, list) else [int(x) for x in w] for w in cidfont["/W"]],
+        "to_unicode": type0["/ToUnicode"].get_object().data,
+    }
+
+
+@pytest.fixture
+def fonts(tmp_path):
+    path = _font_path()
+    with open(path, "rb") as f:
+        font_bytes = f.read()
+    info = font_cache.load_font_info(path, font_bytes, str(tmp_path))
+    subset_cache = font_cache.SubsetCache(str(tmp_path / "subsets"))
+    font_cache._cached_subsets["enabled"] = True
+    return path, font_cache._font_factory_class()(info, font_bytes, subset_cache)
+
+
+def test_cached_subset_matches_pyhanko(fonts):
+    from pyhanko.pdf_utils.font.opentype import GlyphAccumulatorFactory
+
+    path, cached_factory = fonts
+    stock = _embed(GlyphAccumulatorFactory(path))
+    first = _embed(cached_factory)  # subset compiled and stored
+    second = _embed(cached_factory)  # subset taken from the cache
+
+    assert type(first["engine"]).__name__ == "CachedGlyphAccumulator"
+    for result in (first, second):
+        assert result["font_program"] == stock["font_program"]
+        assert result["widths"] == stock["widths"]
+        assert result["to_unicode"] == stock["to_unicode"]
+    assert font_cache._cached_subsets["enabled"]
+
+
+def test_falls_back_to_pyhanko_when_internals_change(fonts, monkeypatch):
+    from pyhanko.pdf_utils.font.opentype import GlyphAccumulatorFactory
+
+    path, cached_factory = fonts
+    stock = _embed(GlyphAccumulatorFactory(path))
+    # as if GlyphAccumulator's constructor had changed
+    cached_class = type(cached_factory.create_font_engine(_writer()))
+
+    def changed_init(self, *args, **kwargs):
+        raise TypeError("unexpected keyword argument 'font_handle'")
+
+    monkeypatch.setattr(cached_class, "__init__", changed_init)
+    result = _embed(cached_factory)
+
+    assert not font_cache._cached_subsets["enabled"]
+    assert type(result["engine"]).__name__ == "GlyphAccumulator"
+    assert result["font_program"] == stock["font_program"]
+    font_cache._cached_subsets["enabled"] = True
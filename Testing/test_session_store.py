@@ -0,0 +1,67 @@
+import glob
+import json
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from session_store import EventLogSessionStore  # noqa: E402
+
+# Sessions are signed while the writer thread is still committing their "created" events, so
+# the log has to hold each event as it was appended, not the live session it refers to.
+
+SIGNERS = 3
+
+
+def _session(uuid):
+    return {
+        "uuid": uuid,
+        "workflow_id": "wf",
+        "file_path": f"/tmp/{uuid}.pdf",
+        "signers": [{"signer_email": f"s{i}@example.com", "status": "pending"} for i in range(SIGNERS)],
+        "current_index": 0,
+        "completed": False,
+    }
+
+
+def _sign_all(store, uuid):
+    store.create(_session(uuid))
+    for index in range(SIGNERS):
+        session = store.get(uuid)
+        token = store.claim_turn(uuid, index, ttl=60)
+        session["signers"][index].update(status="signed", signed_at=f"t{index}")
+        session["current_index"] = index + 1
+        session["file_path"] = f"/tmp/{uuid}.{index}.pdf"
+        session["completed"] = index == SIGNERS - 1
+        assert store.advance_turn(uuid, index, token, session)
+
+
+def test_replay_of_log_written_while_signing(tmp_path):
+    # a long commit interval makes every batch hold sessions that were signed after being created
+    store = EventLogSessionStore(str(tmp_path), snapshot_every=10 ** 6, commit_interval=0.05)
+    threads = [
+        threading.Thread(target=lambda t=t: [_sign_all(store, f"{t}-{n}") for n in range(25)])
+        for t in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.flush()
+    expected = {uuid: store.get(uuid) for uuid in store.find(workflow_id="wf")}
+    store.close()
+
+    assert len(expected) == 200
+    for segment in glob.glob(os.path.join(str(tmp_path), "events-*.log")):
+        with open(segment, encoding="utf-8") as f:
+            for line in f:
+                event = json.loads(line)
+                if event["type"] == "created":
+                    assert event["session"] == _session(event["uuid"])
+
+    reopened = EventLogSessionStore(str(tmp_path))
+    try:
+        assert {uuid: reopened.get(uuid) for uuid in expected} == expected
+    finally:
+        reopened.close()
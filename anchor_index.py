@@ -0,0 +1,65 @@
+from text_locator import find_anchor_positions
+from widget_signing import expand_locations
+
+# Resolved once at /multi-sign/upload: page geometry of the document and, for every
+# signer, the final (page_index, x, y) placements with the "Authorised Signature N"
+# anchor already applied. Sign time then needs neither fitz nor a text search.
+
+
+def anchor_keyword(signer_index):
+    return f"Authorised Signature {signer_index + 1}"
+
+
+def read_page_sizes(pdf_path):
+    """Returns [[width, height], ...] in PDF points, one entry per page."""
+    import fitz  # imported on first use: keeps it out of the server's import time
+
+    with fitz.open(pdf_path) as doc:
+        return [[page.rect.width, page.rect.height] for page in doc]
+
+
+def resolve_signer_placements(signer, signer_index, page_count, signing_mode, anchors):
+    """
+    Expands a signer's locations and applies the anchor for their position in the order
+    (looked up in `anchors`, as returned by find_anchor_positions). A found anchor overrides
+    every location: per_location signs it once per location, single_revision signs it once.
+    Returns (placements, anchor or None); raises ValueError.
+    """
+    try:
+        placements = expand_locations(signer.get("locations", []), page_count)
+    except KeyError as e:
+        raise ValueError(f"location is missing {e}")
+    if not placements:
+        raise ValueError(f"No signature locations for {signer['signer_email']}")
+
+    anchor = anchors.get(anchor_keyword(signer_index))
+    if anchor:
+        position = (anchor["page"], anchor["x"], anchor["y"])
+        placements = [position] if signing_mode == "single_revision" else [position] * len(placements)
+    return placements, anchor
+
+
+def build_anchor_index(pdf_path, signers, signing_mode, doc_hash=None, scan_workers=0):
+    """
+    Resolves every signer's placements in place (signer["anchor"], signer["placements"])
+    from one find_anchor_positions call for all anchors (the scan is described in
+    text_locator), and returns the page geometry for the session.
+    Raises ValueError on invalid locations.
+    """
+    page_sizes = read_page_sizes(pdf_path)
+    keywords = [anchor_keyword(i) for i in range(len(signers))]
+    anchors = find_anchor_positions(pdf_path, keywords, doc_hash, scan_workers)
+
+    for signer_index, signer in enumerate(signers):
+        placements, anchor = resolve_signer_placements(signer, signer_index, len(page_sizes), signing_mode, anchors)
+        signer["anchor"] = anchor
+        signer["placements"] = [list(p) for p in placements]
+    return {"page_count": len(page_sizes), "page_sizes": page_sizes}
+
+
+def resolve_single_signer(pdf_path, signer, signer_index, signing_mode):
+    # For sessions created before upload-time resolution: same rules, one signer, at sign time
+    page_count = len(read_page_sizes(pdf_path))
+    anchors = find_anchor_positions(pdf_path, [anchor_keyword(signer_index)])
+    placements, _ = resolve_signer_placements(signer, signer_index, page_count, signing_mode, anchors)
+    return placements
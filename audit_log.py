@@ -0,0 +1,159 @@
+import atexit
+import csv
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_STOP = object()
+
+
+@contextmanager
+def _file_lock(lock_path):
+    # Exclusive OS-level lock, so several server processes can share one log file
+    with open(lock_path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class AuditLogWriter:
+    """
+    Background CSV writer for the signing audit log.
+
+    submit() only enqueues rows; a writer thread appends them in batches of up to
+    batch_size, or whatever has arrived after flush_interval seconds. Each batch is
+    written under an exclusive file lock, and the file is rotated aside
+    (signing_log.<date>.csv) when the day changes or it reaches max_bytes, so any number
+    of processes can log to the same path. In a forked child (signing worker) there is no
+    writer thread, and rows are written directly under the same lock.
+
+    Each written batch is also passed to every callable in sinks (e.g. AuditStore.add);
+    a failing sink is reported but doesn't affect the CSV.
+    """
+
+    def __init__(self, path, fieldnames, batch_size=200, flush_interval=1.0, max_bytes=50 * 1024 * 1024, rotate_daily=True, sinks=()):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.sinks = list(sinks)
+        self.lock_path = f"{path}.lock"
+        self._queue = queue.Queue()
+        self._owner_pid = os.getpid()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, rows):
+        if os.getpid() != self._owner_pid:
+            self._write(rows)
+            return
+        self._ensure_started()
+        for row in rows:
+            self._queue.put(row)
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+                # also flush when the process exits without the app's shutdown hook
+                atexit.register(self.close)
+
+    def close(self):
+        """Writes out everything queued so far and stops the writer thread."""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"Audit log write failed, {len(batch)} rows lost: {e}")
+
+    def _write(self, rows):
+        with _file_lock(self.lock_path):
+            self._rotate_if_needed()
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, mode="a", newline="", encoding="utf-8") as log_file:
+                writer = csv.DictWriter(log_file, fieldnames=self.fieldnames)
+                if new_file:
+                    writer.writeheader()
+                writer.writerows(rows)
+
+        for sink in self.sinks:
+            try:
+                sink(rows)
+            except Exception as e:
+                print(f"Audit sink {getattr(sink, '__qualname__', sink)} failed for {len(rows)} rows: {e}")
+
+    def _rotate_if_needed(self):
+        # caller holds the file lock
+        if not os.path.exists(self.path):
+            return
+        stat = os.stat(self.path)
+        last_written = datetime.fromtimestamp(stat.st_mtime).date()
+
+        if self.rotate_daily and last_written != date.today():
+            suffix = last_written.strftime("%Y%m%d")
+        elif self.max_bytes and stat.st_size >= self.max_bytes:
+            suffix = datetime.now().strftime("%Y%m%d_%H%M%S")
+        elif stat.st_size and self._header() != self.fieldnames:
+            # columns changed (e.g. after an upgrade): start a new file rather than mix layouts
+            suffix = datetime.now().strftime("%Y%m%d_%H%M%S")
+        else:
+            return
+
+        base, ext = os.path.splitext(self.path)
+        target, n = f"{base}.{suffix}{ext}", 1
+        while os.path.exists(target):
+            target, n = f"{base}.{suffix}.{n}{ext}", n + 1
+        os.replace(self.path, target)
+
+    def _header(self):
+        with open(self.path, newline="", encoding="utf-8") as f:
+            return next(csv.reader(f), None)
@@ -0,0 +1,228 @@
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# Queryable copy of the signing audit log. Every row is kept in audit_events (indexed
+# for filtered, paginated reads) and folded into audit_hourly: one row per hour,
+# department, document_type and status with a count, the summed latency and a latency
+# histogram, so totals and percentiles over any period come from a few hundred rows.
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 7500, 10000, 20000, 60000]
+BUCKET_COLUMNS = [f"b{i}" for i in range(len(LATENCY_BUCKETS_MS) + 1)]
+
+EVENT_COLUMNS = ["timestamp", "original_file", "signed_file", "signer_name", "department", "document_type",
+                 "request_id", "status", "error", "duration_ms"]
+FILTERS = ("department", "document_type", "status", "request_id")
+GROUP_BY = {
+    "department": "department",
+    "document_type": "document_type",
+    "status": "status",
+    "hour": "strftime('%Y-%m-%dT%H:00', hour, 'unixepoch', 'localtime')",
+    "day": "strftime('%Y-%m-%d', hour, 'unixepoch', 'localtime')",
+}
+
+
+def _bucket_index(duration_ms):
+    for i, bound in enumerate(LATENCY_BUCKETS_MS):
+        if duration_ms <= bound:
+            return i
+    return len(LATENCY_BUCKETS_MS)
+
+
+def _percentile(buckets, fraction):
+    # interpolated linearly within the bucket holding the rank, as Prometheus' histogram_quantile does;
+    # a rank in the open-ended last bucket reports its lower bound
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = fraction * total
+    running = 0
+    for i, n in enumerate(buckets):
+        if n and running + n >= rank:
+            lower = LATENCY_BUCKETS_MS[i - 1] if i else 0
+            if i == len(LATENCY_BUCKETS_MS):
+                return lower
+            return round(lower + (LATENCY_BUCKETS_MS[i] - lower) * (rank - running) / n, 1)
+        running += n
+    return None
+
+
+def parse_time(value):
+    """Accepts an ISO date/datetime or epoch seconds; returns epoch seconds."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+class AuditStore:
+    SCHEMA = f"""
+        CREATE TABLE IF NOT EXISTS audit_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts REAL NOT NULL,
+            {", ".join(f"{c} TEXT" for c in EVENT_COLUMNS if c != "duration_ms")},
+            duration_ms REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_audit_events_ts ON audit_events(ts);
+        CREATE INDEX IF NOT EXISTS idx_audit_events_department ON audit_events(department, id);
+        CREATE INDEX IF NOT EXISTS idx_audit_events_document_type ON audit_events(document_type, id);
+        CREATE INDEX IF NOT EXISTS idx_audit_events_status ON audit_events(status, id);
+        CREATE INDEX IF NOT EXISTS idx_audit_events_request_id ON audit_events(request_id);
+        CREATE TABLE IF NOT EXISTS audit_hourly (
+            hour INTEGER NOT NULL,
+            department TEXT NOT NULL,
+            document_type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            duration_sum REAL NOT NULL,
+            duration_count INTEGER NOT NULL,
+            {", ".join(f"{c} INTEGER NOT NULL DEFAULT 0" for c in BUCKET_COLUMNS)},
+            PRIMARY KEY (hour, department, document_type, status)
+        );
+    """
+
+    def __init__(self, db_path, busy_timeout=5.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self):
+        # one connection per thread and process
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def add(self, rows):
+        """Stores audit rows (LOG_FIELDNAMES dicts) and updates the hourly rollups, in one transaction."""
+        events, rollups = [], {}
+        for row in rows:
+            try:
+                ts = datetime.strptime(row["timestamp"], "%Y%m%d_%H%M%S").timestamp()
+            except (KeyError, ValueError):
+                ts = time.time()
+            duration = row.get("duration_ms")
+            duration = float(duration) if duration not in (None, "") else None
+            values = {c: row.get(c, "") for c in EVENT_COLUMNS}
+            values["document_type"] = row.get("document-type", row.get("document_type", ""))
+            values["duration_ms"] = duration
+            events.append([ts] + [values[c] for c in EVENT_COLUMNS])
+
+            key = (int(ts // 3600 * 3600), values["department"] or "", values["document_type"] or "", values["status"] or "")
+            rollup = rollups.setdefault(key, [0, 0.0, 0] + [0] * len(BUCKET_COLUMNS))
+            rollup[0] += 1
+            if duration is not None:
+                rollup[1] += duration
+                rollup[2] += 1
+                rollup[3 + _bucket_index(duration)] += 1
+
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                f"INSERT INTO audit_events (ts, {', '.join(EVENT_COLUMNS)}) VALUES ({', '.join('?' * (len(EVENT_COLUMNS) + 1))})",
+                events
+            )
+            conn.executemany(
+                f"INSERT INTO audit_hourly (hour, department, document_type, status, count, duration_sum, duration_count, "
+                f"{', '.join(BUCKET_COLUMNS)}) VALUES ({', '.join('?' * (7 + len(BUCKET_COLUMNS)))}) "
+                f"ON CONFLICT (hour, department, document_type, status) DO UPDATE SET "
+                + ", ".join(f"{c} = {c} + excluded.{c}" for c in ["count", "duration_sum", "duration_count"] + BUCKET_COLUMNS),
+                [list(key) + values for key, values in rollups.items()]
+            )
+
+    @staticmethod
+    def _where(filters, since, until, time_column):
+        clauses, params = [], []
+        for name in FILTERS:
+            if filters.get(name) is not None:
+                clauses.append(f"{name} = ?")
+                params.append(filters[name])
+        if since is not None:
+            clauses.append(f"{time_column} >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append(f"{time_column} < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query_events(self, filters, since=None, until=None, cursor=None, limit=50):
+        """Newest first; pass the returned next_cursor to get the following page."""
+        where, params = self._where(filters, since, until, "ts")
+        if cursor is not None:
+            where += (" AND " if where else " WHERE ") + "id < ?"
+            params.append(cursor)
+        rows = self._connect().execute(
+            f"SELECT id, ts, {', '.join(EVENT_COLUMNS)} FROM audit_events{where} ORDER BY id DESC LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+
+        events = [dict(zip(["id", "ts"] + EVENT_COLUMNS, row)) for row in rows[:limit]]
+        next_cursor = events[-1]["id"] if len(rows) > limit else None
+        return events, next_cursor
+
+    def summary(self, filters, since=None, until=None, group_by=()):
+        """Counts and latency (avg, p50, p95) from the hourly rollups; since/until are applied per hour."""
+        if filters.get("request_id") is not None:
+            raise ValueError("request_id can't be used with the summary")
+        unknown = [g for g in group_by if g not in GROUP_BY]
+        if unknown:
+            raise ValueError(f"Unknown group_by: {', '.join(unknown)} (use {', '.join(GROUP_BY)})")
+
+        where, params = self._where(
+            filters, since // 3600 * 3600 if since is not None else None, until, "hour"
+        )
+        keys = [f"{GROUP_BY[g]} AS {g}" for g in group_by]
+        sums = ["SUM(count)", "SUM(duration_sum)", "SUM(duration_count)"] + [f"SUM({c})" for c in BUCKET_COLUMNS]
+        query = f"SELECT {', '.join(keys + sums)} FROM audit_hourly{where}"
+        if group_by:
+            query += f" GROUP BY {', '.join(group_by)} ORDER BY {', '.join(group_by)}"
+
+        results = []
+        for row in self._connect().execute(query, params):
+            group, (count, duration_sum, duration_count, *buckets) = row[:len(group_by)], row[len(group_by):]
+            if not count:
+                continue
+            result = dict(zip(group_by, group))
+            result.update({
+                "count": count,
+                "avg_ms": round(duration_sum / duration_count, 1) if duration_count else None,
+                "p50_ms": _percentile(buckets, 0.50),
+                "p95_ms": _percentile(buckets, 0.95),
+            })
+            results.append(result)
+        return results
+
+    def import_csv(self, path, batch_size=5000):
+        """Backfills from a signing_log CSV (rows logged before the store existed); returns the row count."""
+        count, batch = 0, []
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    self.add(batch)
+                    count, batch = count + len(batch), []
+        if batch:
+            self.add(batch)
+            count += len(batch)
+        return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import signing_log CSV files into the audit store")
+    parser.add_argument("csv_files", nargs="+", help="signing_log*.csv files to import")
+    parser.add_argument("--db", default=os.path.join("logs", "audit.db"), help="audit database")
+    args = parser.parse_args()
+    store = AuditStore(args.db)
+    for csv_path in args.csv_files:
+        print(f"Imported {store.import_csv(csv_path)} rows from {csv_path}")
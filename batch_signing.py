@@ -0,0 +1,134 @@
+import json
+import os
+import zipfile
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+# Input side of POST /sign/batch: turns a multipart file list or a zip archive plus an
+# optional manifest into one item per document with its own metadata.
+
+MANIFEST_NAME = "manifest.json"
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class _Budget:
+    """Bytes a batch may still take in memory; every document read is charged against it."""
+
+    def __init__(self, max_file_bytes, max_total_bytes):
+        self.max_file_bytes = max_file_bytes
+        self.remaining = max_total_bytes
+        self.max_total_bytes = max_total_bytes
+
+    def check(self, name, size):
+        # sizes declared up front (upload size, zip header) are refused before anything is read
+        if size > self.max_file_bytes:
+            raise HTTPException(status_code=413, detail=f"{name} exceeds the {self.max_file_bytes} byte limit")
+        if size > self.remaining:
+            raise HTTPException(status_code=413, detail=f"Batch exceeds the {self.max_total_bytes} byte limit")
+
+    def read(self, name, src):
+        # declared sizes can lie (zip headers, missing Content-Length): count what actually arrives
+        chunks, size = [], 0
+        while True:
+            chunk = src.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            self.check(name, size)
+            chunks.append(chunk)
+        self.remaining -= size
+        return b"".join(chunks)
+
+
+def _parse_manifest(raw):
+    if not raw:
+        return []
+    try:
+        entries = json.loads(raw)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON in manifest")
+    if not isinstance(entries, list) or not all(isinstance(e, dict) for e in entries):
+        raise HTTPException(status_code=400, detail="manifest must be a JSON list of objects")
+    return entries
+
+
+def _read_member(zf, info, name, budget):
+    budget.check(name, info.file_size)
+    with zf.open(info) as member:
+        return budget.read(name, member)
+
+
+def _read_zip(fileobj, budget):
+    documents, manifest_raw = [], None
+    try:
+        with zipfile.ZipFile(fileobj) as zf:
+            for info in zf.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name or name.startswith("."):
+                    continue
+                if name == MANIFEST_NAME:
+                    manifest_raw = _read_member(zf, info, name, budget).decode("utf-8")
+                elif name.lower().endswith(".pdf"):
+                    documents.append((name, _read_member(zf, info, name, budget)))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="archive is not a valid zip file")
+    return documents, manifest_raw
+
+
+def _read_upload(upload, name, budget):
+    if upload.size is not None:
+        budget.check(name, upload.size)
+    upload.file.seek(0)
+    return budget.read(name, upload.file)
+
+
+async def read_batch_items(uploads, archive, manifest, department, document_type, batch_id, max_files,
+                           max_file_bytes, max_total_bytes):
+    """
+    Returns [{"index", "filename", "pdf", "department", "document_type", "request_id"}].
+
+    Every document is held in memory until it is signed, so each one (uploaded or unzipped) is
+    limited to max_file_bytes and all of them together to max_total_bytes; over either is a 413.
+
+    Manifest entries are matched by "filename" when they have one, otherwise by position;
+    missing fields fall back to the batch-level department/document_type, and request_id
+    defaults to "<batch_id>-<index>". A zip archive may carry its own manifest.json.
+    """
+    budget = _Budget(max_file_bytes, max_total_bytes)
+    documents = []
+    for upload in uploads or []:
+        if not upload.filename.endswith(".pdf"):
+            raise HTTPException(status_code=400, detail=f"Only PDF files are supported: {upload.filename}")
+        name = os.path.basename(upload.filename)
+        documents.append((name, await run_in_threadpool(_read_upload, upload, name, budget)))
+
+    manifest_raw = manifest
+    if archive is not None:
+        zipped, zipped_manifest = await run_in_threadpool(_read_zip, archive.file, budget)
+        documents.extend(zipped)
+        manifest_raw = manifest_raw or zipped_manifest
+
+    if not documents:
+        raise HTTPException(status_code=400, detail="No PDF documents in batch")
+    if len(documents) > max_files:
+        raise HTTPException(status_code=413, detail=f"Batch has {len(documents)} documents, limit is {max_files}")
+
+    entries = _parse_manifest(manifest_raw)
+    by_name = {e["filename"]: e for e in entries if "filename" in e}
+
+    items = []
+    for index, (filename, pdf_bytes) in enumerate(documents):
+        if by_name:
+            meta = by_name.get(filename, {})
+        else:
+            meta = entries[index] if index < len(entries) else {}
+        items.append({
+            "index": index,
+            "filename": filename,
+            "pdf": pdf_bytes,
+            "department": meta.get("department", department),
+            "document_type": meta.get("document_type", document_type),
+            "request_id": meta.get("request_id", f"{batch_id}-{index}"),
+        })
+    return items
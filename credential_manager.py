@@ -0,0 +1,83 @@
+import hashlib
+import os
+import threading
+
+
+class CredentialManager:
+    """
+    Keeps one SimpleSigner built from the PKCS#12 file in memory and shares it
+    across requests. The key material is converted in memory and never written
+    to disk. The PFX file is stat'ed on every access; when its mtime changes the
+    bytes are re-hashed and the signer is rebuilt only if the content differs.
+    """
+
+    def __init__(self, pfx_path, pfx_password):
+        self.pfx_path = pfx_path
+        self.pfx_password = pfx_password
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._digest = None
+        self._credential = None
+
+    def _build_signer(self, pfx_data):
+        # pyHanko and friends are imported on first load (server warm-up), not at import time
+        from asn1crypto import keys, x509
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.serialization import pkcs12
+        from pyhanko.sign import signers
+        from pyhanko_certvalidator.registry import SimpleCertificateStore
+
+        private_key, certificate, other_certs = pkcs12.load_key_and_certificates(
+            pfx_data, self.pfx_password.encode('utf-8')
+        )
+
+        signing_key = keys.PrivateKeyInfo.load(
+            private_key.private_bytes(
+                encoding=serialization.Encoding.DER,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption()
+            )
+        )
+        signing_cert = x509.Certificate.load(certificate.public_bytes(serialization.Encoding.DER))
+
+        cert_registry = SimpleCertificateStore()
+        cert_registry.register_multiple(
+            x509.Certificate.load(c.public_bytes(serialization.Encoding.DER)) for c in (other_certs or [])
+        )
+
+        signer = signers.SimpleSigner(
+            signing_cert=signing_cert,
+            signing_key=signing_key,
+            cert_registry=cert_registry
+        )
+        # asn1crypto parses fields on first access and caches them without a lock; parse them
+        # now, while only this thread sees the signer (concurrent first reads of subject_name
+        # could see a half-built subject dict and fail with KeyError 'organization_name')
+        signing_cert.native
+        signing_key.native
+        return signer, certificate.subject.rfc4514_string()
+
+    def get(self):
+        """Returns (signer, cert_subject), reloading first if the PFX file changed."""
+        mtime = os.stat(self.pfx_path).st_mtime_ns
+        if self._credential is not None and mtime == self._mtime:
+            return self._credential
+
+        with self._lock:
+            if self._credential is not None and mtime == self._mtime:
+                return self._credential
+
+            with open(self.pfx_path, 'rb') as f:
+                pfx_data = f.read()
+            digest = hashlib.sha256(pfx_data).hexdigest()
+
+            if digest != self._digest:
+                self._credential = self._build_signer(pfx_data)
+                self._digest = digest
+                print(f"Signing credential loaded from {self.pfx_path} (sha256 {digest[:12]})")
+
+            self._mtime = mtime
+            return self._credential
+
+    def get_signer(self):
+        return self.get()[0]
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import os
+import secrets
+import time
+from datetime import datetime
+
+from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+from pyhanko.sign.signers import SignatureObject
+from pyhanko.sign.signers.cms_embedder import PdfCMSEmbedder, SigIOSetup, SigObjSetup
+from pyhanko.sign.signers.pdf_byterange import PreparedByteRangeDigest
+from pyhanko.sign.signers.pdf_cms import PdfCMSSignedAttributes
+
+from metrics import stage
+from widget_signing import (
+    MD_ALGORITHM, append_field_with_appearance, append_multi_widget_field, apply_shared_appearance, cms_bytes_to_reserve,
+)
+
+# Deferred (interrupted) signing of a multi-sign turn. prepare_turn does everything that doesn't
+# need the signer: adds the field and its appearance, writes the revision with an empty /Contents
+# placeholder to {output}.prepared.<pid>-<token> and stores that name and the byte-range digest in
+# {output}.prepared.json. finish_turn, when the signer signs, only builds the CMS over that digest,
+# writes it into the placeholder and renames the file to the turn's output.
+#
+# The .json is the only shared name and is replaced atomically, so workers preparing or discarding
+# the same turn never remove a document another one is still writing. What can be left behind
+# (a turn that is never signed, a process killed mid-write, the loser of two workers preparing the
+# same turn at once) is removed by sweep once it is old.
+#
+# Only a turn that is one signature can be prepared (single_revision mode, or a single location):
+# with several per_location signatures each revision's digest covers the previous signature.
+# The signature dictionary gets no /M, since the document is written before the signer signs; the
+# signing time is the CMS signing-time attribute, set in finish_turn.
+
+
+def can_prepare(signing_mode, placements):
+    return bool(placements) and (signing_mode == "single_revision" or len(placements) == 1)
+
+
+PREPARED_MARKER = ".prepared"
+
+
+def meta_path_for(output_path):
+    return f"{output_path}{PREPARED_MARKER}.json"
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _prepared_file(output_path, meta):
+    # stored as a bare name, next to the output
+    return os.path.join(os.path.dirname(output_path), os.path.basename(meta["prepared_file"]))
+
+
+def discard(output_path):
+    """Removes the turn's committed preparation, if any; documents still being written are left alone."""
+    meta_path = meta_path_for(output_path)
+    meta = _read_meta(meta_path)
+    _remove(meta_path)
+    if meta and meta.get("prepared_file"):
+        _remove(_prepared_file(output_path, meta))
+
+
+def sweep(directory, max_age):
+    """Removes preparation files in directory older than max_age seconds; returns how many."""
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(directory):
+        if PREPARED_MARKER not in entry.name or not entry.is_file():
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+async def _write_placeholder(writer, output, signer, field_name):
+    bytes_reserved = await cms_bytes_to_reserve(signer, PdfCMSSignedAttributes(signing_time=datetime.now().astimezone()))
+    with stage("output_write"):
+        cms_writer = PdfCMSEmbedder().write_cms(field_name=field_name, writer=writer, existing_fields_only=True)
+        next(cms_writer)
+        cms_writer.send(SigObjSetup(sig_placeholder=SignatureObject(bytes_reserved=bytes_reserved)))
+        # output is read back for the digest, so it must be readable and seekable (w+b); the generator
+        # would take the CMS next, but the document is complete up to the placeholder
+        prepared_digest, _ = cms_writer.send(SigIOSetup(md_algorithm=MD_ALGORITHM, in_place=False, output=output))
+    return prepared_digest
+
+
+def prepare_turn(input_path, output_path, signer, field_name, placements, signing_mode, stamp_style, text_params, identity):
+    """
+    Writes the prepared document for a turn, next to output_path. identity (a JSON-able dict saying which
+    session turn, signer and stamp this is) is stored with the digest and checked again by finish_turn.
+    Blocking; run in a worker.
+    """
+    meta_path = meta_path_for(output_path)
+    # unique per process and attempt: nobody else writes, renames or removes it until the .json names it
+    prepared_path = f"{output_path}{PREPARED_MARKER}.{os.getpid()}-{secrets.token_hex(4)}"
+    try:
+        return _prepare(input_path, output_path, prepared_path, meta_path, signer, field_name, placements,
+                        signing_mode, stamp_style, text_params, identity)
+    except BaseException:
+        _remove(prepared_path)
+        raise
+
+
+def _prepare(input_path, output_path, prepared_path, meta_path, signer, field_name, placements, signing_mode,
+             stamp_style, text_params, identity):
+    with open(input_path, "rb") as inf:
+        w = IncrementalPdfFileWriter(inf, strict=False)
+        with stage("field_append"):
+            if signing_mode == "single_revision":
+                field_ref = append_multi_widget_field(w, field_name, placements)
+            else:
+                append_field_with_appearance(w, field_name, placements[0], stamp_style, text_params)
+        if signing_mode == "single_revision":
+            with stage("stamp_render"):
+                apply_shared_appearance(w, field_ref, stamp_style, text_params)
+
+        with open(prepared_path, "w+b") as outf:
+            prepared_digest = asyncio.run(_write_placeholder(w, outf, signer, field_name))
+
+    meta = {
+        **identity,
+        "prepared_file": os.path.basename(prepared_path),
+        "document_digest": prepared_digest.document_digest.hex(),
+        "reserved_region_start": prepared_digest.reserved_region_start,
+        "reserved_region_end": prepared_digest.reserved_region_end,
+        "prepared_at": datetime.now().isoformat(),
+    }
+    tmp_path = f"{meta_path}.{os.getpid()}-{secrets.token_hex(4)}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    # another worker may have prepared the same turn: its document goes once ours is in place
+    previous = _read_meta(meta_path)
+    os.replace(tmp_path, meta_path)
+    if previous and previous.get("prepared_file") and previous["prepared_file"] != meta["prepared_file"]:
+        _remove(_prepared_file(output_path, previous))
+    return meta
+
+
+def load_prepared(output_path, identity):
+    """The stored preparation of this turn, or None when there is none or it was made for something else."""
+    meta = _read_meta(meta_path_for(output_path))
+    if meta is None or not meta.get("prepared_file"):
+        return None
+    if any(meta.get(key) != value for key, value in identity.items()):
+        return None
+    if not os.path.exists(_prepared_file(output_path, meta)):
+        return None
+    return meta
+
+
+def finish_turn(output_path, signer, identity):
+    """
+    Signs a prepared turn into output_path. Returns False, leaving nothing behind, when the turn has no
+    usable preparation (the caller then signs it the normal way).
+    """
+    meta = load_prepared(output_path, identity)
+    if meta is None:
+        discard(output_path)
+        return False
+
+    prepared_path = _prepared_file(output_path, meta)
+    # the preparation is used up from here on, whatever happens
+    _remove(meta_path_for(output_path))
+    try:
+        timestamp = datetime.now().astimezone()
+        with stage("cms_sign"):
+            sig_cms = asyncio.run(signer.async_sign(
+                bytes.fromhex(meta["document_digest"]), MD_ALGORITHM,
+                signed_attr_settings=PdfCMSSignedAttributes(signing_time=timestamp)
+            ))
+        prepared_digest = PreparedByteRangeDigest(
+            document_digest=bytes.fromhex(meta["document_digest"]),
+            reserved_region_start=meta["reserved_region_start"],
+            reserved_region_end=meta["reserved_region_end"],
+        )
+        # placeholder is <hex>; a credential swapped since preparation may need more room
+        if len(sig_cms.dump()) * 2 > prepared_digest.reserved_region_end - prepared_digest.reserved_region_start - 2:
+            _remove(prepared_path)
+            return False
+
+        with stage("output_write"):
+            with open(prepared_path, "r+b") as f:
+                prepared_digest.fill_with_cms(f, sig_cms)
+            os.replace(prepared_path, output_path)
+        return True
+    except BaseException:
+        _remove(prepared_path)
+        raise
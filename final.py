@@ -1,23 +1,33 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import FileResponse
+import time
+IMPORT_STARTED = time.perf_counter()  # reported by /ready
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.concurrency import run_in_threadpool
-import os, json, hashlib
-import tempfile
-from pyhanko.pdf_utils import layout
+from typing import List
+import zipfile
+import os, io, json, hashlib, secrets, asyncio
 from datetime import datetime
-from pyhanko.sign import signers, fields, PdfSigner, PdfSignatureMetadata
-from pyhanko.stamp import TextStampStyle
-from pyhanko.pdf_utils.text import TextBoxStyle
-from pyhanko.pdf_utils.font import opentype
-from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
-from cryptography.hazmat.primitives.serialization import pkcs12
-from cryptography.hazmat.primitives import serialization
-import csv
 from fastapi import Path
-import fitz
 import glob
 from urllib.parse import unquote
-from text_locator import find_keyword_position
+from credential_manager import CredentialManager
+from font_cache import FontSet
+# pyHanko, fitz and fontTools (signing, anchors, stamp font) are imported where they are used:
+# the server starts listening without them and warm_caches() loads them before /ready
+from signing_pool import SigningExecutor, SigningPoolFull, report_progress, set_progress_handler
+from jobs import JobManager, JobQueueFull
+from functools import partial, lru_cache
+from batch_signing import read_batch_items
+from upload_store import ingest_upload
+from session_store import open_session_store
+from audit_log import AuditLogWriter
+from audit_store import AuditStore, parse_time
+import metrics
+import profiling
+import sampler
+from metrics import stage
+from starlette.routing import Match
 
 
 
@@ -28,197 +38,935 @@ UPLOAD_DIR = "uploads"
 SESSION_DIR = "sessions"
 PFX_FILE = "Test_Doc_Pro.pfx"
 PFX_PASSWORD = "Pro123"
-FONT_FILE = "C:/Windows/Fonts/calibri.ttf"
 APIKEY = "FAKECLIENTKEY1234567890ABCDEF12345678"
 
+# Signing executor: 0 workers keeps signing on the thread pool, >0 forks a process pool at startup
+SIGNING_WORKERS = int(os.environ.get("SIGNING_WORKERS", "0"))
+SIGNING_QUEUE_DEPTH = int(os.environ.get("SIGNING_QUEUE_DEPTH", "32"))
+SIGNING_MAX_TASKS_PER_WORKER = int(os.environ.get("SIGNING_MAX_TASKS_PER_WORKER", "200"))
+
+# Background jobs (/jobs): how many run at once, how many may wait, how many finished jobs are kept
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_QUEUE_LIMIT = int(os.environ.get("JOB_QUEUE_LIMIT", "100"))
+JOB_HISTORY = int(os.environ.get("JOB_HISTORY", "1000"))
+
+# /sign/batch: documents signed concurrently per batch request
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", str(max(SIGNING_WORKERS, 4))))
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", "500"))
+# all documents of a batch are held in memory: limit on their total size (each one is also held to MAX_UPLOAD_BYTES)
+BATCH_MAX_BYTES = int(os.environ.get("BATCH_MAX_BYTES", str(500 * 1024 * 1024)))
+
+# Single-document uploads are streamed to disk in UPLOAD_CHUNK_SIZE pieces; anything over MAX_UPLOAD_BYTES is rejected with 413
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# room for the multipart framing and form fields (signerlist etc.) on top of the file itself
+UPLOAD_FORM_OVERHEAD = 1024 * 1024
+# Where streamed single-document uploads wait to be signed; point at a tmpfs (e.g. /dev/shm/signing) to keep them off disk
+SIGNING_WORKSPACE = os.environ.get("SIGNING_WORKSPACE", UPLOAD_DIR)
+
+# Multi-sign sessions: "json" keeps sessions/{uuid}.json (single process), "sqlite" shares one WAL database
+# between workers, "eventlog" appends compact events under sessions/eventlog (single process)
+# (import existing JSON sessions with migrate_sessions.py)
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "json")
+SESSION_DB = os.environ.get("SESSION_DB", os.path.join(SESSION_DIR, "sessions.db"))
+SESSION_SNAPSHOT_EVERY = int(os.environ.get("SESSION_SNAPSHOT_EVERY", "1000"))
+SESSION_COMMIT_INTERVAL_MS = float(os.environ.get("SESSION_COMMIT_INTERVAL_MS", "5"))
+# eventlog: completed sessions move out of memory and snapshots to sessions/eventlog/archive after this many seconds
+SESSION_ARCHIVE_AFTER = int(os.environ.get("SESSION_ARCHIVE_AFTER", str(24 * 3600)))
+# sessions kept in memory (write-through); 0 disables the cache
+SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", "1024"))
+# a signer's turn is reserved while their signature is produced; an abandoned claim expires after this
+SIGN_CLAIM_TTL = int(os.environ.get("SIGN_CLAIM_TTL", "600"))
+
+# Anchor text scan at /multi-sign/upload: >1 splits very large documents (2000+ pages) across processes
+ANCHOR_SCAN_WORKERS = int(os.environ.get("ANCHOR_SCAN_WORKERS", "0"))
+# request body limits checked on Content-Length before the multipart body is read
+UPLOAD_LIMITS = {
+    "/sign/file": MAX_UPLOAD_BYTES,
+    "/jobs/sign/file": MAX_UPLOAD_BYTES,
+    "/multi-sign/upload": MAX_UPLOAD_BYTES,
+    "/sign/batch": BATCH_MAX_BYTES,
+}
+
 #Logging setup
 LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
 LOG_FILE = os.path.join(LOG_DIR, "signing_log.csv")
+# Audit rows are written by a background thread in batches; the file rotates daily and at AUDIT_MAX_BYTES
+AUDIT_BATCH_SIZE = int(os.environ.get("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get("AUDIT_FLUSH_INTERVAL", "1.0"))
+AUDIT_MAX_BYTES = int(os.environ.get("AUDIT_MAX_BYTES", str(50 * 1024 * 1024)))
+AUDIT_ROTATE_DAILY = os.environ.get("AUDIT_ROTATE_DAILY", "1") == "1"
+# Indexed copy of the audit log behind GET /audit ("" disables it; backfill old CSVs with audit_store.py)
+AUDIT_DB = os.environ.get("AUDIT_DB", os.path.join(LOG_DIR, "audit.db"))
+AUDIT_PAGE_MAX = int(os.environ.get("AUDIT_PAGE_MAX", "1000"))
+
+# Per-request profiling (X-Profile: 1 or ?profile=1, with X-API-Key): pstats files under PROFILE_DIR
+# ("" disables), newest PROFILE_KEEP kept; listed and downloaded from /admin/profiles
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "100"))
+
+# Always-on stack sampler behind /admin/flamegraph: SAMPLER_HZ samples a second (0 disables), kept in
+# SAMPLER_WINDOWS windows of SAMPLER_WINDOW_SECONDS; it slows down if it uses more than SAMPLER_MAX_OVERHEAD of a core
+SAMPLER_HZ = float(os.environ.get("SAMPLER_HZ", "10"))
+SAMPLER_WINDOW_SECONDS = int(os.environ.get("SAMPLER_WINDOW_SECONDS", "60"))
+SAMPLER_WINDOWS = int(os.environ.get("SAMPLER_WINDOWS", "60"))
+SAMPLER_MAX_OVERHEAD = float(os.environ.get("SAMPLER_MAX_OVERHEAD", "0.01"))
+
+# Startup: the port opens right away and warm_caches() (credential, font, pyHanko/fitz, one throwaway
+# signature per signing path) runs in the background; GET /ready answers 503 until it is done.
+# WARMUP_ON_STARTUP=0 skips it (everything then loads on first use) and /ready is ready at once.
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "1") == "1"
+
+# Stamp font: FONT_FILE if set, else the first of FONT_NAMES found through fontconfig or in FONT_DIRS and the
+# system font folders (none found: pyHanko's built-in font). A stamp whose text the font can't render uses the
+# first of FALLBACK_FONTS that can (non-Latin signer names). Parsed font data and subsets are kept under
+# FONT_CACHE_DIR, shared by workers and restarts ("" keeps them in memory only).
+FONT_FILE = os.environ.get("FONT_FILE", "")
+FONT_NAMES = os.environ.get("FONT_NAMES", "Calibri,Arial,Liberation Sans,DejaVu Sans,Noto Sans").split(",")
+FONT_DIRS = [d for d in os.environ.get("FONT_DIRS", "").split(os.pathsep) if d]
+FALLBACK_FONTS = os.environ.get(
+    "FALLBACK_FONTS",
+    "Noto Sans Arabic,Noto Sans Hebrew,Noto Sans Devanagari,Noto Sans Thai,Noto Sans CJK SC,Noto Sans SC,DejaVu Sans",
+).split(",")
+FONT_CACHE_DIR = os.environ.get("FONT_CACHE_DIR", os.path.join("cache", "fonts"))
+
+# Deferred signing of multi-sign turns: after the upload and after each signature the next turn's document
+# (field, stamp, byte range, digest) is prepared in the background, so the signer's request only computes
+# the CMS. Covers single_revision turns and one-location turns. Opt-in (DEFERRED_SIGNING=1): prepared
+# stamps show no time line, since the document is written before the signer signs (the CMS carries the time)
+DEFERRED_SIGNING = os.environ.get("DEFERRED_SIGNING", "0") == "1"
+# prepared documents of turns nobody signed (abandoned sessions, killed workers) are deleted after
+# PREPARED_MAX_AGE seconds; checked every PREPARED_SWEEP_INTERVAL seconds
+PREPARED_MAX_AGE = int(os.environ.get("PREPARED_MAX_AGE", str(24 * 3600)))
+PREPARED_SWEEP_INTERVAL = int(os.environ.get("PREPARED_SWEEP_INTERVAL", "3600"))
 
 
 # Create uploads directory if it doesn't exist
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(SESSION_DIR, exist_ok=True)
+os.makedirs(SIGNING_WORKSPACE, exist_ok=True)
 
 # Check if required files exist
 if not os.path.exists(PFX_FILE):
     raise FileNotFoundError(f"Certificate file not found: {PFX_FILE}")
 
-if not os.path.exists(FONT_FILE):
-    # Try alternative font paths
-    alternative_fonts = [
-        "C:/Windows/Fonts/arial.ttf",
-        "C:/Windows/Fonts/times.ttf",
-        "C:/Windows/Fonts/tahoma.ttf"
-    ]
-
-    for font_path in alternative_fonts:
-        if os.path.exists(font_path):
-            FONT_FILE = font_path
-            break
+# Signing credential is parsed once (warm-up or first signature) and shared, reloaded only when the PFX changes
+credentials = CredentialManager(PFX_FILE, PFX_PASSWORD)
+
+# Stamp fonts are looked up and loaded on first use (warm-up or first signature)
+fonts = FontSet(FONT_FILE, FONT_NAMES, FALLBACK_FONTS, FONT_DIRS, FONT_CACHE_DIR)
+
+
+@lru_cache(maxsize=None)
+def single_sign_stamp_style(font):
+    # /sign/file stamp: identical for every document, so built once per font
+    from pyhanko.pdf_utils import layout
+    from pyhanko.pdf_utils.text import TextBoxStyle
+    from pyhanko.stamp import TextStampStyle
+
+    return TextStampStyle(
+        stamp_text="Signed by:\n %(signer)s\nDate: %(ts)s",
+        text_box_style=TextBoxStyle(
+            font=font,
+            font_size=12,
+            border_width=1,
+
+            # Add this box_layout_rule for wrapping and scaling
+            box_layout_rule=layout.SimpleBoxLayoutRule(
+                x_align=layout.AxisAlignment.ALIGN_MIN, # Align text to the left
+                y_align=layout.AxisAlignment.ALIGN_MIN,  # Align text to the top
+                margins=layout.Margins(left=5, right=5, top=5, bottom=5), # Add some padding
+                inner_content_scaling=layout.InnerScaling.SHRINK_TO_FIT # THIS IS KEY for wrapping/shrinking
+            )
+
+        ),
+        background=None,
+        background_opacity=0.5
+    )
+
+
+@lru_cache(maxsize=None)
+def signer_stamp_style(font, show_time=True):
+    # /multi-sign stamp: the signer's name and email above the certificate subject and time. One template
+    # per font; the signer comes in through the text parameters (see signer_stamp)
+    from pyhanko.pdf_utils import layout
+    from pyhanko.pdf_utils.text import TextBoxStyle
+    from pyhanko.stamp import TextStampStyle
+
+    return TextStampStyle(
+        stamp_text=("%(signer_name)s (%(signer)s)\n"
+            "%(signer_email)s"
+            + ("\n%(ts)s" if show_time else "")),
+        text_box_style=TextBoxStyle(
+            font=font,
+            font_size=8, 
+            box_layout_rule=layout.SimpleBoxLayoutRule(
+                x_align=layout.AxisAlignment.ALIGN_MIN,
+                y_align=layout.AxisAlignment.ALIGN_MIN,
+                margins=layout.Margins(left=3, right=3, top=3, bottom=3),
+                inner_content_scaling=layout.InnerScaling.SHRINK_TO_FIT
+            )
+        )
+    )
+
+
+def single_sign_stamp(signer):
+    return single_sign_stamp_style(fonts.factory_for(signer.subject_name))
+
+
+def signer_stamp(signer, signer_name, signer_email, show_time=True):
+    """(style, extra text params) of a signer's /multi-sign stamp; the font covers all of its text."""
+    font = fonts.factory_for(f"{signer_name} {signer_email} {signer.subject_name}")
+    return signer_stamp_style(font, show_time), {"signer_name": signer_name, "signer_email": signer_email}
+
+
+def turn_field_name(signer_email, current_index, location_index=None):
+    field_name = f"{signer_email.replace('@','_').replace('.','_')}_sig_{current_index}"
+    return field_name if location_index is None else f"{field_name}_{location_index}"
+
+
+def warm_caches():
+    """
+    Pays the first-request costs up front (blocking): PFX parse, pyHanko and fitz imports, font
+    tables and one throwaway in-memory signature on each signing path. Returns seconds per step.
+    """
+    steps = {}
+
+    def timed(name, fn, *args):
+        started = time.perf_counter()
+        result = fn(*args)
+        steps[name] = round(time.perf_counter() - started, 3)
+        return result
+
+    def import_signing_modules():
+        import fitz
+        import anchor_index, widget_signing  # noqa: F401  (pyHanko signing, fitz)
+        with fitz.open() as doc:
+            doc.new_page()
+            return doc.tobytes()
+
+    def sign_file(blank):
+        from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+        from pyhanko.sign import fields, PdfSigner, PdfSignatureMetadata
+        from widget_signing import sign_pdf_in_stages
+
+        w = IncrementalPdfFileWriter(io.BytesIO(blank), strict=False)
+        fields.append_signature_field(w, sig_field_spec=fields.SigFieldSpec("Warmup", box=(400, 50, 580, 150)))
+        pdf_signer = PdfSigner(PdfSignatureMetadata(field_name="Warmup"), signer=signer, stamp_style=single_sign_stamp(signer))
+        sign_pdf_in_stages(pdf_signer, w, io.BytesIO())
+
+    def multi_sign(blank):
+        from widget_signing import sign_multi_widget
+
+        stamp_style, text_params = signer_stamp(signer, "Warmup", "warmup@example.com")
+        sign_multi_widget(io.BytesIO(blank), io.BytesIO(), signer, "Warmup", [(0, 100, 200)], stamp_style, text_params)
+
+    # the throwaway signatures don't belong in /metrics
+    with metrics.capture():
+        signer = timed("credential", credentials.get_signer)
+        timed("font", fonts.load)
+        blank = timed("imports", import_signing_modules)
+        timed("sign_file", sign_file, blank)
+        timed("multi_sign", multi_sign, blank)
+    return steps
+
+
+sessions = open_session_store(
+    SESSION_BACKEND, SESSION_DIR, SESSION_DB, SESSION_SNAPSHOT_EVERY, SESSION_COMMIT_INTERVAL_MS / 1000, SESSION_CACHE_SIZE,
+    SESSION_ARCHIVE_AFTER
+)
+
+signing_executor = SigningExecutor(SIGNING_WORKERS, SIGNING_QUEUE_DEPTH, SIGNING_MAX_TASKS_PER_WORKER)
+jobs = JobManager(JOB_WORKERS, JOB_QUEUE_LIMIT, JOB_HISTORY)
+set_progress_handler(jobs.update_progress)
+
+# Saturation, read when /metrics is scraped
+metrics.registry.register(metrics.Gauge(
+    "signing_executor_in_flight", "Signing calls running or waiting for a signing process or thread",
+    lambda: signing_executor.in_flight
+))
+metrics.registry.register(metrics.Gauge(
+    "signing_executor_capacity",
+    "Signing calls allowed in flight before 503 (process mode), or threads in the shared thread pool (thread mode)",
+    lambda: signing_executor.capacity
+))
+metrics.registry.register(metrics.Gauge(
+    "signing_jobs", "Background jobs by state", lambda: {(k,): v for k, v in jobs.counts().items()}, ["state"]
+))
+
+
+stack_sampler = sampler.Sampler(SAMPLER_HZ, SAMPLER_WINDOW_SECONDS, SAMPLER_WINDOWS, SAMPLER_MAX_OVERHEAD)
+
+
+@app.on_event("startup")
+async def start_stack_sampler():
+    # before the signing pool forks, so workers inherit it and sample themselves
+    sampler.install(stack_sampler)
+
+
+# Readiness for /ready; import_seconds covers this module and everything it imports
+startup_state = {
+    "ready": False,
+    "import_seconds": round(time.perf_counter() - IMPORT_STARTED, 3),
+    "warmup_seconds": None,
+    "warmup_steps": {},
+    "error": None,
+}
+warm_up_task = None
+
+
+async def warm_up_and_start_executor():
+    started = time.perf_counter()
+    try:
+        startup_state["warmup_steps"] = await run_in_threadpool(warm_caches)
+        startup_state["warmup_seconds"] = round(time.perf_counter() - started, 3)
+        print(f"Warm-up done in {startup_state['warmup_seconds']}s: {startup_state['warmup_steps']}")
+    except Exception as e:
+        # stays not ready: this instance can't sign
+        startup_state["error"] = f"Warm-up failed: {e}"
+        print(startup_state["error"])
+    # Forking after the warm-up means credential, font engine and pyHanko are already loaded in the workers
+    signing_executor.start()
+    startup_state["ready"] = startup_state["error"] is None
+
+
+@app.on_event("startup")
+async def start_signing_executor():
+    global warm_up_task
+    if WARMUP_ON_STARTUP:
+        # in the background, so the server answers (GET /, /ready -> 503) while it runs
+        warm_up_task = asyncio.create_task(warm_up_and_start_executor())
     else:
-        raise FileNotFoundError(f"No suitable font found. Please check font paths.")
+        signing_executor.start()
+        startup_state["ready"] = True
+
+
+@app.on_event("shutdown")
+async def stop_signing_executor():
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    for task in list(preparations.values()):
+        task.cancel()
+    if prepared_sweep_task is not None:
+        prepared_sweep_task.cancel()
+    signing_executor.shutdown()
+
+
+@app.on_event("shutdown")
+async def close_session_store():
+    # eventlog: writes out the last group commit
+    sessions.close()
+
+
+@app.on_event("shutdown")
+async def flush_audit_log():
+    audit_log.close()
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    # Refuse on Content-Length before the multipart body is read; ingest_upload enforces the exact limit
+    if request.method == "POST" and request.url.path in UPLOAD_LIMITS:
+        limit = UPLOAD_LIMITS[request.url.path]
+        length = request.headers.get("content-length", "")
+        if length.isdigit() and int(length) > limit + UPLOAD_FORM_OVERHEAD:
+            return JSONResponse(status_code=413, content={"detail": f"Upload exceeds the {limit} byte limit"})
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    # Opt-in: the request's blocking work (signing, anchor scan) runs under cProfile, see profiling.py
+    flag = request.headers.get("x-profile") or request.query_params.get("profile")
+    if not flag or flag == "0" or not PROFILE_DIR:
+        return await call_next(request)
+    if not has_api_key(request):
+        return JSONResponse(status_code=403, content={"detail": "Profiling requires a valid X-API-Key"})
+
+    session = profiling.start(PROFILE_DIR, PROFILE_KEEP)
+    response = await call_next(request)
+    name = await run_in_threadpool(session.save, request.scope.get("path_params", {}).get("uuid") or "request")
+    response.headers["X-Profile-Id"] = name
+    return response
+
+
+def route_template(scope):
+    # label by route ("/multi-sign/sign/{uuid}/{signer_email}"), not by raw path
+    for route in app.router.routes:
+        if route.matches(scope)[0] == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    # Outermost middleware (registered last): latency and in-flight count per route, and the request's
+    # stage timings; wraps profiling and the upload size check, so profiled and rejected requests count too
+    record = metrics.begin_request(route_template(request.scope))
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.end_request(record, request.method, status, time.perf_counter() - started)
+
+
+def has_api_key(request: Request):
+    return secrets.compare_digest(request.headers.get("x-api-key", ""), APIKEY)
+
+
+def require_api_key(request: Request):
+    if not has_api_key(request):
+        raise HTTPException(status_code=403, detail="Missing or invalid X-API-Key")
+
+
+@app.get("/admin/profiles")
+async def list_profiles(request: Request):
+    require_api_key(request)
+    return {"profiles": profiling.list_profiles(PROFILE_DIR) if PROFILE_DIR else []}
+
+
+@app.get("/admin/profiles/{name}")
+async def get_profile(request: Request, name: str, format: str = "pstats", sort: str = "cumulative"):
+    # format=pstats: the raw file (snakeviz, python -m pstats); format=text: top functions sorted by `sort`
+    require_api_key(request)
+    path = os.path.join(PROFILE_DIR, os.path.basename(name))
+    if not PROFILE_DIR or not name.endswith(".prof") or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "text":
+        try:
+            return PlainTextResponse(await run_in_threadpool(profiling.summary_text, path, sort))
+        except KeyError:
+            raise HTTPException(status_code=400, detail=f"Unknown sort key: {sort}")
+    return FileResponse(path, media_type="application/octet-stream", filename=os.path.basename(path))
+
 
-try:
-    font_engine = opentype.GlyphAccumulatorFactory(FONT_FILE)
-    print(f"Font loaded successfully: {FONT_FILE}")
-except Exception as e:
-    print(f"Error loading font: {e}")
-    font_engine = None
+@app.get("/admin/flamegraph")
+async def flamegraph(request: Request, seconds: int = 300, format: str = "svg"):
+    # Stacks sampled over the last `seconds`: format=svg (flame graph), collapsed (flamegraph.pl / speedscope), or stats
+    require_api_key(request)
+    if format == "stats":
+        return stack_sampler.stats()
+    stacks = stack_sampler.collapsed(seconds)
+    if format == "collapsed":
+        return PlainTextResponse(sampler.render_collapsed(stacks))
+    if format == "svg":
+        return Response(await run_in_threadpool(sampler.render_svg, stacks), media_type="image/svg+xml")
+    raise HTTPException(status_code=400, detail="format must be svg, collapsed or stats")
 
-def process_signing(pdf_bytes: bytes, original_filename: str, department: str, document_type: str, request_id: str):
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+def temp_input_path_for(timestamp: str, token: str):
+    return os.path.normpath(os.path.join(SIGNING_WORKSPACE, f"temp_input_{timestamp}_{token}.pdf"))
+
+
+def process_signing(pdf_bytes, original_filename: str, department: str, document_type: str, request_id: str, log_event: bool = True):
+    # In-memory entry point (batch items, shared-memory handoff): validated first, signed from a buffer, no temp input file
+    # pdf_bytes is bytes, or a memoryview over shared memory when signing in a worker process
+    if bytes(pdf_bytes[:4]) != b"%PDF":
+        raise HTTPException(status_code=400, detail="Invalid PDF file")
+
+    return sign_pdf_stream(io.BytesIO(pdf_bytes), original_filename, department, document_type, request_id, log_event)
+
+
+def sign_pdf_file(input_path: str, original_filename: str, department: str, document_type: str, request_id: str, log_event: bool = True):
+    # Signs a streamed upload already on disk; the caller owns input_path
+    with open(input_path, "rb") as inf:
+        return sign_pdf_stream(inf, original_filename, department, document_type, request_id, log_event)
+
+
+def sign_pdf_stream(input_stream, original_filename: str, department: str, document_type: str, request_id: str, log_event: bool = True):
+    from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+    from pyhanko.sign import fields, PdfSigner, PdfSignatureMetadata
+    from widget_signing import sign_pdf_in_stages
+
+    started = time.perf_counter()
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    temp_input_path = os.path.normpath(os.path.join(UPLOAD_DIR, f"temp_input_{timestamp}.pdf"))
-    output_filename = f"signed_{timestamp}_{original_filename}"
+    # random token keeps concurrent requests within the same second from sharing files
+    token = secrets.token_hex(4)
+    output_filename = f"signed_{timestamp}_{token}_{original_filename}"
     output_path = os.path.normpath(os.path.join(UPLOAD_DIR, output_filename))
 
-    with open(temp_input_path, "wb") as temp_input:
-        temp_input.write(pdf_bytes)
+    with stage("credential_load"):
+        signer, cert_subject = credentials.get()
+
+    w = IncrementalPdfFileWriter(input_stream, strict=False)
+    metrics.set_page_count(int(w.root["/Pages"]["/Count"]))
+
+    with stage("field_append"):
+        fields.append_signature_field(
+            w,
+            sig_field_spec=fields.SigFieldSpec("MyCustomSignaturefield", box=(400, 50, 580, 150))
+        )
+
+    meta = PdfSignatureMetadata(field_name="MyCustomSignaturefield")
+    pdf_signer = PdfSigner(meta, signer=signer, stamp_style=single_sign_stamp(signer))
 
-    with open(PFX_FILE, 'rb') as f:
-        pfx_data = f.read()
+    try:
+        with open(output_path, "wb") as outf:
+            sign_pdf_in_stages(pdf_signer, w, outf)
+    except Exception:
+        # don't leave a half-written signed_* file in the upload store
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
 
-    private_key, certificate, _ = pkcs12.load_key_and_certificates(
-        pfx_data, PFX_PASSWORD.encode('utf-8')
+    log_row = signing_log_row(
+        timestamp=timestamp,
+        original_file=original_filename,
+        signed_file=output_filename,
+        cert_subject=cert_subject,
+        status="success",
+        department=department,
+        document_type=document_type,
+        request_id=request_id,
+        duration_ms=round((time.perf_counter() - started) * 1000, 1)
     )
 
-    cert_subject = certificate.subject.rfc4514_string()
+    result = {
+        "message": "PDF signed successfully",
+        "signed_file_path": output_path,
+        "download_url": f"/download/{output_filename}"
+    }
+    if log_event:
+        write_signing_log([log_row])
+    else:
+        # caller (e.g. /sign/batch) writes the rows itself, many at a time
+        result["log_row"] = log_row
+    return result
 
 
-    cert_pem = certificate.public_bytes(serialization.Encoding.PEM)
-    with tempfile.NamedTemporaryFile(mode='wb', suffix='.pem', delete=False) as cert_file:
-        cert_file.write(cert_pem)
-        cert_file_path = cert_file.name
+def sign_signer_locations(input_path: str, output_path: str, signer_email: str, signer_name: str, current_index: int, placements: list, signing_mode: str, job_id: str = None):
+    # Blocking signing stage of /multi-sign/sign; runs on signing_executor (thread or forked worker)
+    from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+    from pyhanko.sign import PdfSigner, PdfSignatureMetadata
+    from pyhanko.stamp import NoOpStampStyle
+    from widget_signing import append_field_with_appearance, sign_multi_widget, sign_pdf_in_stages, stamp_text_params
 
-    with tempfile.NamedTemporaryFile(mode='wb', suffix='.key', delete=False) as key_file:
-        key_pem = private_key.private_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PrivateFormat.PKCS8,
-            encryption_algorithm=serialization.NoEncryption()
-        )
-        key_file.write(key_pem)
-        key_file_path = key_file.name
+    # placements come from the session's anchor index: anchors are already applied, no text search here
+    base_path, _ = os.path.splitext(input_path)
 
-    try:
+    # Sign each location separately
+    current_file_path = input_path
 
-        if not pdf_bytes.startswith(b"%PDF"):
-            raise HTTPException(status_code=400, detail="Invalid PDF file")
+    try:
+        # Shared in-memory signing credential (see credential_manager.py)
+        with stage("credential_load"):
+            signer_obj = credentials.get_signer()
+        stamp_style, signer_params = signer_stamp(signer_obj, signer_name, signer_email)
+
+        if signing_mode == "single_revision":
+            # All locations become widgets of one field: one write, one CMS
+            field_name = turn_field_name(signer_email, current_index)
+
+            with open(input_path, "rb") as inf, open(output_path, "wb") as outf:
+                sign_multi_widget(inf, outf, signer_obj, field_name, placements, stamp_style, signer_params)
+            print(f"Signed {len(placements)} locations in one revision: {output_path}, size: {os.path.getsize(output_path)}")
+            report_progress(job_id, len(placements), len(placements))
+
+        else:
+            # The stamp is rendered into the first revision with the turn's start time; later fields
+            # point at that XObject, so the font subset and appearance are embedded once per signer
+            text_params = stamp_text_params(signer_obj, stamp_style, datetime.now().astimezone(), signer_params)
+            appearance = None
+            for idx, placement in enumerate(placements):
+                field_name = turn_field_name(signer_email, current_index, idx)
 
-        signer = signers.SimpleSigner.load(
-            key_file=key_file_path,
-            cert_file=cert_file_path,
-        )
+                # Determine output path for this signature
+                if idx == len(placements) - 1:
+                    # Last signature goes to final output
+                    temp_output_path = output_path
+                else:
+                    # Intermediate signatures go to temp files
+                    temp_output_path = f"{base_path}_temp_{current_index}_{idx}.pdf"
 
-        with open(temp_input_path, "rb") as inf:
-            w = IncrementalPdfFileWriter(inf, strict=False)
+                # Create new writer for each signature
+                with open(current_file_path, "rb") as inf:
+                    w = IncrementalPdfFileWriter(inf, strict=False)
 
-            fields.append_signature_field(
-                w,
-                sig_field_spec=fields.SigFieldSpec("MyCustomSignaturefield", box=(400, 50, 580, 150))
-            )
+                    # Add signature field with the (shared) stamp appearance
+                    with stage("field_append"):
+                        appearance = append_field_with_appearance(
+                            w, field_name, placement, stamp_style, text_params, appearance
+                        )
 
-            meta = PdfSignatureMetadata(field_name="MyCustomSignaturefield")
-            text_stamp_style = TextStampStyle(
-                stamp_text="Signed by:\n %(signer)s\nDate: %(ts)s",
-                text_box_style=TextBoxStyle(
-                    font=font_engine if font_engine else None,
-                    font_size=12,
-                    border_width=1,
-
-                    # Add this box_layout_rule for wrapping and scaling
-                    box_layout_rule=layout.SimpleBoxLayoutRule(
-                        x_align=layout.AxisAlignment.ALIGN_MIN, # Align text to the left
-                        y_align=layout.AxisAlignment.ALIGN_MIN,  # Align text to the top
-                        margins=layout.Margins(left=5, right=5, top=5, bottom=5), # Add some padding
-                        inner_content_scaling=layout.InnerScaling.SHRINK_TO_FIT # THIS IS KEY for wrapping/shrinking
+                    # Create PDF signer; NoOpStampStyle keeps the appearance set above
+                    pdf_signer = PdfSigner(
+                        PdfSignatureMetadata(field_name=field_name),
+                        signer=signer_obj,
+                        stamp_style=NoOpStampStyle()
                     )
 
-                ),
-                background=None,
-                background_opacity=0.5
-            )
+                    # Sign the PDF
+                    with open(temp_output_path, "wb") as outf:
+                        sign_pdf_in_stages(pdf_signer, w, outf)
 
-            pdf_signer = PdfSigner(meta, signer=signer, stamp_style=text_stamp_style)
+                print(f"Signature {idx + 1} created: {temp_output_path}, size: {os.path.getsize(temp_output_path) if os.path.exists(temp_output_path) else 'NOT FOUND'}")
 
-            with open(output_path, "wb") as outf:
-                pdf_signer.sign_pdf(w, output=outf, in_place=False)
-        
-        log_signing_event(
-            timestamp=timestamp,
-            original_file=original_filename,
-            signed_file=output_filename,
-            cert_subject=cert_subject,
-            status="success"
-        )
+                # Update current file path for next iteration
+                current_file_path = temp_output_path
+                report_progress(job_id, idx + 1, len(placements))
 
-        return {
-            "message": "PDF signed successfully",
-            "signed_file_path": output_path,
-            "download_url": f"/download/{output_filename}"
-        }
+            # Clean up temporary files (but keep the final output)
+            for idx in range(len(placements) - 1):
+                temp_file = f"{base_path}_temp_{current_index}_{idx}.pdf"
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+                    print(f"Cleaned up temp file: {temp_file}")
 
+    except Exception as e:
+        # Clean up any temp files and the half-written output in case of error
+        for idx in range(len(placements)):
+            temp_file = f"{base_path}_temp_{current_index}_{idx}.pdf"
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise e
+
+
+def turn_identity(input_path, signer_email, signer_name, current_index, placements, signing_mode, cert_subject):
+    # what a prepared turn was made for; finish_turn only uses a preparation that still matches
+    return {
+        "input_path": os.path.normpath(input_path),
+        "turn": current_index,
+        "signer_email": signer_email,
+        "signer_name": signer_name,
+        "placements": [list(p) for p in placements],
+        "signing_mode": signing_mode,
+        "cert_subject": cert_subject,
+    }
+
+
+def prepare_signer_turn(input_path: str, output_path: str, signer_email: str, signer_name: str, current_index: int, placements: list, signing_mode: str):
+    # Blocking preparation of a deferred turn (see deferred_signing.py); runs on signing_executor
+    from deferred_signing import prepare_turn
+    from widget_signing import stamp_text_params
+
+    signer_obj = credentials.get_signer()
+    stamp_style, signer_params = signer_stamp(signer_obj, signer_name, signer_email, show_time=False)
+    text_params = stamp_text_params(signer_obj, stamp_style, datetime.now().astimezone(), signer_params)
+    field_name = turn_field_name(signer_email, current_index, None if signing_mode == "single_revision" else 0)
+    identity = turn_identity(input_path, signer_email, signer_name, current_index, placements, signing_mode, signer_obj.subject_name)
+    prepare_turn(input_path, output_path, signer_obj, field_name, placements, signing_mode, stamp_style, text_params, identity)
+
+
+def finish_signer_turn(input_path: str, output_path: str, signer_email: str, signer_name: str, current_index: int, placements: list, signing_mode: str, job_id: str = None):
+    # Signs a prepared turn (CMS only); False when there is no usable preparation
+    from deferred_signing import finish_turn
+
+    with stage("credential_load"):
+        signer_obj = credentials.get_signer()
+    identity = turn_identity(input_path, signer_email, signer_name, current_index, placements, signing_mode, signer_obj.subject_name)
+    if not finish_turn(output_path, signer_obj, identity):
+        return False
+    print(f"Signed prepared turn {current_index}: {output_path}, size: {os.path.getsize(output_path)}")
+    report_progress(job_id, len(placements), len(placements))
+    return True
+
+
+def turn_output_path(input_path, current_index):
+    base_path, _ = os.path.splitext(input_path)
+    return f"{base_path}_signed_{current_index}.pdf"
+
+
+def turn_placements(signer):
+    return [tuple(p) for p in signer.get("placements", [])]
+
+
+# (uuid, turn) -> task preparing that turn in this process
+preparations = {}
+
+
+async def prepare_turn_in_background(key, args):
+    # its own metrics record, like a job: the stages don't land on the request that scheduled it
+    stages = metrics.start_record("prepare:multi_sign")
+    try:
+        await signing_executor.run(prepare_signer_turn, *args)
+        print(f"Prepared turn {key[1]} of session {key[0]}")
+        # with several workers the turn may have been signed elsewhere in the meantime
+        session_data = await run_in_threadpool(sessions.get, key[0])
+        if session_data is None or session_data["completed"] or session_data["current_index"] != key[1]:
+            await run_in_threadpool(discard_prepared_turn, args[1])
+    except SigningPoolFull:
+        print(f"Skipped preparing turn {key[1]} of session {key[0]}: signing queue is full")
+    except Exception as e:
+        print(f"Preparing turn {key[1]} of session {key[0]} failed: {e}")
     finally:
-        if os.path.exists(cert_file_path):
-            os.unlink(cert_file_path)
-        if os.path.exists(key_file_path):
-            os.unlink(key_file_path)
-        if os.path.exists(temp_input_path):
-            os.remove(temp_input_path)
-
-def log_signing_event(timestamp, original_file, signed_file, cert_subject, status, error_msg="", department="", document_type="", request_id=""):
-    fieldnames = ["timestamp", "original_file", "signed_file", "signer_name", "department", "document-type", "request_id", "status", "error"]
-
-    log_exists = os.path.exists(LOG_FILE)
-
-    with open(LOG_FILE, mode="a", newline='', encoding="utf-8") as log_file:
-        writer = csv.DictWriter(log_file, fieldnames=fieldnames)
-        if not log_exists:
-            writer.writeheader()
-
-        writer.writerow({
-            "timestamp": timestamp,
-            "original_file": original_file,
-            "signed_file": signed_file,
-            "signer_name": cert_subject,
-            "department": department,
-            "document-type": document_type,
-            "request_id": request_id,
-            "status": status,
-            "error": error_msg
-        })
+        stages.close()
+        preparations.pop(key, None)
+
+
+def schedule_turn_preparation(session_data):
+    """Starts preparing the session's current turn in the background, when it can be deferred."""
+    from deferred_signing import can_prepare
+
+    if not DEFERRED_SIGNING or session_data["completed"]:
+        return
+    current_index = session_data["current_index"]
+    signer = session_data["signers"][current_index]
+    placements = turn_placements(signer)
+    signing_mode = session_data.get("signing_mode", "per_location")
+    if not can_prepare(signing_mode, placements):
+        return
+
+    key = (session_data["uuid"], current_index)
+    input_path = session_data["file_path"]
+    args = (input_path, turn_output_path(input_path, current_index), signer["signer_email"], signer["signer_name"],
+            current_index, placements, signing_mode)
+    preparations[key] = asyncio.ensure_future(prepare_turn_in_background(key, args))
+
+
+def discard_prepared_turn(output_path):
+    from deferred_signing import discard
+
+    discard(output_path)
+
+
+async def sweep_prepared_turns():
+    from deferred_signing import sweep
+
+    while True:
+        try:
+            removed = await run_in_threadpool(sweep, UPLOAD_DIR, PREPARED_MAX_AGE)
+            if removed:
+                print(f"Removed {removed} stale prepared turn files")
+        except Exception as e:
+            print(f"Sweeping prepared turns failed: {e}")
+        await asyncio.sleep(PREPARED_SWEEP_INTERVAL)
+
+
+prepared_sweep_task = None
+
+
+@app.on_event("startup")
+async def start_prepared_sweep():
+    global prepared_sweep_task
+    if DEFERRED_SIGNING:
+        prepared_sweep_task = asyncio.create_task(sweep_prepared_turns())
+
+
+async def sign_prepared_turn(uuid, current_index, placements, signing_mode, turn_args):
+    """Finishes the turn from its preparation, waiting for one still in progress; False if there is none."""
+    from deferred_signing import can_prepare
+
+    if not can_prepare(signing_mode, placements):
+        return False
+    pending = preparations.get((uuid, current_index))
+    if pending is not None:
+        with stage("prepare_wait"):
+            # shielded: a client that goes away doesn't cancel the preparation
+            await asyncio.shield(pending)
+    return await run_in_threadpool(profiling.profiled, finish_signer_turn, *turn_args)
+
+
+LOG_FIELDNAMES = ["timestamp", "original_file", "signed_file", "signer_name", "department", "document-type", "request_id", "status", "error", "duration_ms"]
+
+
+def signing_log_row(timestamp, original_file, signed_file, cert_subject, status, error_msg="", department="", document_type="", request_id="", duration_ms=""):
+    return {
+        "timestamp": timestamp,
+        "original_file": original_file,
+        "signed_file": signed_file,
+        "signer_name": cert_subject,
+        "department": department,
+        "document-type": document_type,
+        "request_id": request_id,
+        "status": status,
+        "error": error_msg,
+        "duration_ms": duration_ms
+    }
+
+
+audit_store = AuditStore(AUDIT_DB) if AUDIT_DB else None
+audit_log = AuditLogWriter(
+    LOG_FILE, LOG_FIELDNAMES, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL, AUDIT_MAX_BYTES, AUDIT_ROTATE_DAILY,
+    sinks=[audit_store.add] if audit_store else []
+)
+
+
+def write_signing_log(rows):
+    # queued for the background writer; no file I/O on the request path
+    with stage("audit_log"):
+        audit_log.submit(rows)
+
+
+def log_signing_event(timestamp, original_file, signed_file, cert_subject, status, error_msg="", department="", document_type="", request_id="", duration_ms=""):
+    write_signing_log([signing_log_row(timestamp, original_file, signed_file, cert_subject, status, error_msg, department, document_type, request_id, duration_ms)])
 
 @app.get("/")
 async def root():
+    # liveness: the process is up (see /ready for whether it should get traffic)
     return {"message": "PDF Signing API is running"}
 
-@app.post("/sign/file")
-async def sign_uploaded_pdf(myfile: UploadFile = File(...), department: str = Form(...), document_type: str = Form(...), request_id: str = Form(...)):
-    if not myfile.filename.endswith(".pdf"):
-        raise HTTPException(status_code=400, detail="Only PDF files are supported.")
 
+@app.get("/ready")
+async def ready():
+    # readiness for load balancers and rolling restarts: 503 until the warm-up has finished
+    return JSONResponse(status_code=200 if startup_state["ready"] else 503, content=startup_state)
+
+async def ingest_single_upload(myfile: UploadFile):
+    # Streams the upload into a uniquely named temp input under SIGNING_WORKSPACE; returns (path, sha256)
+    input_path = temp_input_path_for(datetime.now().strftime("%Y%m%d_%H%M%S"), secrets.token_hex(4))
+    _, sha256 = await ingest_upload(myfile, input_path, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE)
+    return input_path, sha256
+
+
+async def sign_uploaded_file(input_path: str, input_sha256: str, filename: str, department: str, document_type: str, request_id: str, job_id: str = None):
+    # Shared by POST /sign/file and POST /jobs/sign/file; removes input_path when done
+    started = time.perf_counter()
+    profiling.tag(request_id)
     try:
-        pdf_bytes = await myfile.read() 
-        filename = myfile.filename
-        result = await run_in_threadpool(process_signing, pdf_bytes, filename, department, document_type, request_id)
-        # run_in_threadpool makes sure that no other process gets blocked while process_signing is executing + it returns a future object that pauses the function on any obstruction and the await keyword assists by not allowing the system to freeze because of the pausing of process_signing and continues serving other functions/API calls until signing_ready is again ready to execute 
+        # the audit row comes back with the result and is queued here, not written from the signing worker
+        result = await signing_executor.run(sign_pdf_file, input_path, filename, department, document_type, request_id, False)
+        write_signing_log([result.pop("log_row")])
+        result["input_sha256"] = input_sha256
+        # signing_executor.run (run_in_threadpool, or the process pool when configured) makes sure that no other process gets blocked while process_signing is executing + it returns a future object that pauses the function on any obstruction and the await keyword assists by not allowing the system to freeze because of the pausing of process_signing and continues serving other functions/API calls until signing_ready is again ready to execute 
         return result
-    
+
+    except SigningPoolFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
     except Exception as e:
         log_signing_event(
             timestamp=datetime.now().strftime("%Y%m%d_%H%M%S"),
-            original_file=myfile.filename,
+            original_file=filename,
             signed_file="",
             cert_subject="",
             status="failed",
             error_msg=str(e),
             department=department,
             document_type=document_type,
-            request_id=request_id, 
+            request_id=request_id,
+            duration_ms=round((time.perf_counter() - started) * 1000, 1)
         )
         raise HTTPException(status_code=500, detail=f"Signing failed: {str(e)}")
+
+    finally:
+        if os.path.exists(input_path):
+            os.remove(input_path)
+
+
+@app.post("/sign/file")
+async def sign_uploaded_pdf(myfile: UploadFile = File(...), department: str = Form(...), document_type: str = Form(...), request_id: str = Form(...)):
+    if not myfile.filename.endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Only PDF files are supported.")
+
+    input_path, sha256 = await ingest_single_upload(myfile)
+    return await sign_uploaded_file(input_path, sha256, myfile.filename, department, document_type, request_id)
     
 
+async def sign_batch_item(item, semaphore):
+    # each document has its own record (this task's context), so its stages get its own pages bucket
+    stages = metrics.start_record("/sign/batch")
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            result = await signing_executor.run_with_pdf(
+                process_signing, item["pdf"], item["filename"], item["department"], item["document_type"], item["request_id"], False
+            )
+            log_row = result.pop("log_row")
+            outcome = {"status": "success", "download_url": result["download_url"], "signed_file_path": result["signed_file_path"]}
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            log_row = signing_log_row(
+                timestamp=datetime.now().strftime("%Y%m%d_%H%M%S"),
+                original_file=item["filename"],
+                signed_file="",
+                cert_subject="",
+                status="failed",
+                error_msg=str(detail),
+                department=item["department"],
+                document_type=item["document_type"],
+                request_id=item["request_id"],
+                duration_ms=round((time.perf_counter() - started) * 1000, 1)
+            )
+            outcome = {"status": "failed", "error": detail}
+        finally:
+            item["pdf"] = None  # release the upload as soon as this document is done
+            stages.close()
+
+        outcome.update({
+            "index": item["index"],
+            "filename": item["filename"],
+            "request_id": item["request_id"],
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        })
+        return outcome, log_row
+
+
+def write_batch_zip(zip_path, outcomes):
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for outcome in outcomes:
+            if outcome["status"] == "success":
+                zf.write(outcome["signed_file_path"], arcname=os.path.basename(outcome["signed_file_path"]))
+        zf.writestr("results.json", json.dumps(outcomes, indent=4))
+
+
+@app.post("/sign/batch")
+async def sign_batch(
+    myfiles: List[UploadFile] = File(None),
+    archive: UploadFile = File(None),
+    manifest: str = Form(None),
+    department: str = Form(""),
+    document_type: str = Form(""),
+    output: str = Form("ndjson")
+):
+    # output=ndjson streams one result line per document as it finishes; output=zip returns the signed PDFs
+    if output not in ("ndjson", "zip"):
+        raise HTTPException(status_code=400, detail="output must be 'ndjson' or 'zip'")
+
+    batch_id = f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(4)}"
+    profiling.tag(batch_id)
+    # the request's own stages (upload, audit log) span documents of any size
+    metrics.set_page_count("batch")
+    with stage("upload_read"):
+        items = await read_batch_items(
+            myfiles, archive, manifest, department, document_type, batch_id, BATCH_MAX_FILES, MAX_UPLOAD_BYTES, BATCH_MAX_BYTES
+        )
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    tasks = [asyncio.ensure_future(sign_batch_item(item, semaphore)) for item in items]
+
+    if output == "zip":
+        results = await asyncio.gather(*tasks)
+        # one log file open for the whole batch
+        write_signing_log([log_row for _, log_row in results])
+        outcomes = [outcome for outcome, _ in results]
+
+        zip_path = os.path.normpath(os.path.join(UPLOAD_DIR, f"{batch_id}.zip"))
+        await run_in_threadpool(write_batch_zip, zip_path, outcomes)
+        return FileResponse(path=zip_path, filename=f"{batch_id}.zip", media_type="application/zip")
+
+    async def stream_results():
+        log_rows = []
+        succeeded = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                outcome, log_row = await next_done
+                log_rows.append(log_row)
+                succeeded += outcome["status"] == "success"
+                outcome.pop("signed_file_path", None)
+                yield json.dumps(outcome) + "\n"
+
+            yield json.dumps({"batch_id": batch_id, "total": len(items), "succeeded": succeeded, "failed": len(items) - succeeded}) + "\n"
+        finally:
+            # client went away: don't keep signing for nobody
+            for task in tasks:
+                task.cancel()
+            if log_rows:
+                write_signing_log(log_rows)
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
 @app.get("/download/{filename}")
 async def download_file(filename: str):
     file_path = os.path.normpath(os.path.join(UPLOAD_DIR, filename))
@@ -240,7 +988,8 @@ async def upload_multi_sign_file(
     initiator_workid: str = Form(...),
     initiator_work_dept: str = Form(...),
     workflow_id: str = Form(...),
-    signerlist: str = Form(...)
+    signerlist: str = Form(...),
+    signing_mode: str = Form("per_location")
 ):
     try:
         #Saving uploaded PDF
@@ -249,13 +998,17 @@ async def upload_multi_sign_file(
         if cs != expected_cs:
             raise HTTPException(status_code=403, detail="Invalid checksum or unauthorized request")
 
-        pdf_bytes = await myfile.read()
+        # per_location: one signature per location; single_revision: all of a signer's locations in one signature
+        if signing_mode not in ("per_location", "single_revision"):
+            raise HTTPException(status_code=400, detail="signing_mode must be 'per_location' or 'single_revision'")
+
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         file_name = f"{uuid}_{timestamp}_{myfile.filename}"
         file_path = os.path.join(UPLOAD_DIR, file_name).replace("\\", "/")  # Normalize path
 
-        with open(file_path, "wb") as f:
-            f.write(pdf_bytes)
+        profiling.tag(uuid)
+        # streamed straight into the upload store; hash and %PDF check happen as it is written
+        file_size, file_sha256 = await ingest_upload(myfile, file_path, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE)
 
         # Parsing signer list from JSON string
         try:
@@ -274,6 +1027,19 @@ async def upload_multi_sign_file(
             signer["status"] = "pending"
             signer["signed_at"] = None
 
+        # Resolve anchors and page geometry once, so signing needs no text search and bad pages fail here
+        from anchor_index import build_anchor_index
+
+        try:
+            with stage("anchor_search"):
+                page_index = await run_in_threadpool(
+                    profiling.profiled, build_anchor_index, file_path, signer_list, signing_mode, file_sha256, ANCHOR_SCAN_WORKERS
+                )
+            metrics.set_page_count(page_index["page_count"])
+        except ValueError as e:
+            os.remove(file_path)
+            raise HTTPException(status_code=400, detail=f"Invalid signer locations: {e}")
+
         # session data ka creatiion
         session_data = {
             "uuid": uuid,
@@ -285,23 +1051,21 @@ async def upload_multi_sign_file(
             "workflow_id": workflow_id,
             "created_at": timestamp,
             "file_path": os.path.normpath(file_path),
+            "file_size": file_size,
+            "file_sha256": file_sha256,
+            "page_count": page_index["page_count"],
+            "page_sizes": page_index["page_sizes"],
             "signers": signer_list,
             "current_index": 0,
+            "signing_mode": signing_mode,
             "completed": False
         }
 
-        # Saving session file
-        session_file_path = os.path.join(SESSION_DIR, f"{uuid}.json")
-        print(f"Creating session file at: {session_file_path}")  # Debugging log
-
-        with open(session_file_path, "w", encoding="utf-8") as f:
-            json.dump(session_data, f, indent=4)
-
-        if not os.path.exists(session_file_path):
-            print(f"Session file was not created: {session_file_path}")  # Log missing file
-            raise HTTPException(status_code=500, detail="Failed to create session file")
-
-        print(f"Session file created successfully: {session_file_path}")  # Log success
+        # Saving session
+        with stage("session_persist"):
+            sessions.create(session_data)
+        print(f"Session created successfully: {uuid} ({SESSION_BACKEND} store)")  # Log success
+        schedule_turn_preparation(session_data)
 
         return {
             "message": "Multi-signer session created successfully",
@@ -310,6 +1074,9 @@ async def upload_multi_sign_file(
             "download_url": f"/multi-sign/download/{uuid}"
         }
 
+    except HTTPException:
+        raise
+
     except Exception as e:
         print(f"Error during session creation: {str(e)}")  # Log error details
         raise HTTPException(status_code=500, detail=str(e))
@@ -317,17 +1084,12 @@ async def upload_multi_sign_file(
 
 @app.get("/multi-sign/download/{uuid}")
 async def download_signed_pdf(uuid: str):
-    session_file_path = os.path.normpath(os.path.join(SESSION_DIR, f"{uuid}.json"))
-    
     print(f"Download requested for UUID: {uuid}")
-    print(f"Looking for session file: {session_file_path}")
-                                     
-    if not os.path.exists(session_file_path):
-        print(f"Session file not found: {session_file_path}")
-        raise HTTPException(status_code=404, detail="Session not found")
 
-    with open(session_file_path, "r", encoding="utf-8") as f:
-        session_data = json.load(f)
+    session_data = sessions.get(uuid)
+    if session_data is None:
+        print(f"Session not found: {uuid}")
+        raise HTTPException(status_code=404, detail="Session not found")
 
     signed_file_path = session_data.get("file_path")
     
@@ -348,21 +1110,18 @@ async def download_signed_pdf(uuid: str):
                 size = os.path.getsize(file_path)
                 print(f"  {file} ({size} bytes)")
 
-    # fallback search for latest signed file with UUID in filename
-    import glob
-    fallback_pattern = os.path.join(UPLOAD_DIR, f"{uuid}_*signed*.pdf")
-    candidate_files = sorted(glob.glob(fallback_pattern), reverse=True)
-    
-    if candidate_files:
-        signed_file_path = os.path.normpath(candidate_files[0])
-        print(f"Using fallback file: {signed_file_path}")
-        
-        # Update session data to reflect the corrected path
-        session_data["file_path"] = signed_file_path
-        with open(session_file_path, "w", encoding="utf-8") as f:
-            json.dump(session_data, f, indent=4)
-    else:
-        raise HTTPException(status_code=404, detail="Signed PDF not found")
+        # fallback search for latest signed file with UUID in filename
+        fallback_pattern = os.path.join(UPLOAD_DIR, f"{uuid}_*signed*.pdf")
+        candidate_files = sorted(glob.glob(fallback_pattern), reverse=True)
+
+        if candidate_files:
+            signed_file_path = os.path.normpath(candidate_files[0])
+            print(f"Using fallback file: {signed_file_path}")
+
+            # Update session data to reflect the corrected path
+            sessions.set_file_path(uuid, signed_file_path)
+        else:
+            raise HTTPException(status_code=404, detail="Signed PDF not found")
 
     
     # Check file size
@@ -382,28 +1141,27 @@ async def download_signed_pdf(uuid: str):
         media_type='application/pdf'
     )
 
-@app.get("/multi-sign/sign/{uuid}/{signer_email}")
-async def sign_document(uuid: str = Path(...), signer_email: str = Path(...)):
-    try:
-        signer_email = unquote(signer_email)  # Decode URL-encoded email
+def load_session(uuid: str, signer_email: str = None):
+    # with signer_email, the session cache can answer completed / not-your-turn without touching the store
+    session_data = sessions.get_for_signer(uuid, signer_email) if signer_email else sessions.get(uuid)
+    if session_data is None:
+        print(f"Session does not exist: {uuid}")  # Log missing session
+        raise HTTPException(status_code=404, detail="Session not found")
 
-        # Ensure SESSION_DIR exists
-        if not os.path.exists(SESSION_DIR):
-            print(f"Session directory does not exist: {SESSION_DIR}")  # Log missing directory
-            raise HTTPException(status_code=500, detail="Session directory not found")
+    print(f"Session loaded: {uuid}, turn {session_data['current_index']}")
+    return session_data
 
-        # Debugging log for session file path
-        session_file_path = os.path.normpath(os.path.join(SESSION_DIR, f"{uuid}.json"))
-        print(f"Looking for session file at: {session_file_path}")
 
-        if not os.path.exists(session_file_path):
-            print(f"Session file does not exist: {session_file_path}")  # Log missing file
-            raise HTTPException(status_code=404, detail="Session not found")
+@app.get("/multi-sign/sign/{uuid}/{signer_email}")
+async def sign_document(uuid: str = Path(...), signer_email: str = Path(...)):
+    return await sign_session_turn(uuid, unquote(signer_email))  # Decode URL-encoded email
 
-        with open(session_file_path, "r", encoding="utf-8") as f:
-            session_data = json.load(f)
 
-        print(f"Session data loaded successfully: {session_data}")  # Log session data
+async def sign_session_turn(uuid: str, signer_email: str, job_id: str = None):
+    # Shared by GET /multi-sign/sign and POST /jobs/multi-sign/sign
+    profiling.tag(uuid)
+    try:
+        session_data = load_session(uuid, signer_email)
 
         if session_data["completed"]:
             return {"message": "Signing already completed for this document."}
@@ -415,160 +1173,171 @@ async def sign_document(uuid: str = Path(...), signer_email: str = Path(...)):
         if signers_list[current_index]["signer_email"] != signer_email:
             raise HTTPException(status_code=403, detail="Not your turn to sign.")
 
-        # Step 3: Load certificate
-        with open(PFX_FILE, 'rb') as f:
-            pfx_data = f.read()
-
-        private_key, certificate, _ = pkcs12.load_key_and_certificates(
-            pfx_data, PFX_PASSWORD.encode('utf-8')
-        )
-
-        cert_pem = certificate.public_bytes(serialization.Encoding.PEM)
-        with tempfile.NamedTemporaryFile(mode='wb', suffix='.pem', delete=False) as cert_file:
-            cert_file.write(cert_pem)
-            cert_file_path = cert_file.name
-
-        with tempfile.NamedTemporaryFile(mode='wb', suffix='.key', delete=False) as key_file:
-            key_pem = private_key.private_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PrivateFormat.PKCS8,
-                encryption_algorithm=serialization.NoEncryption()
-            )
-            key_file.write(key_pem)
-            key_file_path = key_file.name
-
-        # Step 4: Sign at all coordinates
-        signer = signers_list[current_index]
-        input_path = session_data["file_path"]
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        metrics.set_page_count(session_data.get("page_count"))
 
-        base_path, _ = os.path.splitext(input_path)
-        output_path = f"{base_path}_signed_{current_index}.pdf"
+        # Step 3: Reserve the turn, so a concurrent request for it can't sign as well
+        with stage("session_persist"):
+            claim = sessions.claim_turn(uuid, current_index, SIGN_CLAIM_TTL)
+        if claim is None:
+            raise HTTPException(status_code=409, detail="This signing turn is already in progress.")
 
-        print(f"Input path: {input_path}")
-        print(f"Output path: {output_path}")
-
-        # Sign each location separately
-        current_file_path = input_path
-        
         try:
-            signer_obj = signers.SimpleSigner.load(
-                key_file=key_file_path,
-                cert_file=cert_file_path
-            )
+            # Step 4: Sign at all coordinates
+            signer = signers_list[current_index]
+            input_path = session_data["file_path"]
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_path = turn_output_path(input_path, current_index)
+
+            print(f"Input path: {input_path}")
+            print(f"Output path: {output_path}")
+
+            signing_mode = session_data.get("signing_mode", "per_location")
+            if "placements" in signer:
+                placements = turn_placements(signer)
+            else:
+                # session created before upload-time anchor resolution
+                from anchor_index import resolve_single_signer
+
+                try:
+                    with stage("anchor_search"):
+                        placements = await run_in_threadpool(profiling.profiled, resolve_single_signer, input_path, signer, current_index, signing_mode)
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=f"Invalid signer locations: {e}")
+
+            turn_args = (input_path, output_path, signer_email, signer["signer_name"], current_index, placements, signing_mode, job_id)
+            # prepared in the background (deferred signing): only the CMS is left to do
+            signed = DEFERRED_SIGNING and await sign_prepared_turn(uuid, current_index, placements, signing_mode, turn_args)
+            if not signed:
+                try:
+                    await signing_executor.run(sign_signer_locations, *turn_args)
+                except SigningPoolFull as e:
+                    raise HTTPException(status_code=503, detail=str(e))
+
+            # Step 5: Update session (compare-and-swap on current_index)
+            signer["status"] = "signed"
+            signer["signed_at"] = timestamp
+            session_data["current_index"] += 1
+            session_data["file_path"] = os.path.normpath(output_path)
+
+            if session_data["current_index"] >= len(signers_list):##
+                session_data["completed"] = True
+
+            with stage("session_persist"):
+                advanced = sessions.advance_turn(uuid, current_index, claim, session_data)
+            if not advanced:
+                # claim expired and another request took the turn; its result stands
+                raise HTTPException(status_code=409, detail="Session changed while signing; please retry.")
+
+        except BaseException:
+            sessions.release_turn(uuid, claim)
+            raise
+
+        if DEFERRED_SIGNING:
+            # a preparation of this turn another worker made, or one that didn't match, is of no use now
+            await run_in_threadpool(discard_prepared_turn, output_path)
+        schedule_turn_preparation(session_data)
 
-            for idx, loc in enumerate(signer.get("locations", [])):
-                keyword = f"Authorised Signature {current_index + 1}"  # dynamic keyword based on signer order
-                detected = find_keyword_position(current_file_path, keyword)
+        return {
+            "message": f"Document signed by {signer['signer_name']}",
+            "next_signer": (
+                signers_list[session_data["current_index"]]["signer_email"] ##
+                if not session_data["completed"] else None
+            ),
+            "download_url": f"/multi-sign/download/{uuid}"
+        }
 
-                if detected:
-                    print(f"Keyword '{keyword}' found: using auto-detected position")
-                    page = detected["page"]
-                    x, y = detected["x"], detected["y"]
-                else:
-                    print(f"Keyword '{keyword}' NOT found: falling back to hardcoded location")
-                    page = loc["page"] - 1  # fallback
-                    x, y = loc["x"], loc["y"]
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error during signing: {str(e)}")  # Log error details
+        raise HTTPException(status_code=500, detail=str(e))
 
-                box = (x, y, x + 180, y + 50)
-                field_name = f"{signer_email.replace('@','_').replace('.','_')}_sig_{current_index}_{idx}"
-                
-                # Determine output path for this signature
-                if idx == len(signer.get("locations", [])) - 1:
-                    # Last signature goes to final output
-                    temp_output_path = output_path
-                else:
-                    # Intermediate signatures go to temp files
-                    temp_output_path = f"{base_path}_temp_{current_index}_{idx}.pdf"
+@app.post("/jobs/sign/file", status_code=202)
+async def create_sign_file_job(myfile: UploadFile = File(...), department: str = Form(...), document_type: str = Form(...), request_id: str = Form(...)):
+    if not myfile.filename.endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Only PDF files are supported.")
 
-                # Create new writer for each signature
-                with open(current_file_path, "rb") as inf:
-                    w = IncrementalPdfFileWriter(inf, strict=False)
+    input_path, sha256 = await ingest_single_upload(myfile)
+    try:
+        job = jobs.submit(
+            "sign_file",
+            partial(sign_uploaded_file, input_path, sha256, myfile.filename, department, document_type, request_id),
+            total=1
+        )
+    except JobQueueFull as e:
+        os.remove(input_path)
+        raise HTTPException(status_code=503, detail=str(e))
+    return jobs.describe(job)
 
-                    # Add signature field
-                    fields.append_signature_field(
-                        w,
-                        sig_field_spec=fields.SigFieldSpec(field_name, box=box, on_page=page)
-                    )
 
-                    # Create PDF signer with stamp
-                    pdf_signer = PdfSigner(
-                        PdfSignatureMetadata(field_name=field_name),
-                        signer=signer_obj,
-                        stamp_style=TextStampStyle(
-                            stamp_text=(f"{signer['signer_name']} (%(signer)s)\n"
-                                f"{signer['signer_email']}\n"
-                                f"%(ts)s"),
-                            text_box_style=TextBoxStyle(
-                                font=font_engine,
-                                font_size=8, 
-                                box_layout_rule=layout.SimpleBoxLayoutRule(
-                                    x_align=layout.AxisAlignment.ALIGN_MIN,
-                                    y_align=layout.AxisAlignment.ALIGN_MIN,
-                                    margins=layout.Margins(left=3, right=3, top=3, bottom=3),
-                                    inner_content_scaling=layout.InnerScaling.SHRINK_TO_FIT
-                                )
-                            )
-                        )
-                    )
+@app.post("/jobs/multi-sign/sign/{uuid}/{signer_email}", status_code=202)
+async def create_multi_sign_job(uuid: str = Path(...), signer_email: str = Path(...)):
+    signer_email = unquote(signer_email)
 
-                    # Sign the PDF
-                    def blocking_sign_pdf():
-                        with open(temp_output_path, "wb") as outf:
-                            pdf_signer.sign_pdf(w, output=outf)
+    # Reject the obvious cases up front instead of queueing a job that is bound to fail
+    session_data = load_session(uuid, signer_email)
+    if session_data["completed"]:
+        return {"message": "Signing already completed for this document."}
+    signer = session_data["signers"][session_data["current_index"]]
+    if signer["signer_email"] != signer_email:
+        raise HTTPException(status_code=403, detail="Not your turn to sign.")
 
-                    await run_in_threadpool(blocking_sign_pdf)
-                    
-                print(f"Signature {idx + 1} created: {temp_output_path}, size: {os.path.getsize(temp_output_path) if os.path.exists(temp_output_path) else 'NOT FOUND'}")
-                
-                # Update current file path for next iteration
-                current_file_path = temp_output_path
+    try:
+        job = jobs.submit("multi_sign", partial(sign_session_turn, uuid, signer_email), total=len(signer.get("placements", [])) or None)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return jobs.describe(job)
 
-            # Clean up temporary files (but keep the final output)
-            for idx in range(len(signer.get("locations", [])) - 1):
-                temp_file = f"{base_path}_temp_{current_index}_{idx}.pdf"
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-                    print(f"Cleaned up temp file: {temp_file}")
 
-        except Exception as e:
-            # Clean up any temp files in case of error
-            for idx in range(len(signer.get("locations", []))):
-                temp_file = f"{base_path}_temp_{current_index}_{idx}.pdf"
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-            raise e
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.describe(job)
 
-        # Step 5: Update session
-        signer["status"] = "signed"
-        signer["signed_at"] = timestamp
-        session_data["current_index"] += 1
-        session_data["file_path"] = os.path.normpath(output_path)
 
-        if session_data["current_index"] >= len(signers_list):##
-            session_data["completed"] = True
+def audit_query_args(since, until):
+    if audit_store is None:
+        raise HTTPException(status_code=404, detail="Audit store is disabled")
+    try:
+        return (parse_time(since) if since else None), (parse_time(until) if until else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid since/until: {e}")
 
-        with open(session_file_path, "w", encoding="utf-8") as f:
-            json.dump(session_data, f, indent=4)
 
-        # Clean up
-        os.unlink(cert_file_path)
-        os.unlink(key_file_path)
+@app.get("/audit")
+async def query_audit(
+    request: Request, department: str = None, document_type: str = None, status: str = None, request_id: str = None,
+    since: str = None, until: str = None, cursor: int = None, limit: int = 50
+):
+    # Signing events, newest first; since/until take an ISO date/datetime or epoch seconds.
+    # Page with the returned next_cursor (keyset pagination: constant cost however deep)
+    require_api_key(request)
+    since_ts, until_ts = audit_query_args(since, until)
+    filters = {"department": department, "document_type": document_type, "status": status, "request_id": request_id}
+    events, next_cursor = await run_in_threadpool(
+        audit_store.query_events, filters, since_ts, until_ts, cursor, max(1, min(limit, AUDIT_PAGE_MAX))
+    )
+    return {"events": events, "next_cursor": next_cursor}
 
-        return {
-            "message": f"Document signed by {signer['signer_name']}",
-            "next_signer": (
-                signers_list[session_data["current_index"]]["signer_email"] ##
-                if not session_data["completed"] else None
-            ),
-            "download_url": f"/multi-sign/download/{uuid}"
-        }
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"Error during signing: {str(e)}")  # Log error details
-        raise HTTPException(status_code=500, detail=str(e))
+@app.get("/audit/summary")
+async def audit_summary(
+    request: Request, department: str = None, document_type: str = None, status: str = None,
+    since: str = None, until: str = None, group_by: str = ""
+):
+    # Totals and latency from the hourly rollups, e.g. ?department=HR&since=2024-05-01&group_by=status,day
+    require_api_key(request)
+    since_ts, until_ts = audit_query_args(since, until)
+    filters = {"department": department, "document_type": document_type, "status": status}
+    try:
+        rows = await run_in_threadpool(
+            audit_store.summary, filters, since_ts, until_ts, [g.strip() for g in group_by.split(",") if g.strip()]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"rows": rows}
 
 if __name__ == "__main__":
     import uvicorn
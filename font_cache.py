@@ -0,0 +1,377 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+from collections import OrderedDict
+from functools import lru_cache, partial
+from io import BytesIO
+
+# Stamp fonts: discovery on any OS, fallback fonts for text the main font can't render,
+# and a persistent cache of what pyHanko would otherwise work out from the TTF on every stamp.
+#
+# pyHanko's GlyphAccumulatorFactory opens and parses the font for each stamp, then subsets
+# it and recompiles the subset (most of the cost for large fonts like DejaVu Sans or Calibri).
+# Here the font bytes are read once per process, and each subset font program is kept, in
+# memory and under cache_dir, keyed by the font's sha256 and the glyphs it holds. Digits and
+# date punctuation are always added to the subset, so a signer's stamp gets the same glyph
+# set at any time of day. Per font, cache_dir also keeps a small JSON of parsed metadata
+# (PostScript name, covered code points, those glyph ids): choosing a fallback font or
+# starting a worker needs no font parsing.
+
+FONT_EXTENSIONS = (".ttf", ".otf")  # pyHanko can't embed from collections (.ttc)
+SYSTEM_FONT_DIRS = {
+    "nt": [os.path.join(os.environ.get("WINDIR", "C:/Windows"), "Fonts")],
+    "posix": [
+        "/usr/share/fonts", "/usr/local/share/fonts", os.path.expanduser("~/.local/share/fonts"),
+        os.path.expanduser("~/.fonts"), "/Library/Fonts", "/System/Library/Fonts",
+    ],
+}
+# always in the subset: stamp timestamps and email addresses
+PAD_CHARS = "0123456789 :-+./()@_"
+SUBSET_MEMORY_ENTRIES = 256
+SUBSET_DISK_ENTRIES = 5000
+
+
+def _norm(name):
+    return "".join(ch for ch in name.lower() if ch.isalnum())
+
+
+def fontconfig_lookup(name):
+    """Path of the font fontconfig matches for a family name, if it really is that family."""
+    if not shutil.which("fc-match"):
+        return None
+    try:
+        out = subprocess.run(
+            ["fc-match", "-f", "%{family}\n%{file}", name], capture_output=True, text=True, timeout=5
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    lines = out.splitlines()
+    if len(lines) < 2:
+        return None
+    # fc-match always answers with something; only accept the family asked for
+    families = [_norm(f) for f in lines[0].split(",")]
+    path = lines[1]
+    if _norm(name) in families and path.lower().endswith(FONT_EXTENSIONS):
+        return path
+    return None
+
+
+def _scan_dirs(dirs):
+    """{normalized file name without extension: path} of every font file under dirs (first one wins)."""
+    found = {}
+    for directory in dirs:
+        for root, _, files in os.walk(directory):
+            for file in sorted(files):
+                stem, ext = os.path.splitext(file)
+                if ext.lower() in FONT_EXTENSIONS:
+                    found.setdefault(_norm(stem), os.path.join(root, file))
+    return found
+
+
+def find_fonts(names, font_dirs=()):
+    """
+    Resolves font names or paths to existing .ttf/.otf files, in order, skipping the ones not found.
+    A name is looked up through fontconfig, then by file name ("DejaVu Sans" -> DejaVuSans.ttf,
+    "Liberation Sans" -> LiberationSans-Regular.ttf) in font_dirs and the system font folders.
+    """
+    files = None
+    paths = []
+    for name in names:
+        name = name.strip()
+        if not name:
+            continue
+        if os.path.isfile(name):
+            path = name
+        else:
+            path = fontconfig_lookup(name)
+            if path is None:
+                if files is None:
+                    files = _scan_dirs(list(font_dirs) + SYSTEM_FONT_DIRS.get(os.name, []))
+                key = _norm(name)
+                path = files.get(key) or files.get(key + "regular")
+        if path and path not in paths:
+            paths.append(path)
+    return paths
+
+
+class SubsetCache:
+    """Subset font programs by (font sha256, glyph ids): an in-memory LRU over files in directory."""
+
+    def __init__(self, directory, memory_entries=SUBSET_MEMORY_ENTRIES, disk_entries=SUBSET_DISK_ENTRIES):
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, font_hash, gids):
+        key = hashlib.sha256(",".join(map(str, gids)).encode()).hexdigest()[:32]
+        return os.path.join(self.directory, font_hash[:16], f"{key}.ttf")
+
+    def get(self, font_hash, gids):
+        key = (font_hash, gids)
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(font_hash, gids), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def put(self, font_hash, gids, data):
+        self._remember((font_hash, gids), data)
+        if not self.directory:
+            return
+        path = self._path(font_hash, gids)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # other workers may read it any moment: write aside, then rename; threads of one
+            # process can store the same subset at once, so the temp name is per thread
+            tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            self._prune(os.path.dirname(path))
+        except OSError as e:
+            print(f"Font subset cache write failed: {e}")
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _prune(self, directory):
+        entries = [e for e in os.scandir(directory) if e.name.endswith(".ttf")]
+        if len(entries) <= self.disk_entries:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[: len(entries) - self.disk_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def _ranges(codepoints):
+    ranges = []
+    for cp in sorted(codepoints):
+        if ranges and cp == ranges[-1][1] + 1:
+            ranges[-1][1] = cp
+        else:
+            ranges.append([cp, cp])
+    return ranges
+
+
+def _parse_font_info(font_bytes, font_hash, path):
+    from fontTools import ttLib
+
+    tt = ttLib.TTFont(BytesIO(font_bytes))
+    cmap = tt.getBestCmap() or {}
+    return {
+        "sha256": font_hash,
+        "path": path,
+        "ps_name": next((nr.toUnicode() for nr in tt["name"].names if nr.nameID == 6), None),
+        "truetype": "glyf" in tt,
+        "codepoints": _ranges(cmap),
+        "pad_gids": sorted({tt.getGlyphID(cmap[ord(ch)]) for ch in PAD_CHARS if ord(ch) in cmap}),
+    }
+
+
+def load_font_info(path, font_bytes, cache_dir):
+    """Parsed font metadata, from cache_dir/<sha256>.json when an earlier process already parsed this font."""
+    font_hash = hashlib.sha256(font_bytes).hexdigest()
+    info_path = os.path.join(cache_dir, f"{font_hash}.json") if cache_dir else None
+    if info_path:
+        try:
+            with open(info_path) as f:
+                info = json.load(f)
+            info["path"] = path
+            return info
+        except (OSError, ValueError):
+            pass
+
+    info = _parse_font_info(font_bytes, font_hash, path)
+    if info_path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f"{info_path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(info, f)
+            os.replace(tmp, info_path)
+        except OSError as e:
+            print(f"Font info cache write failed: {e}")
+    return info
+
+
+def covers(info, text):
+    """Whether the font has a glyph for every non-space character of text."""
+    ranges = info["codepoints"]
+    for ch in set(text):
+        if ch.isspace():
+            continue
+        cp = ord(ch)
+        if not any(start <= cp <= end for start, end in ranges):
+            return False
+    return True
+
+
+# This leans on pyHanko internals (GlyphAccumulator._extract_subset, _glyphs, _get_cid_and_width, tt,
+# CIDFont._font_descriptor; pyHanko is pinned in requirements.txt and Testing/test_font_cache.py checks
+# the output against pyHanko's own). If they change, the first AttributeError or TypeError switches
+# this process over to pyHanko's stock GlyphAccumulatorFactory.
+_cached_subsets = {"enabled": True}
+
+
+def _disable_cached_subsets(error):
+    if _cached_subsets["enabled"]:
+        _cached_subsets["enabled"] = False
+        print(f"Font subset cache disabled, using pyHanko's own font embedding ({type(error).__name__}: {error})")
+
+
+def _embed_font_program(cidfont, data, writer):
+    # CIDFontType2.set_font_file, with the subset already compiled
+    from pyhanko.pdf_utils import generic
+    from pyhanko.pdf_utils.generic import pdf_name
+
+    font_stream = generic.StreamObject(stream_data=data)
+    font_stream.compress()
+    font_stream_ref = writer.add_object(font_stream)
+    cidfont._font_descriptor[pdf_name("/FontFile2")] = font_stream_ref
+    return font_stream_ref
+
+
+@lru_cache(maxsize=None)
+def _font_factory_class():
+    # defined on first use, so importing this module doesn't import pyHanko
+    from pyhanko.pdf_utils.font import opentype
+    from pyhanko.pdf_utils.font.api import FontEngineFactory
+
+    class CachedGlyphAccumulator(opentype.GlyphAccumulator):
+        def __init__(self, *args, info, subset_cache, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._info = info
+            self._subset_cache = subset_cache
+
+        def _extract_subset(self, options=None):
+            # CFF fonts (.otf) are embedded differently: leave them to pyHanko
+            if options is not None or not _cached_subsets["enabled"] or not isinstance(self.cidfont_obj, opentype.CIDFontType2):
+                return super()._extract_subset(options)
+            try:
+                # everything used below, before anything is changed
+                self._glyphs, self._get_cid_and_width, self.tt, self.cidfont_obj._font_descriptor
+            except AttributeError as e:
+                _disable_cached_subsets(e)
+                return super()._extract_subset(options)
+
+            for gid in self._info["pad_gids"]:
+                self._get_cid_and_width(gid)
+            gids = tuple(sorted(self._glyphs))
+            data = self._subset_cache.get(self._info["sha256"], gids)
+            if data is None:
+                super()._extract_subset()
+                buf = BytesIO()
+                self.tt.save(buf)
+                data = buf.getvalue()
+                self._subset_cache.put(self._info["sha256"], gids, data)
+            self.cidfont_obj.set_font_file = partial(_embed_font_program, self.cidfont_obj, data)
+
+    class CachedFontFactory(FontEngineFactory):
+        """A GlyphAccumulatorFactory that keeps the font in memory and reuses subsets (see above)."""
+
+        def __init__(self, info, font_bytes, subset_cache, font_size=10):
+            self.info = info
+            self.font_bytes = font_bytes
+            self.subset_cache = subset_cache
+            self.font_size = font_size
+
+        def create_font_engine(self, writer, obj_stream=None):
+            if _cached_subsets["enabled"]:
+                try:
+                    if obj_stream is None and writer.stream_xrefs:
+                        obj_stream = writer.prepare_object_stream()
+                    return CachedGlyphAccumulator(
+                        writer=writer,
+                        font_handle=BytesIO(self.font_bytes),
+                        font_size=self.font_size,
+                        obj_stream=obj_stream,
+                        info=self.info,
+                        subset_cache=self.subset_cache,
+                    )
+                except (AttributeError, TypeError) as e:
+                    _disable_cached_subsets(e)
+            return opentype.GlyphAccumulatorFactory(self.info["path"], self.font_size).create_font_engine(writer, obj_stream)
+
+    return CachedFontFactory
+
+
+class FontSet:
+    """
+    The stamp font and its fallbacks, resolved and loaded on first use (thread-safe).
+    factory_for(text) returns the first of them that can render all of text.
+    """
+
+    def __init__(self, font_file, names, fallback_names, font_dirs=(), cache_dir=None):
+        self.font_file = font_file
+        self.names = names
+        self.fallback_names = fallback_names
+        self.font_dirs = font_dirs
+        self.cache_dir = cache_dir
+        self.subset_cache = SubsetCache(os.path.join(cache_dir, "subsets") if cache_dir else None)
+        self._factories = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._factories is not None:
+            return self._factories
+        with self._lock:
+            if self._factories is None:
+                self._factories = self._load()
+        return self._factories
+
+    def _load(self):
+        primary = [self.font_file] if self.font_file else self.names
+        paths = find_fonts(primary, self.font_dirs)[:1]
+        primary_found = bool(paths)
+        paths += [p for p in find_fonts(self.fallback_names, self.font_dirs) if p not in paths]
+
+        factories = []
+        for path in paths:
+            try:
+                with open(path, "rb") as f:
+                    font_bytes = f.read()
+                info = load_font_info(path, font_bytes, self.cache_dir)
+                factories.append(_font_factory_class()(info, font_bytes, self.subset_cache))
+            except Exception as e:
+                print(f"Error loading font {path}: {e}")
+        if not factories:
+            print(f"No stamp font found (tried {', '.join(primary + self.fallback_names)}); using pyHanko's built-in font")
+            return factories
+        if not primary_found or factories[0].info["path"] != paths[0]:
+            # the first fallback renders every stamp it covers
+            print(f"No usable stamp font (tried {', '.join(primary)}); fallback {factories[0].info['path']} is the primary font")
+        print(f"Font loaded successfully: {factories[0].info['path']}"
+              + (f" (fallbacks: {', '.join(f.info['path'] for f in factories[1:])})" if factories[1:] else ""))
+        return factories
+
+    def factory_for(self, text=""):
+        """Font engine factory for a stamp showing text; None means pyHanko's built-in font."""
+        factories = self.load()
+        for factory in factories:
+            if covers(factory.info, text):
+                return factory
+        return factories[0] if factories else None
+
+    def describe(self):
+        return [{"path": f.info["path"], "ps_name": f.info["ps_name"], "sha256": f.info["sha256"]} for f in self.load()]
@@ -0,0 +1,144 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from fastapi import HTTPException
+
+import metrics
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts).isoformat(timespec="milliseconds") if ts else None
+
+
+class JobManager:
+    """
+    In-memory registry and bounded runner for background signing jobs.
+
+    At most `concurrency` jobs run at once and at most `max_pending` wait for a slot;
+    submit() raises JobQueueFull beyond that. Finished jobs stay queryable until
+    `history` newer jobs have been created. State lives in this process only.
+    """
+
+    def __init__(self, concurrency=4, max_pending=100, history=1000):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.history = history
+        self.jobs = OrderedDict()
+        self._pending = 0
+        self._semaphore = None
+        self._tasks = set()
+
+    def submit(self, kind, run, total=None):
+        """Queues `await run(job_id=...)`; returns the job record immediately."""
+        if self._pending >= self.max_pending:
+            raise JobQueueFull(f"Job queue is full ({self._pending} jobs waiting)")
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": "queued",
+            "done": 0,
+            "total": total,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+        }
+        self.jobs[job["id"]] = job
+        self._prune()
+
+        self._pending += 1
+        task = asyncio.get_running_loop().create_task(self._run(job, run))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job, run):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        try:
+            await self._semaphore.acquire()
+        finally:
+            # also when the task is cancelled while it waits for a slot
+            self._pending -= 1
+
+        try:
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            # this task's own context: the job's stages don't land on the request that queued it
+            stages = metrics.start_record(f"job:{job['kind']}")
+            try:
+                job["result"] = await run(job_id=job["id"])
+                job["status"] = "done"
+                if job["total"] is not None:
+                    job["done"] = job["total"]
+            except HTTPException as e:
+                job["status"] = "failed"
+                job["error"] = {"status_code": e.status_code, "detail": e.detail}
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = {"status_code": 500, "detail": str(e)}
+            except asyncio.CancelledError:
+                # not left "running" in counts()
+                job["status"] = "failed"
+                job["error"] = {"status_code": 503, "detail": "Job cancelled"}
+                raise
+            finally:
+                job["finished_at"] = time.time()
+                stages.close()
+        finally:
+            self._semaphore.release()
+
+    def _prune(self):
+        # drop the oldest finished jobs once the history limit is exceeded
+        excess = len(self.jobs) - self.history
+        for job_id in list(self.jobs):
+            if excess <= 0:
+                break
+            if self.jobs[job_id]["finished_at"] is not None:
+                del self.jobs[job_id]
+                excess -= 1
+
+    def counts(self):
+        """Jobs waiting for a slot and jobs running right now."""
+        running = sum(1 for job in self.jobs.values() if job["status"] == "running")
+        return {"queued": self._pending, "running": running}
+
+    def update_progress(self, job_id, done, total):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job["done"] = done
+            job["total"] = total
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def describe(self, job):
+        started, finished = job["started_at"], job["finished_at"]
+        result = job["result"] or {}
+        return {
+            "job_id": job["id"],
+            "kind": job["kind"],
+            "status": job["status"],
+            "progress": {"done": job["done"], "total": job["total"]},
+            "timings": {
+                "created_at": _iso(job["created_at"]),
+                "started_at": _iso(started),
+                "finished_at": _iso(finished),
+                "queued_seconds": round((started or time.time()) - job["created_at"], 3),
+                "run_seconds": round((finished or time.time()) - started, 3) if started else None,
+            },
+            "result_url": result.get("download_url"),
+            "result": job["result"],
+            "error": job["error"],
+            "status_url": f"/jobs/{job['id']}",
+        }
@@ -0,0 +1,222 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Minimal Prometheus metrics (text exposition format 0.0.4) for the signing API.
+#
+# Stage timings are collected per request: stage() adds to the request's record, and
+# the record is observed when the request finishes, so every stage of a request carries
+# the same endpoint and page-count bucket labels (the page count is only known once the
+# PDF has been parsed). Background jobs get a record of their own (endpoint "job:<kind>").
+# In a forked signing worker there is no request; the timings are captured there and
+# merged into the parent's record (see signing_pool._invoke).
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PAGE_BUCKETS = ((10, "1-10"), (50, "11-50"), (200, "51-200"), (1000, "201-1000"))
+
+
+def page_bucket(page_count):
+    if page_count is None:
+        return "unknown"
+    if isinstance(page_count, str):
+        return page_count  # a label of its own, e.g. "batch"
+    for limit, label in PAGE_BUCKETS:
+        if page_count <= limit:
+            return label
+    return f"{PAGE_BUCKETS[-1][0] + 1}+"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for labelvalues, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labelvalues, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labelvalues, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labelvalues)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """A gauge whose value is read at scrape time: read() returns a number or {label values: number}."""
+
+    def __init__(self, name, documentation, read, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.read = read
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        value = self.read()
+        values = value.items() if isinstance(value, dict) else [((), value)]
+        for labelvalues, v in sorted(values):
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(v)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+STAGE_SECONDS = registry.register(Histogram(
+    "signing_stage_seconds", "Time spent in each stage of a signing request", ["endpoint", "pages", "stage"]
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["endpoint", "method", "status"]
+))
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+registry.register(Gauge(
+    "http_requests_in_flight", "Requests currently being served", lambda: dict(_in_flight), ["endpoint"]
+))
+
+
+class RequestMetrics:
+    """Stage timings of one request or job, summed per stage and observed together once its labels are final."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.page_count = None
+        self.stages = {}
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            if not self.closed:
+                self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+                return
+        STAGE_SECONDS.observe(seconds, self.endpoint, page_bucket(self.page_count), stage)
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            stages, self.stages = self.stages, {}
+        for stage, seconds in stages.items():
+            STAGE_SECONDS.observe(seconds, self.endpoint, page_bucket(self.page_count), stage)
+
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+def start_record(endpoint):
+    """Starts collecting stage timings for the current context (a request, or a background job's task)."""
+    record = RequestMetrics(endpoint)
+    _current.set(record)
+    return record
+
+
+def begin_request(endpoint):
+    record = start_record(endpoint)
+    with _in_flight_lock:
+        _in_flight[(endpoint,)] = _in_flight.get((endpoint,), 0) + 1
+    return record
+
+
+def end_request(record, method, status, seconds):
+    with _in_flight_lock:
+        _in_flight[(record.endpoint,)] -= 1
+    record.close()
+    REQUEST_SECONDS.observe(seconds, record.endpoint, method, str(status))
+
+
+def record_stage(stage, seconds):
+    record = _current.get()
+    if record is None:
+        STAGE_SECONDS.observe(seconds, "none", "unknown", stage)
+    else:
+        record.add(stage, seconds)
+
+
+@contextmanager
+def stage(name):
+    """Times the enclosed block as `name` for the current request (also when it raises)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def set_page_count(page_count):
+    record = _current.get()
+    if record is not None:
+        record.page_count = page_count
+
+
+@contextmanager
+def capture():
+    """Collects stage timings in a fresh record (signing worker side); export() them afterwards."""
+    record = RequestMetrics(None)
+    token = _current.set(record)
+    try:
+        yield record
+    finally:
+        _current.reset(token)
+
+
+def export(record):
+    return {"page_count": record.page_count, "stages": list(record.stages.items())}
+
+
+def merge(captured):
+    """Adds timings captured in a worker process to the current request."""
+    if not captured:
+        return
+    if captured["page_count"] is not None:
+        set_page_count(captured["page_count"])
+    for name, seconds in captured["stages"]:
+        record_stage(name, seconds)
@@ -0,0 +1,47 @@
+import argparse
+import glob
+import json
+import os
+
+from session_store import EventLogSessionStore, SqliteSessionStore
+
+# Imports sessions/{uuid}.json files into the SQLite or event-log session store.
+#   python migrate_sessions.py --sessions sessions --db sessions/sessions.db [--overwrite]
+#   python migrate_sessions.py --sessions sessions --to eventlog [--overwrite]
+
+
+def migrate(session_dir, store, overwrite=False):
+    imported = skipped = failed = 0
+
+    for path in sorted(glob.glob(os.path.join(session_dir, "*.json"))):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                session = json.load(f)
+            session.setdefault("uuid", os.path.splitext(os.path.basename(path))[0])
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Failed to read {path}: {e}")
+            failed += 1
+            continue
+
+        if not overwrite and store.get(session["uuid"]) is not None:
+            skipped += 1
+            continue
+
+        store.create(session)
+        imported += 1
+
+    store.close()
+    print(f"Imported {imported} sessions ({skipped} already present, {failed} unreadable)")
+    return imported, skipped, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import JSON multi-sign sessions into the SQLite or event-log session store")
+    parser.add_argument("--sessions", default="sessions", help="directory holding {uuid}.json session files")
+    parser.add_argument("--to", choices=["sqlite", "eventlog"], default="sqlite", help="target store")
+    parser.add_argument("--db", default=os.path.join("sessions", "sessions.db"), help="SQLite database to import into")
+    parser.add_argument("--eventlog", default=os.path.join("sessions", "eventlog"), help="event-log directory to import into")
+    parser.add_argument("--overwrite", action="store_true", help="replace sessions that already exist in the target store")
+    args = parser.parse_args()
+    target = SqliteSessionStore(args.db) if args.to == "sqlite" else EventLogSessionStore(args.eventlog)
+    migrate(args.sessions, target, args.overwrite)
@@ -0,0 +1,158 @@
+import cProfile
+import contextvars
+import glob
+import io
+import os
+import pstats
+import re
+import secrets
+import threading
+from datetime import datetime
+
+# On-demand cProfile capture for single requests.
+#
+# start() marks the current request as profiled. Its blocking calls (signing, anchor
+# scan) run through profiled(), in the thread pool or a forked signing worker, and each
+# call's stats are merged into one pstats file named after the request's key (request_id,
+# uuid). The event loop itself is not profiled: it interleaves every request's coroutines.
+# Work a background job does after the request returned is added to the same file.
+# Only one call is profiled at a time (cProfile can't nest, and from Python 3.12 it sees
+# every thread); others run unprofiled meanwhile.
+
+_session = contextvars.ContextVar("profile_session", default=None)
+_profiler_lock = threading.Lock()
+
+
+class _Stats:
+    # what pstats.Stats.add() accepts besides a Profile object
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class ProfileSession:
+    def __init__(self, directory, keep=100):
+        self.directory = directory
+        self.keep = keep
+        self.key = None
+        self.path = None
+        self.parts = []
+        self._lock = threading.Lock()
+
+    def add(self, stats):
+        with self._lock:
+            self.parts.append(stats)
+            saved = self.path is not None
+        if saved:
+            # a background job finished after the response: rewrite with the new part
+            self._write()
+
+    def save(self, fallback_key="request"):
+        """
+        Writes the stats collected so far and returns the file name. With nothing profiled yet
+        (e.g. a job still queued) the file is only written once the first part arrives.
+        """
+        with self._lock:
+            if self.path is None:
+                key = re.sub(r"[^A-Za-z0-9_.-]", "_", str(self.key or fallback_key))[:80]
+                name = f"{key}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(3)}.prof"
+                self.path = os.path.join(self.directory, name)
+            pending = not self.parts
+        if not pending:
+            self._write()
+            prune(self.directory, self.keep)
+        return os.path.basename(self.path)
+
+    def _write(self):
+        with self._lock:
+            stats = pstats.Stats(_Stats(self.parts[0]))
+            for part in self.parts[1:]:
+                stats.add(_Stats(part))
+            stats.dump_stats(self.path)
+
+
+def start(directory, keep=100):
+    os.makedirs(directory, exist_ok=True)
+    session = ProfileSession(directory, keep)
+    _session.set(session)
+    return session
+
+
+def active():
+    return _session.get() is not None
+
+
+def tag(key):
+    """Names the current request's profile (first caller wins)."""
+    session = _session.get()
+    if session is not None and session.key is None and key:
+        session.key = key
+
+
+def run(fn, args):
+    """Runs fn(*args) under cProfile if no other call is being profiled; returns (result, stats or None)."""
+    if not _profiler_lock.acquire(blocking=False):
+        return fn(*args), None
+    try:
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(fn, *args), _stats_of(profiler)
+        except BaseException as e:
+            e.profile_stats = _stats_of(profiler)
+            raise
+    finally:
+        _profiler_lock.release()
+
+
+def _stats_of(profiler):
+    profiler.create_stats()
+    return profiler.stats
+
+
+def profiled(fn, *args):
+    """fn(*args), profiled into the current request's session when it has one (use in the thread pool)."""
+    session = _session.get()
+    if session is None:
+        return fn(*args)
+    try:
+        result, stats = run(fn, args)
+    except BaseException as e:
+        merge(getattr(e, "profile_stats", None))
+        raise
+    merge(stats)
+    return result
+
+
+def merge(stats):
+    """Adds stats captured elsewhere (a signing worker) to the current request's session."""
+    session = _session.get()
+    if session is not None and stats is not None:
+        session.add(stats)
+
+
+def list_profiles(directory):
+    paths = sorted(glob.glob(os.path.join(directory, "*.prof")), key=os.path.getmtime, reverse=True)
+    return [
+        {
+            "name": os.path.basename(p),
+            "size": os.path.getsize(p),
+            "modified": datetime.fromtimestamp(os.path.getmtime(p)).isoformat(timespec="seconds"),
+        }
+        for p in paths
+    ]
+
+
+def prune(directory, keep):
+    for path in sorted(glob.glob(os.path.join(directory, "*.prof")), key=os.path.getmtime)[:-keep or None]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def summary_text(path, sort="cumulative", limit=60):
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
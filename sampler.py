@@ -0,0 +1,238 @@
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from html import escape
+
+# Always-on, low-rate stack sampler.
+#
+# A daemon thread wakes `hz` times a second, walks every other thread's Python stack
+# (sys._current_frames) and counts it as a collapsed stack ("thread;outer;...;leaf"), in
+# windows of window_seconds, keeping the last `windows` of them. Threads parked in a
+# wait (idle pool threads, the event loop's select) are not counted. If a pass costs more
+# than max_overhead of the interval, the interval is stretched until it fits again.
+#
+# Forked signing workers sample themselves: their stacks are drained into each task's
+# result and added to the parent's current window under a "signing-worker" root.
+
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("pool.py", "worker"),
+    ("pool.py", "_handle_tasks"),
+    ("pool.py", "_handle_results"),
+    ("connection.py", "_recv"),
+    ("connection.py", "_poll"),
+}
+
+
+def _short_path(path):
+    marker = f"site-packages{os.sep}"
+    if marker in path:
+        return path.split(marker, 1)[1]
+    cwd = os.getcwd() + os.sep
+    return path[len(cwd):] if path.startswith(cwd) else os.path.basename(path)
+
+
+class Sampler:
+    def __init__(self, hz=10, window_seconds=60, windows=60, max_overhead=0.01, include_idle=False):
+        self.hz = hz
+        self.window_seconds = window_seconds
+        self.max_overhead = max_overhead
+        self.include_idle = include_idle
+        self.interval = 1.0 / hz if hz else None
+        self.windows = deque(maxlen=windows)  # (window start, Counter)
+        self.samples = 0
+        self.sampling_seconds = 0.0
+        self._pending = Counter()  # worker side: stacks not yet sent to the parent
+        self._labels = {}  # code object -> frame label
+        self._lock = threading.Lock()
+        self._owner_pid = os.getpid()
+        self._pid = None
+        self._stop = threading.Event()
+        self._started_at = None
+        self.current_interval = self.interval
+
+    def ensure_started(self):
+        """Starts the sampling thread in this process (again after a fork); no-op when disabled."""
+        if not self.hz or self._pid == os.getpid():
+            return
+        if os.getpid() != self._owner_pid:
+            # forked child: the parent's sampling thread may have held the lock at fork time
+            self._lock = threading.Lock()
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pending = Counter()
+            self._stop = threading.Event()
+            self._started_at = time.monotonic()
+            threading.Thread(target=self._run, name="stack-sampler", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _run(self):
+        interval = self.interval
+        own_id = threading.get_ident()
+        while not self._stop.wait(interval):
+            started = time.perf_counter()
+            self._sample(own_id)
+            cost = time.perf_counter() - started
+
+            self.samples += 1
+            self.sampling_seconds += cost
+            # keep the sampler's share of one core under max_overhead
+            if cost > self.max_overhead * interval:
+                interval = min(interval * 2, 60.0)
+            elif interval > self.interval and cost < self.max_overhead * interval / 4:
+                interval = max(interval / 2, self.interval)
+            self.current_interval = interval
+
+    def _sample(self, own_id):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            code = frame.f_code
+            if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(self._label(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(thread_id, "thread"))
+            stacks.append(";".join(reversed(labels)))
+
+        with self._lock:
+            if os.getpid() != self._owner_pid:
+                self._pending.update(stacks)
+                return
+            self._current_window().update(stacks)
+
+    def _current_window(self):
+        # caller holds the lock
+        start = int(time.time() // self.window_seconds * self.window_seconds)
+        if not self.windows or self.windows[-1][0] != start:
+            self.windows.append((start, Counter()))
+        return self.windows[-1][1]
+
+    def drain(self):
+        """Worker side: stacks sampled since the last drain, as a plain dict (None in the parent or when idle)."""
+        if os.getpid() == self._owner_pid:
+            return None
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        return dict(pending) or None
+
+    def merge(self, stacks, root="signing-worker"):
+        """Parent side: adds stacks drained from a worker to the current window."""
+        if not stacks:
+            return
+        with self._lock:
+            window = self._current_window()
+            for stack, count in stacks.items():
+                window[f"{root};{stack}"] += count
+
+    def collapsed(self, seconds=300):
+        """Stack counts over the last `seconds` (whole windows), in collapsed-stack order."""
+        cutoff = time.time() - seconds
+        total = Counter()
+        with self._lock:
+            for start, window in self.windows:
+                if start + self.window_seconds > cutoff:
+                    total.update(window)
+        return total
+
+    def stats(self):
+        running = time.monotonic() - self._started_at if self._started_at else 0
+        return {
+            "hz": self.hz,
+            "current_interval": self.current_interval,
+            "samples": self.samples,
+            "sampling_seconds": round(self.sampling_seconds, 3),
+            "overhead": round(self.sampling_seconds / running, 5) if running else 0,
+            "window_seconds": self.window_seconds,
+            "windows": len(self.windows),
+        }
+
+
+def render_collapsed(stacks):
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+def render_svg(stacks, width=1200, row_height=16, min_width=0.5):
+    """A plain flame graph (root at the bottom) of collapsed stacks; hover a box for its name and count."""
+    tree = {"count": 0, "children": {}}
+    for stack, count in stacks.items():
+        node = tree
+        node["count"] += count
+        for frame in stack.split(";"):
+            node = node["children"].setdefault(frame, {"count": 0, "children": {}})
+            node["count"] += count
+
+    total = tree["count"] or 1
+    boxes, depth_max = [], 0
+
+    def walk(node, x, depth):
+        nonlocal depth_max
+        for name, child in sorted(node["children"].items()):
+            w = child["count"] / total * width
+            if w >= min_width:
+                depth_max = max(depth_max, depth)
+                boxes.append((x, depth, w, name, child["count"]))
+                walk(child, x, depth + 1)
+            x += w
+
+    walk(tree, 0.0, 0)
+    height = (depth_max + 1) * row_height + 20
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">',
+        f'<text x="4" y="12">{total} samples</text>',
+    ]
+    for x, depth, w, name, count in boxes:
+        y = height - (depth + 1) * row_height
+        hue = 10 + zlib.crc32(name.encode()) % 40
+        label = escape(name[: int(w / 7)]) if w > 21 else ""
+        parts.append(
+            f'<g><title>{escape(name)} ({count} samples, {count / total:.1%})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" fill="hsl({hue},80%,60%)"/>'
+            f'<text x="{x + 3:.1f}" y="{y + row_height - 4}">{label}</text></g>'
+        )
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+_installed = None
+
+
+def install(sampler):
+    """Makes `sampler` the process-wide one (also used by forked signing workers) and starts it."""
+    global _installed
+    _installed = sampler
+    sampler.ensure_started()
+    return sampler
+
+
+def drain_worker():
+    # signing worker side (signing_pool._invoke): starts sampling in the worker, returns its pending stacks
+    if _installed is None:
+        return None
+    _installed.ensure_started()
+    return _installed.drain()
+
+
+def merge_worker(stacks):
+    if _installed is not None:
+        _installed.merge(stacks)
@@ -0,0 +1,664 @@
+import copy
+import glob
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Multi-sign session persistence. A session is the same dict that used to live in
+# sessions/{uuid}.json; stores differ only in where it is kept and how turns are guarded.
+#
+# A signing turn is claimed before the (slow) signing work starts and committed with a
+# compare-and-swap on current_index afterwards, so two requests for the same turn can't
+# both sign: the second one fails to claim, and a stale claim can't commit.
+
+
+class SessionStore:
+    def create(self, session):
+        """Stores a new session, replacing any existing one with the same uuid."""
+        raise NotImplementedError
+
+    def get(self, uuid):
+        """Returns the session dict, or None."""
+        raise NotImplementedError
+
+    def get_for_signer(self, uuid, signer_email):
+        """Like get(); a cache may answer from memory when that can't mislead this signer."""
+        return self.get(uuid)
+
+    def set_file_path(self, uuid, file_path):
+        raise NotImplementedError
+
+    def claim_turn(self, uuid, expected_index, ttl):
+        """Reserves turn expected_index for ttl seconds; returns a claim token, or None if taken or moved on."""
+        raise NotImplementedError
+
+    def release_turn(self, uuid, token):
+        raise NotImplementedError
+
+    def advance_turn(self, uuid, expected_index, token, session):
+        """Saves session (with current_index already advanced) iff the turn is still expected_index and claimed by token."""
+        raise NotImplementedError
+
+    def find(self, workflow_id=None, signer_email=None):
+        """Returns the uuids of sessions matching workflow_id and/or a signer's email."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def _matches(session, workflow_id, signer_email):
+    if workflow_id is not None and session.get("workflow_id") != workflow_id:
+        return False
+    if signer_email is not None and signer_email not in (s["signer_email"] for s in session["signers"]):
+        return False
+    return True
+
+
+class JsonSessionStore(SessionStore):
+    """
+    One pretty-printed sessions/{uuid}.json per session, as before. Claims are held in
+    memory, so turn guarding only covers a single process; use SqliteSessionStore to
+    run several workers against one store.
+    """
+
+    def __init__(self, session_dir):
+        self.session_dir = session_dir
+        self._lock = threading.Lock()
+        self._claims = {}
+        os.makedirs(session_dir, exist_ok=True)
+
+    def _path(self, uuid):
+        return os.path.normpath(os.path.join(self.session_dir, f"{uuid}.json"))
+
+    def _write(self, session):
+        # write-then-rename, so a reader never sees a half-written file
+        path = self._path(session["uuid"])
+        tmp_path = f"{path}.{secrets.token_hex(4)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(session, f, indent=4)
+        os.replace(tmp_path, path)
+
+    def create(self, session):
+        with self._lock:
+            self._claims.pop(session["uuid"], None)
+            self._write(session)
+
+    def get(self, uuid):
+        path = self._path(uuid)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def set_file_path(self, uuid, file_path):
+        with self._lock:
+            session = self.get(uuid)
+            if session is not None:
+                session["file_path"] = file_path
+                self._write(session)
+
+    def claim_turn(self, uuid, expected_index, ttl):
+        with self._lock:
+            session = self.get(uuid)
+            if session is None or session["completed"] or session["current_index"] != expected_index:
+                return None
+            claim = self._claims.get(uuid)
+            if claim and claim[1] > time.time():
+                return None
+            token = secrets.token_hex(8)
+            self._claims[uuid] = (token, time.time() + ttl)
+            return token
+
+    def release_turn(self, uuid, token):
+        with self._lock:
+            if self._claims.get(uuid, (None,))[0] == token:
+                del self._claims[uuid]
+
+    def advance_turn(self, uuid, expected_index, token, session):
+        with self._lock:
+            current = self.get(uuid)
+            if current is None or current["current_index"] != expected_index:
+                return False
+            if self._claims.get(uuid, (None,))[0] != token:
+                return False
+            self._write(session)
+            del self._claims[uuid]
+            return True
+
+    def find(self, workflow_id=None, signer_email=None):
+        uuids = []
+        for name in sorted(os.listdir(self.session_dir)):
+            if not name.endswith(".json"):
+                continue
+            session = self.get(name[:-len(".json")])
+            if session is not None and _matches(session, workflow_id, signer_email):
+                uuids.append(session["uuid"])
+        return uuids
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    Sessions in one SQLite database in WAL mode, safe to share between worker processes.
+    current_index, completed, file_path and the turn claim are columns, so claiming and
+    advancing are single conditional UPDATEs; the rest of the session is a JSON document.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            uuid TEXT PRIMARY KEY,
+            workflow_id TEXT,
+            current_index INTEGER NOT NULL,
+            completed INTEGER NOT NULL,
+            file_path TEXT,
+            claim_token TEXT,
+            claim_expires REAL,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_workflow_id ON sessions(workflow_id);
+        CREATE TABLE IF NOT EXISTS session_signers (
+            uuid TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            signer_email TEXT NOT NULL,
+            PRIMARY KEY (uuid, position)
+        );
+        CREATE INDEX IF NOT EXISTS idx_session_signers_email ON session_signers(signer_email);
+    """
+
+    def __init__(self, db_path, busy_timeout=5.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self):
+        # one connection per thread (and per process: a forked child opens its own)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def _row_to_session(row):
+        session = json.loads(row[0])
+        session["current_index"], session["completed"], session["file_path"] = row[1], bool(row[2]), row[3]
+        return session
+
+    def create(self, session):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (uuid, workflow_id, current_index, completed, file_path, "
+                "claim_token, claim_expires, data, updated_at) VALUES (?, ?, ?, ?, ?, NULL, NULL, ?, ?)",
+                (session["uuid"], session.get("workflow_id"), session["current_index"], int(session["completed"]),
+                 session["file_path"], json.dumps(session), time.time())
+            )
+            conn.execute("DELETE FROM session_signers WHERE uuid = ?", (session["uuid"],))
+            conn.executemany(
+                "INSERT INTO session_signers (uuid, position, signer_email) VALUES (?, ?, ?)",
+                [(session["uuid"], i, s["signer_email"]) for i, s in enumerate(session["signers"])]
+            )
+
+    def get(self, uuid):
+        row = self._connect().execute(
+            "SELECT data, current_index, completed, file_path FROM sessions WHERE uuid = ?", (uuid,)
+        ).fetchone()
+        return self._row_to_session(row) if row else None
+
+    def set_file_path(self, uuid, file_path):
+        self._connect().execute(
+            "UPDATE sessions SET file_path = ?, updated_at = ? WHERE uuid = ?", (file_path, time.time(), uuid)
+        )
+
+    def claim_turn(self, uuid, expected_index, ttl):
+        token = secrets.token_hex(8)
+        now = time.time()
+        cursor = self._connect().execute(
+            "UPDATE sessions SET claim_token = ?, claim_expires = ? "
+            "WHERE uuid = ? AND current_index = ? AND completed = 0 AND (claim_token IS NULL OR claim_expires < ?)",
+            (token, now + ttl, uuid, expected_index, now)
+        )
+        return token if cursor.rowcount == 1 else None
+
+    def release_turn(self, uuid, token):
+        self._connect().execute(
+            "UPDATE sessions SET claim_token = NULL, claim_expires = NULL WHERE uuid = ? AND claim_token = ?",
+            (uuid, token)
+        )
+
+    def advance_turn(self, uuid, expected_index, token, session):
+        cursor = self._connect().execute(
+            "UPDATE sessions SET current_index = ?, completed = ?, file_path = ?, data = ?, updated_at = ?, "
+            "claim_token = NULL, claim_expires = NULL "
+            "WHERE uuid = ? AND current_index = ? AND claim_token = ?",
+            (session["current_index"], int(session["completed"]), session["file_path"], json.dumps(session),
+             time.time(), uuid, expected_index, token)
+        )
+        return cursor.rowcount == 1
+
+    def find(self, workflow_id=None, signer_email=None):
+        query, params = "SELECT DISTINCT s.uuid FROM sessions s", []
+        if signer_email is not None:
+            query += " JOIN session_signers e ON e.uuid = s.uuid AND e.signer_email = ?"
+            params.append(signer_email)
+        if workflow_id is not None:
+            query += " WHERE s.workflow_id = ?"
+            params.append(workflow_id)
+        return [row[0] for row in self._connect().execute(query + " ORDER BY s.uuid", params)]
+
+
+class EventLogSessionStore(SessionStore):
+    """
+    Sessions as an append-only log of compact events (created, signer_signed,
+    file_path_changed, completed) plus periodic snapshots, with the current state held in
+    memory. Only "created" carries the full session; a signing turn appends a few short
+    lines instead of rewriting the session with all its locations.
+
+    Appends are group-committed: a writer thread collects whatever arrived within
+    commit_interval and writes it with one fsync, so a crash can lose at most that window.
+    Every snapshot_every events the state is snapshotted and older log segments are
+    dropped, which keeps replay at startup short. Claims are held in memory, so like
+    JsonSessionStore this serves a single process.
+
+    Sessions completed more than archive_after seconds ago (0: never) leave memory and the
+    snapshot when the next snapshot is taken: each is written to archive/{uuid}.json and
+    read from there when asked for, so memory and snapshot size follow the open sessions.
+    """
+
+    SNAPSHOT_NAME = "snapshot.json"
+    ARCHIVE_DIR = "archive"
+
+    def __init__(self, log_dir, snapshot_every=1000, commit_interval=0.005, archive_after=0):
+        self.log_dir = log_dir
+        self.snapshot_every = snapshot_every
+        self.commit_interval = commit_interval
+        self.archive_after = archive_after
+        self.archive_dir = os.path.join(log_dir, self.ARCHIVE_DIR)
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._sessions = {}
+        self._completed_at = {}
+        self._claims = {}
+        self._seq = 0
+        self._durable_seq = 0
+        self._pending = []
+        self._since_snapshot = 0
+        self._closing = False
+
+        replayed = self._replay()
+        self._durable_seq = self._seq
+        if replayed or self._archive_expired():
+            self._write_snapshot(self._snapshot_data(), self._seq)
+        self._log = self._open_segment(self._seq + 1)
+
+        self._writer_thread = threading.Thread(target=self._writer, daemon=True)
+        self._writer_thread.start()
+
+    # --- log files ---
+
+    def _segments(self):
+        return sorted(glob.glob(os.path.join(self.log_dir, "events-*.log")))
+
+    def _open_segment(self, first_seq):
+        return open(os.path.join(self.log_dir, f"events-{first_seq:012d}.log"), "a", encoding="utf-8")
+
+    def _replay(self):
+        snapshot_path = os.path.join(self.log_dir, self.SNAPSHOT_NAME)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self._sessions, self._seq = snapshot["sessions"], snapshot["seq"]
+            # snapshots from before archiving have no completion times: count from now
+            self._completed_at = snapshot.get("completed_at") or {
+                u: time.time() for u, session in self._sessions.items() if session["completed"]
+            }
+
+        replayed = 0
+        for segment in self._segments():
+            with open(segment, "r+b") as f:
+                offset = 0
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # torn last line from a crash mid-write: cut it so later appends stay readable
+                        f.truncate(offset)
+                        break
+                    offset += len(line)
+                    if event["seq"] <= self._seq:
+                        continue
+                    self._apply(event)
+                    self._seq = event["seq"]
+                    replayed += 1
+        return replayed
+
+    def _snapshot_data(self):
+        # caller holds self._lock, or is the constructor
+        return json.dumps({"seq": self._seq, "sessions": self._sessions, "completed_at": self._completed_at})
+
+    def _archive_path(self, uuid):
+        return os.path.join(self.archive_dir, f"{os.path.basename(uuid)}.json")
+
+    def _archive_expired(self):
+        """
+        Moves sessions completed more than archive_after seconds ago to archive/; returns how many.
+        Each file is on disk before its session leaves memory, and the caller's next snapshot is
+        what drops it from the store's state.
+        """
+        if not self.archive_after:
+            return 0
+        cutoff = time.time() - self.archive_after
+        with self._lock:
+            expired = {u: json.dumps(self._sessions[u]) for u, ts in self._completed_at.items()
+                       if ts < cutoff and u in self._sessions}
+        for uuid, data in expired.items():
+            path = self._archive_path(uuid)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+
+        archived = 0
+        with self._lock:
+            for uuid, data in expired.items():
+                # changed or re-created since it was written out: keep it, try again next time
+                if uuid in self._sessions and json.dumps(self._sessions[uuid]) == data:
+                    del self._sessions[uuid]
+                    del self._completed_at[uuid]
+                    archived += 1
+        return archived
+
+    def _load_archived(self, uuid):
+        try:
+            with open(self._archive_path(uuid), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_snapshot(self, data, seq):
+        path = os.path.join(self.log_dir, self.SNAPSHOT_NAME)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        # every event up to seq is in the snapshot; older segments are no longer needed
+        for segment in self._segments():
+            if int(os.path.basename(segment)[len("events-"):-len(".log")]) <= seq:
+                os.remove(segment)
+
+    def _writer(self):
+        while True:
+            with self._wakeup:
+                while not self._pending and not self._closing:
+                    self._wakeup.wait()
+                closing = self._closing
+            if not closing:
+                time.sleep(self.commit_interval)  # let concurrent appends join this commit
+
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if batch:
+                self._log.write("".join(line for _, line in batch))
+                self._log.flush()
+                os.fsync(self._log.fileno())
+                self._since_snapshot += len(batch)
+
+            snapshot = None
+            with self._wakeup:
+                if batch:
+                    self._durable_seq = batch[-1][0]
+                    self._wakeup.notify_all()
+                snapshot_due = self._since_snapshot >= self.snapshot_every
+            if snapshot_due:
+                self._archive_expired()
+                with self._wakeup:
+                    # only consistent when nothing newer is waiting to be written
+                    if not self._pending:
+                        snapshot = (self._snapshot_data(), self._seq)
+            if snapshot:
+                self._log.close()
+                self._log = self._open_segment(snapshot[1] + 1)
+                self._write_snapshot(*snapshot)
+                self._since_snapshot = 0
+
+            if closing and not batch:
+                self._log.close()
+                return
+
+    # --- events ---
+
+    def _apply(self, event):
+        kind = event["type"]
+        if kind == "created":
+            self._sessions[event["uuid"]] = event["session"]
+            self._completed_at.pop(event["uuid"], None)
+            return
+        session = self._sessions.get(event["uuid"])
+        if session is None:
+            return  # archived
+        if kind == "signer_signed":
+            signer = session["signers"][event["index"]]
+            signer["status"], signer["signed_at"] = "signed", event["signed_at"]
+            session["current_index"] = event["index"] + 1
+        elif kind == "file_path_changed":
+            session["file_path"] = event["file_path"]
+        elif kind == "completed":
+            session["completed"] = True
+            self._completed_at[event["uuid"]] = event["ts"]
+
+    def _append(self, events):
+        # caller holds self._lock; state changes immediately, durability follows with the next commit
+        for event in events:
+            self._seq += 1
+            event["seq"] = self._seq
+            event["ts"] = time.time()
+            # serialized now: a "created" event's session is the live dict later events change
+            self._pending.append((self._seq, json.dumps(event, separators=(",", ":")) + "\n"))
+            self._apply(event)
+        self._wakeup.notify()
+
+    def flush(self):
+        """Blocks until everything appended so far is on disk."""
+        with self._wakeup:
+            target = self._seq
+            while self._durable_seq < target:
+                self._wakeup.wait()
+
+    def close(self):
+        with self._wakeup:
+            self._closing = True
+            self._wakeup.notify()
+        self._writer_thread.join()
+
+    # --- SessionStore ---
+
+    def create(self, session):
+        with self._lock:
+            self._claims.pop(session["uuid"], None)
+            self._append([{"type": "created", "uuid": session["uuid"], "session": copy.deepcopy(session)}])
+
+    def get(self, uuid):
+        with self._lock:
+            session = self._sessions.get(uuid)
+            if session is not None:
+                return copy.deepcopy(session)
+        return self._load_archived(uuid)
+
+    def set_file_path(self, uuid, file_path):
+        with self._lock:
+            if uuid in self._sessions:
+                self._append([{"type": "file_path_changed", "uuid": uuid, "file_path": file_path}])
+
+    def claim_turn(self, uuid, expected_index, ttl):
+        with self._lock:
+            session = self._sessions.get(uuid)
+            if session is None or session["completed"] or session["current_index"] != expected_index:
+                return None
+            claim = self._claims.get(uuid)
+            if claim and claim[1] > time.time():
+                return None
+            token = secrets.token_hex(8)
+            self._claims[uuid] = (token, time.time() + ttl)
+            return token
+
+    def release_turn(self, uuid, token):
+        with self._lock:
+            if self._claims.get(uuid, (None,))[0] == token:
+                del self._claims[uuid]
+
+    def advance_turn(self, uuid, expected_index, token, session):
+        with self._lock:
+            current = self._sessions.get(uuid)
+            if current is None or current["current_index"] != expected_index:
+                return False
+            if self._claims.get(uuid, (None,))[0] != token:
+                return False
+
+            events = [{
+                "type": "signer_signed", "uuid": uuid, "index": expected_index,
+                "signed_at": session["signers"][expected_index]["signed_at"]
+            }]
+            if session["file_path"] != current["file_path"]:
+                events.append({"type": "file_path_changed", "uuid": uuid, "file_path": session["file_path"]})
+            if session["completed"]:
+                events.append({"type": "completed", "uuid": uuid})
+            self._append(events)
+            del self._claims[uuid]
+            return True
+
+    def find(self, workflow_id=None, signer_email=None):
+        with self._lock:
+            uuids = {u for u, s in self._sessions.items() if _matches(s, workflow_id, signer_email)}
+            live = set(self._sessions)
+        # archived sessions are read from disk, like JsonSessionStore.find
+        for name in os.listdir(self.archive_dir):
+            uuid = name[:-len(".json")]
+            if name.endswith(".json") and uuid not in live:
+                session = self._load_archived(uuid)
+                if session is not None and _matches(session, workflow_id, signer_email):
+                    uuids.add(uuid)
+        return sorted(uuids)
+
+
+class CachedSessionStore(SessionStore):
+    """
+    Size-bounded LRU of sessions in front of another store, written through on every change.
+
+    With authoritative=True (all writes go through this process: json, eventlog) cached
+    copies are never stale, so "completed" and "not your turn" are answered from memory.
+    With a store shared by several workers (sqlite) another process may move the turn on;
+    get_for_signer then re-reads only when the requester's turn could have come since the
+    copy was cached. Claims and the compare-and-swap always go to the underlying store.
+    """
+
+    def __init__(self, store, max_entries=1024, authoritative=True):
+        self.store = store
+        self.max_entries = max_entries
+        self.authoritative = authoritative
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, session):
+        with self._lock:
+            self._entries[session["uuid"]] = copy.deepcopy(session)
+            self._entries.move_to_end(session["uuid"])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _forget(self, uuid):
+        with self._lock:
+            self._entries.pop(uuid, None)
+
+    def create(self, session):
+        self.store.create(session)
+        self._remember(session)
+
+    def get(self, uuid):
+        with self._lock:
+            cached = self._entries.get(uuid)
+            if cached is not None:
+                self._entries.move_to_end(uuid)
+                self.hits += 1
+                return copy.deepcopy(cached)
+            self.misses += 1
+
+        session = self.store.get(uuid)
+        if session is not None:
+            self._remember(session)
+        return session
+
+    def get_for_signer(self, uuid, signer_email):
+        session = self.get(uuid)
+        if session is None or self.authoritative or session["completed"]:
+            return session
+
+        index = session["current_index"]
+        if session["signers"][index]["signer_email"] != signer_email and any(
+            s["signer_email"] == signer_email for s in session["signers"][index + 1:]
+        ):
+            # their turn may have come in another worker since this copy was cached
+            self._forget(uuid)
+            return self.get(uuid)
+        return session
+
+    def set_file_path(self, uuid, file_path):
+        self.store.set_file_path(uuid, file_path)
+        with self._lock:
+            if uuid in self._entries:
+                self._entries[uuid]["file_path"] = file_path
+
+    def claim_turn(self, uuid, expected_index, ttl):
+        token = self.store.claim_turn(uuid, expected_index, ttl)
+        if token is None:
+            self._forget(uuid)  # cached copy was behind; the next request re-reads
+        return token
+
+    def release_turn(self, uuid, token):
+        self.store.release_turn(uuid, token)
+
+    def advance_turn(self, uuid, expected_index, token, session):
+        if self.store.advance_turn(uuid, expected_index, token, session):
+            self._remember(session)
+            return True
+        self._forget(uuid)
+        return False
+
+    def find(self, workflow_id=None, signer_email=None):
+        return self.store.find(workflow_id, signer_email)
+
+    def close(self):
+        self.store.close()
+
+
+def open_session_store(backend, session_dir, db_path, snapshot_every=1000, commit_interval=0.005, cache_size=0,
+                       archive_after=0):
+    if backend == "json":
+        store = JsonSessionStore(session_dir)
+    elif backend == "sqlite":
+        store = SqliteSessionStore(db_path)
+    elif backend == "eventlog":
+        store = EventLogSessionStore(os.path.join(session_dir, "eventlog"), snapshot_every, commit_interval, archive_after)
+    else:
+        raise ValueError(f"Unknown session backend: {backend}")
+
+    if cache_size > 0:
+        store = CachedSessionStore(store, cache_size, authoritative=backend != "sqlite")
+    return store
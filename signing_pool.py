@@ -0,0 +1,228 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from multiprocessing import resource_tracker, shared_memory
+
+import anyio
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+import metrics
+import profiling
+import sampler
+
+
+# Progress reports from signing code. In process mode the queue is created before the
+# fork, so workers inherit it and the parent drains it into the registered handler.
+_progress_handler = None
+_progress_queue = None
+_owner_pid = None
+
+
+class SigningPoolFull(Exception):
+    pass
+
+
+class SigningWorkerError(Exception):
+    pass
+
+
+def set_progress_handler(handler):
+    global _progress_handler
+    _progress_handler = handler
+
+
+def report_progress(key, done, total):
+    """Reports progress for `key` (a job id) from a thread or a worker process; no-op for key None."""
+    if key is None:
+        return
+    if _progress_queue is not None and os.getpid() != _owner_pid:
+        _progress_queue.put((key, done, total))
+    elif _progress_handler is not None:
+        _progress_handler(key, done, total)
+
+
+def _drain_progress(queue):
+    while True:
+        item = queue.get()
+        if item is None:
+            break
+        if _progress_handler is not None:
+            _progress_handler(*item)
+
+
+def _invoke(fn, args, profile=False):
+    # Runs inside the worker. HTTPException can't be unpickled by the parent,
+    # so failures travel back as plain tuples and are re-raised there.
+    # Stage timings (and the cProfile stats of a profiled request) come back too
+    # and are merged into the parent's request, as do the worker's sampled stacks.
+    sampler.drain_worker()
+    stats = None
+    with metrics.capture() as record:
+        try:
+            if profile:
+                value, stats = profiling.run(fn, args)
+            else:
+                value = fn(*args)
+            outcome = "ok", value
+        except HTTPException as e:
+            outcome, stats = ("http", (e.status_code, e.detail)), getattr(e, "profile_stats", None)
+        except Exception as e:
+            outcome, stats = ("error", str(e) or type(e).__name__), getattr(e, "profile_stats", None)
+    return outcome + ({"metrics": metrics.export(record), "profile": stats, "stacks": sampler.drain_worker()},)
+
+
+def _invoke_shared(fn, shm_name, size, args, profile=False):
+    # Worker side of run_with_pdf: fn gets a memoryview over the parent's segment, no pickled copy
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name, track=False)
+    except TypeError:
+        # Python < 3.13 registers attached segments with the resource tracker; the parent owns this one
+        shm = shared_memory.SharedMemory(name=shm_name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+    view = shm.buf[:size]
+    try:
+        return _invoke(fn, (view,) + tuple(args), profile)
+    finally:
+        view.release()
+        shm.close()
+
+
+class SigningExecutor:
+    """
+    Runs blocking signing functions off the event loop.
+
+    With workers=0 this is just run_in_threadpool. With workers>0, start() forks a
+    multiprocessing pool from the already initialised app process, so workers inherit the
+    loaded credential, font engine and pyHanko/fitz imports and start warm. Each worker is
+    replaced after max_tasks_per_worker jobs, and at most workers + queue_depth jobs may
+    be in flight; beyond that run() raises SigningPoolFull instead of queueing forever.
+    """
+
+    def __init__(self, workers=0, queue_depth=32, max_tasks_per_worker=None):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.max_tasks_per_worker = max_tasks_per_worker or None
+        self.in_flight = 0
+        self._pool = None
+
+    @property
+    def uses_processes(self):
+        return self._pool is not None
+
+    @property
+    def capacity(self):
+        # thread mode never answers 503: its limit is the thread pool shared with other blocking work
+        if self._pool is None:
+            return anyio.to_thread.current_default_thread_limiter().total_tokens
+        return self.workers + self.queue_depth
+
+    def start(self):
+        global _progress_queue, _owner_pid
+        if self.workers > 0 and self._pool is None:
+            ctx = multiprocessing.get_context("fork")
+            _owner_pid = os.getpid()
+            _progress_queue = ctx.SimpleQueue()
+            threading.Thread(target=_drain_progress, args=(_progress_queue,), daemon=True).start()
+            self._pool = ctx.Pool(processes=self.workers, maxtasksperchild=self.max_tasks_per_worker)
+            print(f"Signing process pool started: {self.workers} workers, queue depth {self.queue_depth}")
+
+    def shutdown(self):
+        global _progress_queue
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            _progress_queue.put(None)
+            _progress_queue = None
+
+    async def run(self, fn, *args):
+        if self._pool is None:
+            return await self._run_in_thread(fn, *args)
+        return await self._submit(_invoke, (fn, args, profiling.active()))
+
+    async def run_with_pdf(self, fn, pdf_bytes, *args):
+        """
+        Like run(fn, pdf_bytes, *args), but in process mode the PDF is handed over through a
+        shared memory segment instead of being pickled into the task; fn then receives a
+        memoryview. The segment is owned and unlinked by the parent.
+        """
+        if self._pool is None:
+            return await self._run_in_thread(fn, pdf_bytes, *args)
+
+        self._check_capacity()
+        size = len(pdf_bytes)
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+        def release():
+            shm.close()
+            shm.unlink()
+
+        try:
+            shm.buf[:size] = pdf_bytes
+        except BaseException:
+            release()
+            raise
+        # unlinked once the worker is done with it, not when this coroutine ends: a cancelled
+        # request (client gone, timeout) must not pull the segment from under a running worker
+        return await self._submit(_invoke_shared, (fn, shm.name, size, args, profiling.active()), on_done=release)
+
+    async def _run_in_thread(self, fn, *args):
+        # counted only, for the saturation gauge. A cancelled await returns at once while the
+        # thread runs on, so the count follows a shielded task that ends with the call itself
+        task = asyncio.ensure_future(run_in_threadpool(profiling.profiled, fn, *args))
+        self.in_flight += 1
+        task.add_done_callback(self._thread_done)
+        return await asyncio.shield(task)
+
+    def _thread_done(self, task):
+        self.in_flight -= 1
+        if not task.cancelled():
+            task.exception()  # retrieved here, as a cancelled caller never awaits it
+
+    def _check_capacity(self):
+        # in_flight is only touched from the event loop thread, so no lock is needed
+        if self.in_flight >= self.workers + self.queue_depth:
+            raise SigningPoolFull(f"Signing queue is full ({self.in_flight} jobs in flight)")
+
+    async def _submit(self, task, task_args, on_done=None):
+        """
+        Runs task in the pool. Its capacity slot is freed, and on_done called, only when the pool
+        reports the task finished: a request cancelled before that still has its job in a worker.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(outcome):
+            self.in_flight -= 1
+            if on_done is not None:
+                on_done()
+            if not future.done():
+                future.set_result(outcome)
+
+        try:
+            self._check_capacity()
+            self._pool.apply_async(
+                task, task_args,
+                callback=lambda outcome: loop.call_soon_threadsafe(resolve, outcome),
+                error_callback=lambda exc: loop.call_soon_threadsafe(resolve, ("error", str(exc), None))
+            )
+        except BaseException:
+            if on_done is not None:
+                on_done()
+            raise
+        self.in_flight += 1
+        status, value, extras = await future
+
+        if extras is not None:
+            metrics.merge(extras["metrics"])
+            sampler.merge_worker(extras["stacks"])
+            if task_args[-1]:  # profiled request
+                profiling.merge(extras["profile"])
+        if status == "http":
+            raise HTTPException(status_code=value[0], detail=value[1])
+        if status == "error":
+            raise SigningWorkerError(value)
+        return value
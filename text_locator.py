@@ -1,53 +1,172 @@
-import fitz
+import hashlib
+import multiprocessing
 import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 
 pdf_path = "Sign_me.pdf"
 
-def find_keyword_position(pdf_path, keyword):
-    print(f"Attempting to open PDF: {pdf_path}")
+# Anchor results per document hash: {sha256: {keyword: position or None}}
+CACHE_SIZE = 256
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
 
-    if not os.path.exists(pdf_path):
-        print(f"Error: PDF file not found at {pdf_path}")
-        return None
 
-    try:
-        doc = fitz.open(pdf_path)
-        print(f"PDF opened successfully. Number of pages: {len(doc)}")
+def _normalize(keyword):
+    # page.search_for is case-insensitive and ignores how words are spaced; match the same way
+    return " ".join(keyword.split()).lower()
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over a fixed keyword set: every (overlapping) occurrence in one pass over the text."""
+
+    def __init__(self, keywords):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        self.lengths = {}
+
+        for keyword in keywords:
+            pattern = _normalize(keyword)
+            self.lengths[keyword] = len(pattern)
+            node = 0
+            for ch in pattern:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[node][ch] = nxt
+                node = nxt
+            self.out[node].append(keyword)
 
-        for page_num in range(len(doc)):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def iter_matches(self, text):
+        """Yields (start_offset, keyword) for every match in text (already normalized)."""
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            for keyword in self.out[node]:
+                yield i - self.lengths[keyword] + 1, keyword
+
+
+def _scan_pages(path, keywords, start, stop):
+    # One text extraction per page; stops as soon as every keyword has a position
+    import fitz  # imported on first use: keeps it out of the server's import time
+
+    matcher = KeywordMatcher(keywords)
+    found = {}
+    with fitz.open(path) as doc:
+        for page_num in range(start, stop):
+            if len(found) == len(keywords):
+                break
             page = doc[page_num]
-            print(f"\n--- Text extracted from Page {page_num + 1} ---")
-            extracted_text = page.get_text()
-            print(extracted_text) # This will print all extracted text from the current page
-            print(f"----------------------------------------\n")
-
-            text_instances = page.search_for(keyword)
-
-            if text_instances:
-                print(f"Found '{keyword}' on page {page_num + 1}!")
-                # Return first match: (x, y) of bottom-left
-                rect = text_instances[0]
-                x = rect.x0
-                y = page.rect.height - rect.y0  # Adjust y to be relative to the bottom of the page
-                print(f"Position: x={x}, y={y}")
-                doc.close()
-                return {"page": page_num, "x": x, "y": y}
-            else:
-                pass # No need for a print here if you're already printing all text
-
-        doc.close() # Ensure the document is closed if keyword not found
-        print(f"'{keyword}' not found in the entire document.")
+            words = page.get_text("words")
+            if not words:
+                continue
+
+            starts, offset = [], 0
+            for word in words:
+                starts.append(offset)
+                offset += len(word[4]) + 1
+            text = " ".join(word[4] for word in words).lower()
+
+            for char_offset, keyword in matcher.iter_matches(text):
+                if keyword in found:
+                    continue
+                # bottom-left origin, top edge of the first matched word (as with search_for)
+                x0, y0 = words[bisect_right(starts, char_offset) - 1][:2]
+                found[keyword] = {"page": page_num, "x": x0, "y": page.rect.height - y0}
+    return found
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_anchor_positions(path, keywords, doc_hash=None, workers=0, parallel_min_pages=2000):
+    """
+    Returns {keyword: {"page": index, "x", "y"} or None} with the first occurrence of every
+    keyword, y measured from the bottom of the page.
+
+    Results are cached by document hash (pass doc_hash if it is already known), so only
+    keywords not seen before for this document trigger a scan. With workers > 1 and at
+    least parallel_min_pages pages, page ranges are scanned in separate processes; starting
+    them costs about a second, so this only pays off for very large documents.
+    """
+    keywords = list(dict.fromkeys(keywords))
+    doc_hash = doc_hash or file_sha256(path)
+
+    with _cache_lock:
+        known = dict(_cache.get(doc_hash, {}))
+    missing = [k for k in keywords if k not in known]
+
+    if missing:
+        import fitz
+
+        with fitz.open(path) as doc:
+            page_count = doc.page_count
+
+        if workers > 1 and page_count >= parallel_min_pages:
+            step = -(-page_count // workers)
+            ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+            # spawn, not fork: callers run in threads of the server process
+            with ProcessPoolExecutor(len(ranges), mp_context=multiprocessing.get_context("spawn")) as pool:
+                partials = list(pool.map(_scan_pages, *zip(*[(path, missing, a, b) for a, b in ranges])))
+        else:
+            partials = [_scan_pages(path, missing, 0, page_count)]
+
+        for keyword in missing:
+            # ranges are in page order, so the first hit is the earliest page
+            known[keyword] = next((found[keyword] for found in partials if keyword in found), None)
+
+        with _cache_lock:
+            _cache.setdefault(doc_hash, {}).update(known)
+            _cache.move_to_end(doc_hash)
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    return {k: known[k] for k in keywords}
+
+
+def find_keyword_position(pdf_path, keyword):
+    if not os.path.exists(pdf_path):
+        print(f"Error: PDF file not found at {pdf_path}")
         return None
 
+    try:
+        return find_anchor_positions(pdf_path, [keyword])[keyword]
     except Exception as e:
         print(f"An error occurred while processing the PDF: {e}")
         return None
 
-# Example Usage:
-keyword_to_find = "Authorised Signature Here" # Using your current search keyword
-position = find_keyword_position(pdf_path, keyword_to_find)
 
-if position:
-    print(f"\nKeyword found at: Page {position['page'] + 1}, X: {position['x']}, Y: {position['y']}")
-else:
-    print("\nKeyword not found in the PDF.")
+if __name__ == "__main__":
+    # Example Usage:
+    keyword_to_find = "Authorised Signature Here" # Using your current search keyword
+    position = find_keyword_position(pdf_path, keyword_to_find)
+
+    if position:
+        print(f"\nKeyword found at: Page {position['page'] + 1}, X: {position['x']}, Y: {position['y']}")
+    else:
+        print("\nKeyword not found in the PDF.")
@@ -0,0 +1,54 @@
+import hashlib
+import os
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from metrics import stage
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+def _copy_upload(src, dest_path, max_bytes, chunk_size):
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+
+    with open(dest_path, "wb") as out:
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                break
+
+            # %PDF header check on the first bytes, before anything else is written
+            if len(head) < 4:
+                head += chunk[:4 - len(head)]
+                if len(head) == 4 and head != b"%PDF":
+                    raise HTTPException(status_code=400, detail="Invalid PDF file")
+
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Upload exceeds the {max_bytes} byte limit")
+
+            digest.update(chunk)
+            out.write(chunk)
+
+    if head != b"%PDF":
+        raise HTTPException(status_code=400, detail="Invalid PDF file")
+    return size, digest.hexdigest()
+
+
+async def ingest_upload(upload, dest_path, max_bytes, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Streams an UploadFile into dest_path chunk by chunk, so peak memory is one chunk
+    rather than the whole document. The SHA-256 and the %PDF header check are computed
+    as bytes arrive, and the copy stops as soon as max_bytes is exceeded. On any failure
+    the partial file is removed. Returns (size, sha256 hex digest).
+    """
+    try:
+        with stage("upload_read"):
+            return await run_in_threadpool(_copy_upload, upload.file, dest_path, max_bytes, chunk_size)
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+from datetime import datetime
+
+from pyhanko.pdf_utils import generic, layout, misc
+from pyhanko.pdf_utils.content import AnnotAppearances
+from pyhanko.pdf_utils.generic import pdf_name
+from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+from pyhanko.sign import fields
+from pyhanko.sign.signers import SignatureObject
+from pyhanko.sign.signers.cms_embedder import PdfCMSEmbedder, SigIOSetup, SigObjSetup
+from pyhanko.sign.signers.pdf_cms import PdfCMSSignedAttributes
+
+from metrics import stage
+
+# Signing in one revision: all of a signer's locations become widget annotations
+# (/Kids) of a single signature field, so the document is written once and
+# signed with one CMS no matter how many locations there are.
+
+DEFAULT_BOX_SIZE = (180, 50)
+MD_ALGORITHM = "sha256"
+
+
+def parse_page_spec(spec, page_count):
+    """Turns "all" or a 1-based range list like "1-10,15" into 0-based page indices."""
+    spec = str(spec).strip().lower()
+    if spec == "all":
+        return list(range(page_count))
+
+    pages = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            start = int(start) if start.strip() else 1
+            end = int(end) if end.strip() else page_count
+        else:
+            start = end = int(part)
+        if start < 1 or end > page_count or start > end:
+            raise ValueError(f"Page range '{part}' is outside the document (1-{page_count})")
+        pages.extend(range(start - 1, end))
+    return pages
+
+
+def expand_locations(locations, page_count):
+    """
+    Flattens a signer's locations into (page_index, x, y) placements.
+    Besides {"page": N, "x", "y"}, an entry may use {"pages": "all" | "1-10,15", "x", "y"}
+    to place the same box on every listed page.
+    """
+    placements = []
+    for loc in locations:
+        if "pages" in loc:
+            for page in parse_page_spec(loc["pages"], page_count):
+                placements.append((page, loc["x"], loc["y"]))
+        else:
+            if not 1 <= loc["page"] <= page_count:
+                raise ValueError(f"Page {loc['page']} is outside the document (1-{page_count})")
+            placements.append((loc["page"] - 1, loc["x"], loc["y"]))
+    return placements
+
+
+def append_multi_widget_field(writer, field_name, placements, box_size=DEFAULT_BOX_SIZE):
+    """Adds one signature field with a widget annotation per placement; returns the field reference."""
+    width, height = box_size
+    first_page, x, y = placements[0]
+    fields.append_signature_field(
+        writer,
+        sig_field_spec=fields.SigFieldSpec(
+            field_name, box=(x, y, x + width, y + height), on_page=first_page, combine_annotation=False
+        )
+    )
+
+    field_ref = next(
+        ref for ref in writer.root['/AcroForm']['/Fields'] if ref.get_object().get('/T') == field_name
+    )
+    sig_field = field_ref.get_object()
+    kids = sig_field['/Kids']
+    first_widget = kids[0].get_object()
+    first_widget[pdf_name('/Parent')] = field_ref
+
+    for page, x, y in placements[1:]:
+        page_ref = writer.find_page_for_modification(page)[0]
+        widget = generic.DictionaryObject({
+            pdf_name('/Type'): pdf_name('/Annot'),
+            pdf_name('/Subtype'): pdf_name('/Widget'),
+            pdf_name('/F'): first_widget['/F'],
+            pdf_name('/Rect'): generic.ArrayObject(
+                [generic.FloatObject(v) for v in (x, y, x + width, y + height)]
+            ),
+            pdf_name('/P'): page_ref,
+            pdf_name('/Parent'): field_ref,
+        })
+        widget_ref = writer.add_object(widget)
+        writer.register_annotation(page_ref, widget_ref)
+        kids.append(widget_ref)
+
+    return field_ref
+
+
+def apply_shared_appearance(writer, field_ref, stamp_style, text_params, box_size=DEFAULT_BOX_SIZE):
+    """Renders the stamp once and points every widget of the field at the same appearance XObject."""
+    width, height = box_size
+    stamp = stamp_style.create_stamp(writer, layout.BoxConstraints(width=width, height=height), text_params)
+    stamp_ref = stamp.register()
+    for kid in field_ref.get_object()['/Kids']:
+        kid.get_object()[pdf_name('/AP')] = AnnotAppearances(normal=stamp_ref).as_pdf_object()
+
+
+def append_field_with_appearance(writer, field_name, placement, stamp_style, text_params, appearance=None, box_size=DEFAULT_BOX_SIZE):
+    """
+    Adds a single-widget signature field showing the stamp, for a signer that is then signed with
+    NoOpStampStyle (which keeps this appearance). The stamp is rendered only when appearance is None;
+    the returned reference can be passed back for the next revision of the same document, whose field
+    then points at the XObject (and font subset) already in the file instead of embedding another copy.
+    """
+    width, height = box_size
+    page, x, y = placement
+    fields.append_signature_field(
+        writer, sig_field_spec=fields.SigFieldSpec(field_name, box=(x, y, x + width, y + height), on_page=page)
+    )
+    field = next(
+        ref for ref in writer.root['/AcroForm']['/Fields'] if ref.get_object().get('/T') == field_name
+    ).get_object()
+
+    if appearance is None:
+        stamp = stamp_style.create_stamp(writer, layout.BoxConstraints(width=width, height=height), text_params)
+        appearance = stamp.register()
+    else:
+        # same object number in the earlier revision; rebind it to this writer
+        appearance = generic.IndirectObject(appearance.idnum, appearance.generation, writer)
+    field[pdf_name('/AP')] = AnnotAppearances(normal=appearance).as_pdf_object()
+    return appearance
+
+
+def stamp_text_params(signer, stamp_style, timestamp, extra=None):
+    """Text parameters of a stamp: certificate subject, timestamp and any template-specific extras."""
+    return {
+        **(extra or {}),
+        "signer": signer.subject_name,
+        "ts": timestamp.strftime(stamp_style.timestamp_format),
+    }
+
+
+async def cms_bytes_to_reserve(signer, signed_attrs):
+    # Same sizing rule as PdfSigner: dry-run CMS length in hex plus 50% slack
+    with stage("cms_sign"):
+        test_cms = await signer.async_sign(
+            hashlib.sha256().digest(), MD_ALGORITHM, dry_run=True, signed_attr_settings=signed_attrs
+        )
+    test_len = len(test_cms.dump()) * 2
+    return test_len + 2 * (test_len // 4)
+
+
+async def _embed_cms(writer, output, signer, field_name, timestamp):
+    signed_attrs = PdfCMSSignedAttributes(signing_time=timestamp)
+    bytes_reserved = await cms_bytes_to_reserve(signer, signed_attrs)
+
+    with stage("output_write"):
+        cms_writer = PdfCMSEmbedder().write_cms(field_name=field_name, writer=writer, existing_fields_only=True)
+        next(cms_writer)
+        cms_writer.send(SigObjSetup(sig_placeholder=SignatureObject(timestamp=timestamp, bytes_reserved=bytes_reserved)))
+        prepared_digest, rw_output = cms_writer.send(SigIOSetup(md_algorithm=MD_ALGORITHM, in_place=False, output=output))
+
+    with stage("cms_sign"):
+        sig_cms = await signer.async_sign(prepared_digest.document_digest, MD_ALGORITHM, signed_attr_settings=signed_attrs)
+    with stage("output_write"):
+        cms_writer.send(sig_cms)
+        # pyHanko buffers in memory when the output stream isn't readable/seekable
+        return misc.finalise_output(output, rw_output)
+
+
+def sign_multi_widget(input_stream, output_stream, signer, field_name, placements, stamp_style, text_params=None, box_size=DEFAULT_BOX_SIZE):
+    """Signs every placement in one incremental revision with one CMS. Blocking; run in a worker thread."""
+    w = IncrementalPdfFileWriter(input_stream, strict=False)
+    with stage("field_append"):
+        field_ref = append_multi_widget_field(w, field_name, placements, box_size)
+
+    timestamp = datetime.now().astimezone()
+    text_params = stamp_text_params(signer, stamp_style, timestamp, text_params)
+    with stage("stamp_render"):
+        apply_shared_appearance(w, field_ref, stamp_style, text_params, box_size)
+
+    return asyncio.run(_embed_cms(w, output_stream, signer, field_name, timestamp))
+
+
+async def _sign_in_stages(pdf_signer, writer, output):
+    # PdfSigner.async_sign_pdf, step by step (our signers have no validation context to release)
+    session = pdf_signer.init_signing_session(writer)
+    validation_info = await session.perform_presign_validation(writer)
+    with stage("cms_sign"):
+        bytes_reserved = await session.estimate_signature_container_size(
+            validation_info, tight=pdf_signer.signature_meta.tight_size_estimates
+        )
+    with stage("stamp_render"):
+        tbs_document = session.prepare_tbs_document(validation_info=validation_info, bytes_reserved=bytes_reserved)
+    with stage("output_write"):
+        prepared_digest, res_output = tbs_document.digest_tbs_document(in_place=False, output=output)
+    with stage("cms_sign"):
+        post_signing_doc = await tbs_document.perform_signature(
+            document_digest=prepared_digest.document_digest,
+            pdf_cms_signed_attrs=PdfCMSSignedAttributes(
+                signing_time=session.system_time,
+                adobe_revinfo_attr=None if validation_info is None else validation_info.adobe_revinfo_attr,
+                cades_signed_attrs=pdf_signer.signature_meta.cades_signed_attr_spec,
+            ),
+        )
+    with stage("output_write"):
+        await post_signing_doc.post_signature_processing(res_output)
+        return misc.finalise_output(output, res_output)
+
+
+def sign_pdf_in_stages(pdf_signer, writer, output):
+    """Same result as pdf_signer.sign_pdf(writer, output=output), with stamp, CMS and write times recorded."""
+    return asyncio.run(_sign_in_stages(pdf_signer, writer, output))